@@ -1,10 +1,11 @@
 import httpx
 import requests
-import pandas as pd
 import numpy as np
 import os
 import time
 
+from crypto.api.rate_limit import rate_limited
+
 # --- DATA FETCHING CONFIG ---
 API_URL = "https://api.binance.com/api/v3/klines"
 SYMBOL = "BTCUSDT"
@@ -14,23 +15,32 @@ FILENAME = "../../data/btc_1m_log_returns.csv"
 WINDOW_SIZE = 100000
 
 
-def get_bitcoin_1h_open_price():
+@rate_limited("binance")
+def get_bitcoin_1h_open_price(start_time=None, symbol=SYMBOL):
+    """Open of the current 1h candle, or of the candle opening at start_time (unix seconds)."""
     params = {
-        "symbol": SYMBOL,
+        "symbol": symbol,
         "interval": "1h",
         "limit": 1
     }
+    if start_time:
+        params["startTime"] = int(start_time * 1000)
     response = requests.get(API_URL, params=params)
     response.raise_for_status()
     data = response.json()
+    if not data:
+        raise ValueError(f"No 1h candle yet for start time {start_time}")
     current_candle = data[0]
+    if start_time and current_candle[0] != int(start_time * 1000):
+        raise ValueError(f"No 1h candle yet for start time {start_time}")
     open_price = current_candle[1]
 
     return float(open_price)
 
-def get_latest_bitcoin_price():
+@rate_limited("binance")
+def get_latest_bitcoin_price(symbol=SYMBOL):
     url = "https://api.binance.com/api/v3/ticker/price"
-    params = {"symbol": "BTCUSDT"}
+    params = {"symbol": symbol}
     response = requests.get(url, params=params)
     response.raise_for_status()
     data = response.json()
@@ -39,9 +49,10 @@ def get_latest_bitcoin_price():
 
 # 20 requests per second at most
 # We only do 4 requests per second right now
-async def get_latest_bitcoin_price_async(http_client: httpx.AsyncClient):
+@rate_limited("binance")
+async def get_latest_bitcoin_price_async(http_client: httpx.AsyncClient, symbol=SYMBOL):
     url = "https://api.binance.com/api/v3/ticker/price"
-    params = {"symbol": "BTCUSDT"}
+    params = {"symbol": symbol}
 
     response = await http_client.get(url, params=params)
     response.raise_for_status()
@@ -49,10 +60,11 @@ async def get_latest_bitcoin_price_async(http_client: httpx.AsyncClient):
 
     return float(data['price'])
 
-def fetch_candles(limit=LIMIT, startTime=None, endTime=None):
+@rate_limited("binance")
+def fetch_candles(limit=LIMIT, startTime=None, endTime=None, symbol=SYMBOL):
     """Fetches k-line candle data from Binance."""
     params = {
-        "symbol": SYMBOL,
+        "symbol": symbol,
         "interval": INTERVAL,
         "limit": limit
     }
@@ -68,6 +80,8 @@ def fetch_candles(limit=LIMIT, startTime=None, endTime=None):
 
 def klines_to_df(klines):
     """Converts raw kline data to a pandas DataFrame."""
+    # pandas is only needed for the candle file, not on the bot's startup path
+    import pandas as pd
     df = pd.DataFrame(klines, columns=[
         "open_time", "open", "high", "low", "close", "volume",
         "close_time", "qav", "num_trades", "taker_base_vol",
@@ -84,15 +98,15 @@ def compute_log_returns(df):
     return df.dropna()[["open_time", "close", "log_return"]]
 
 
-def backfill_initial():
+def backfill_initial(symbol=SYMBOL, filename=FILENAME):
     """Performs initial backfill of historical data."""
-    print(f"Performing initial backfill for {WINDOW_SIZE} candles...")
-    os.makedirs(os.path.dirname(FILENAME), exist_ok=True)
+    print(f"Performing initial backfill for {WINDOW_SIZE} {symbol} candles...")
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
     all_klines = []
     end_time = int(time.time() * 1000)
 
     while len(all_klines) < WINDOW_SIZE:
-        klines = fetch_candles(limit=LIMIT, endTime=end_time)
+        klines = fetch_candles(limit=LIMIT, endTime=end_time, symbol=symbol)
         if not klines:
             break
         all_klines = klines + all_klines
@@ -101,20 +115,22 @@ def backfill_initial():
 
     df = klines_to_df(all_klines[-WINDOW_SIZE:])
     returns = compute_log_returns(df)
-    returns.to_csv(FILENAME, index=False)
-    print(f"Backfilled {len(returns)} candles into {FILENAME}")
+    returns.to_csv(filename, index=False)
+    print(f"Backfilled {len(returns)} candles into {filename}")
 
 
-def update_file():
+def update_file(symbol=SYMBOL, filename=FILENAME):
     """Updates the data file with the latest candles."""
-    if not os.path.exists(FILENAME):
-        backfill_initial()
+    if not os.path.exists(filename):
+        backfill_initial(symbol, filename)
         return
 
-    existing = pd.read_csv(FILENAME, parse_dates=["open_time"])
+    import pandas as pd
+
+    existing = pd.read_csv(filename, parse_dates=["open_time"])
     last_time = int(existing["open_time"].max().timestamp() * 1000)
 
-    new_klines = fetch_candles(startTime=last_time + 1)
+    new_klines = fetch_candles(startTime=last_time + 1, symbol=symbol)
     if not new_klines or len(new_klines) <= 1:
         print("No new candles to update.")
         return
@@ -126,8 +142,8 @@ def update_file():
     new_returns = compute_log_returns(temp_df)
     updated = pd.concat([existing, new_returns]).drop_duplicates(subset="open_time", keep="last")
     updated = updated.sort_values("open_time").tail(WINDOW_SIZE)
-    updated.to_csv(FILENAME, index=False)
-    print(f"Updated {FILENAME} with {len(new_returns)} new candles. Total stored: {len(updated)}")
+    updated.to_csv(filename, index=False)
+    print(f"Updated {filename} with {len(new_returns)} new candles. Total stored: {len(updated)}")
 
 
 if __name__ == '__main__':
@@ -1,5 +1,7 @@
 import requests
 
+from crypto.api.rate_limit import rate_limited, PRIORITY_ANALYTICS
+
 def fetch_deribit_data(url):
     """Fetch data from a Deribit API endpoint."""
     response = requests.get(url)
@@ -7,6 +9,7 @@ def fetch_deribit_data(url):
     return response.json().get('result', {})
 
 # 1 request per 10 seconds is allowed
+@rate_limited("deribit.instruments", PRIORITY_ANALYTICS)
 def get_bitcoin_0dte_option_chain():
     url = "https://www.deribit.com/api/v2/public/get_instruments?currency=BTC&expired=false&kind=option"
     instruments = fetch_deribit_data(url)
@@ -19,6 +22,7 @@ def get_bitcoin_0dte_option_chain():
     return shortest_expiry_options, min_expiry
 
 # 20 requests per second allowed
+@rate_limited("deribit.ticker", PRIORITY_ANALYTICS)
 def fetch_ticker_data(name):
     ticker_url = f"https://www.deribit.com/api/v2/public/ticker?instrument_name={name}"
     return fetch_deribit_data(ticker_url)
@@ -0,0 +1,43 @@
+import asyncio
+import importlib.util
+import time
+
+import httpx
+
+from crypto.api.polymarket.mod import CLOB_API_BASE
+
+BINANCE_API_BASE = "https://api.binance.com"
+
+# Cheap endpoints, only used to open the TCP/TLS connections before the first tick
+WARM_UP_URLS = [
+    f"{BINANCE_API_BASE}/api/v3/ping",
+    f"{CLOB_API_BASE}/",
+]
+
+MAX_CONNECTIONS = 20
+KEEPALIVE_EXPIRY_SECS = 120
+TIMEOUT_SECS = 5.0
+
+
+def create_http_client():
+    """One pooled keep-alive client for the whole life of the bot."""
+    # HTTP/2 needs the optional 'h2' package (pip install httpx[http2])
+    http2 = importlib.util.find_spec("h2") is not None
+    limits = httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY_SECS,
+    )
+    return httpx.AsyncClient(http2=http2, limits=limits, timeout=TIMEOUT_SECS)
+
+
+async def warm_up(http_client: httpx.AsyncClient, urls=None):
+    """Opens a connection to every host so the first real request skips the handshakes."""
+    urls = WARM_UP_URLS if urls is None else urls
+    start = time.time()
+    results = await asyncio.gather(*(http_client.get(url) for url in urls), return_exceptions=True)
+    errors = [res for res in results if isinstance(res, Exception)]
+    for e in errors:
+        print(f"Warm-up request failed: {e}")
+    print(f"Warmed up {len(urls) - len(errors)}/{len(urls)} connections in {(time.time() - start) * 1000:.0f}ms")
+    return not errors
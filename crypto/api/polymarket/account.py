@@ -4,19 +4,34 @@ import os
 import asyncio
 import time
 import json
+from concurrent.futures import ThreadPoolExecutor
 
 from py_clob_client.client import ClobClient
-from py_clob_client.clob_types import OrderArgs, BalanceAllowanceParams, AssetType, OpenOrderParams, TradeParams
+from py_clob_client.clob_types import OrderArgs, BalanceAllowanceParams, AssetType, OpenOrderParams, TradeParams, \
+    PostOrdersArgs, OrderType, ApiCreds, RequestArgs
+from py_clob_client.constants import END_CURSOR
+from py_clob_client.endpoints import ORDERS, TRADES
+from py_clob_client.headers.headers import create_level_2_headers
+from py_clob_client.http_helpers.helpers import get, add_query_open_orders_params, add_query_trade_params
 
 from crypto.api.polymarket.get_event import get_current_event
 from crypto.api.polymarket.mod import GAMMA_API_BASE, DATA_API_BASE
+from crypto.api.rate_limit import rate_limited, get_rate_limiter, PRIORITY_ORDERS
 from crypto.utils import Asset
 
 HOST = "https://clob.polymarket.com"
 CHAIN_ID = 137
 
+# POST /orders accepts at most 15 orders per request
+MAX_BATCH_SIZE = 15
+MAX_WORKERS = 8
+
+# Derived L2 API creds, so a restart doesn't wait for create_or_derive_api_creds()
+CREDS_CACHE_FILE = os.path.expanduser(os.getenv("POLYMARKET_CREDS_CACHE", "~/.cache/polymarket/api_creds.json"))
+
 # 2 updated per second allowed
 # 12 GET per second allowed
+@rate_limited("clob.allowance")
 def update_allowances(client):
     """Update USDC allowances for the Exchange contract"""
     try:
@@ -32,6 +47,7 @@ def update_allowances(client):
         return False
 
 # 20 requests per second allowed
+@rate_limited("clob.cancel_all", PRIORITY_ORDERS)
 def cancel_all_orders(client):
     """Cancel all open orders"""
     try:
@@ -43,6 +59,7 @@ def cancel_all_orders(client):
         return None
 
 # Place & Cancel: 240 requests per second allowed
+@rate_limited("clob.orders", PRIORITY_ORDERS)
 def cancel_order(client, order_id):
     """Cancel a single order by order ID"""
     try:
@@ -61,10 +78,33 @@ def cancel_order(client, order_id):
         print(f"Error canceling order {order_id}: {e}")
         return False
 
+# Place & Cancel: 240 requests per second allowed
+@rate_limited("clob.orders", PRIORITY_ORDERS)
+def cancel_orders(client, order_ids):
+    """Cancels all order_ids in one request, returns {order_id: canceled}"""
+    order_ids = list(order_ids)
+    if not order_ids:
+        return {}
+    try:
+        resp = client.cancel_orders(order_ids)
+    except Exception as e:
+        print(f"Error canceling orders {order_ids}: {e}")
+        return {order_id: False for order_id in order_ids}
+
+    canceled = set(resp.get('canceled') or [])
+    not_canceled = resp.get('not_canceled') or {}
+    for order_id, reason in not_canceled.items():
+        print(f"Failed to cancel order {order_id}: {reason}")
+    return {order_id: order_id in canceled for order_id in order_ids}
+
+async def cancel_orders_async(clob_client, order_ids):
+    """Async Wrapper: Runs the synchronous cancel_orders in a thread."""
+    return await asyncio.to_thread(cancel_orders, clob_client, order_ids)
+
 async def get_my_open_orders_async(clob_client, condition_id=None):
     """Async Wrapper: Runs the synchronous get_my_open_orders in a thread."""
     return await asyncio.to_thread(get_my_open_orders, clob_client, condition_id)
-# 15 requests per second allowed
+# 15 requests per second allowed, per page
 def get_my_open_orders(client, condition_id=None, token_id=None):
     params = OpenOrderParams()
     if condition_id:
@@ -72,10 +112,11 @@ def get_my_open_orders(client, condition_id=None, token_id=None):
     if token_id:
         params.asset_id = token_id
 
-    orders = client.get_orders(params)
+    orders = get_all_pages(client, ORDERS, add_query_open_orders_params, params, "clob.open_orders")
     return orders
 
 # Place & Cancel: 240 requests per second allowed
+@rate_limited("clob.orders", PRIORITY_ORDERS)
 def place_order(client, token_id: str, price: float, size: float, side: str):
     try:
         order_args = OrderArgs(
@@ -96,22 +137,101 @@ def place_order(client, token_id: str, price: float, size: float, side: str):
         print(f"Error placing order: {e}")
         return None
 
-async def get_my_trade_history_async(clob_client, condition_id=None):
+def sign_order(client, order):
+    order_args = OrderArgs(
+        price=order['price'],
+        size=order['size'],
+        side=order['side'].upper(),
+        token_id=order['token_id']
+    )
+    return client.create_order(order_args)
+
+# Place & Cancel: 240 requests per second allowed
+def place_orders(client, orders):
+    """Signs and submits a whole order plan through the batch endpoint.
+
+    orders: dicts with 'token_id', 'price', 'size' and 'side'.
+    Returns one result per order, in the same order: {'order': o, 'order_id': id or None, 'error': msg or None}
+    """
+    results = [{'order': o, 'order_id': None, 'error': None} for o in orders]
+    if not orders:
+        return results
+
+    # Signing may look up tick size, neg risk and fee rate per token, so do it concurrently
+    def sign(i):
+        try:
+            return sign_order(client, orders[i])
+        except Exception as e:
+            results[i]['error'] = str(e)
+            return None
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        signed_orders = list(executor.map(sign, range(len(orders))))
+
+        signed = [(i, so) for i, so in enumerate(signed_orders) if so is not None]
+        batches = [signed[i:i + MAX_BATCH_SIZE] for i in range(0, len(signed), MAX_BATCH_SIZE)]
+
+        def post(batch):
+            get_rate_limiter("clob.orders").acquire(PRIORITY_ORDERS)
+            try:
+                resp = client.post_orders([PostOrdersArgs(order=so, orderType=OrderType.GTC) for _, so in batch])
+            except Exception as e:
+                for i, _ in batch:
+                    results[i]['error'] = str(e)
+                return
+            # One response per posted order, in request order
+            for (i, _), r in zip(batch, resp):
+                if r.get('success') and r.get('orderID'):
+                    results[i]['order_id'] = r['orderID']
+                else:
+                    results[i]['error'] = r.get('errorMsg') or 'Unknown error'
+
+        list(executor.map(post, batches))
+
+    for r in results:
+        if r['error']:
+            print(f"Error placing order {r['order']}: {r['error']}")
+    return results
+
+async def place_orders_async(clob_client, orders):
+    """Async Wrapper: Runs the synchronous place_orders in a thread."""
+    return await asyncio.to_thread(place_orders, clob_client, orders)
+
+async def get_my_trade_history_async(clob_client, condition_id=None, after=None):
     """Async Wrapper: Runs the synchronous get_my_trade_history in a thread."""
-    return await asyncio.to_thread(get_my_trade_history, clob_client, condition_id)
+    return await asyncio.to_thread(get_my_trade_history, clob_client, condition_id, after)
 
-def get_my_trade_history(client, condition_id=None):
-    """Get trade history for the user, optionally filtered by market"""
+# 12 GET per second allowed, per page
+def get_my_trade_history(client, condition_id=None, after=None):
+    """Get trade history for the user, optionally filtered by market and match time (unix seconds)"""
     params = TradeParams()
 
     if condition_id:
         params.market = condition_id
+    if after:
+        params.after = int(after)
 
-    trades = client.get_trades(params)
+    trades = get_all_pages(client, TRADES, add_query_trade_params, params, "clob.get")
     return trades
 
 
-def get_client():
+def get_all_pages(client, path, add_query_params, params, limiter_name):
+    """ClobClient.get_trades/get_orders, but every page request takes a token from limiter_name:
+    a long history is many requests, not one."""
+    client.assert_level_2_auth()
+    headers = create_level_2_headers(client.signer, client.creds, RequestArgs(method="GET", request_path=path))
+    limiter = get_rate_limiter(limiter_name)
+    results = []
+    next_cursor = "MA=="
+    while next_cursor != END_CURSOR:
+        limiter.acquire()
+        response = get(add_query_params(f"{client.host}{path}", params, next_cursor), headers=headers)
+        next_cursor = response["next_cursor"]
+        results += response["data"]
+    return results
+
+
+def get_client(use_cached_creds=True):
     load_dotenv()
     private_key = os.getenv("PRIVATE_KEY")
     polymarket_proxy_address = os.getenv("POLYMARKET_PROXY_ADDRESS")
@@ -134,10 +254,73 @@ def get_client():
 
     client = ClobClient(HOST, key=private_key, chain_id=CHAIN_ID,
                             signature_type=2, funder=polymarket_proxy_address)
-    client.set_api_creds(client.create_or_derive_api_creds())
+    creds = load_cached_api_creds(client.get_address()) if use_cached_creds else None
+    if creds is None:
+        creds = client.create_or_derive_api_creds()
+        save_cached_api_creds(client.get_address(), creds)
+    client.set_api_creds(creds)
     return client
 
 
+def refresh_api_creds(client):
+    """Derives the creds again, e.g. after the cached ones were rejected."""
+    creds = client.create_or_derive_api_creds()
+    save_cached_api_creds(client.get_address(), creds)
+    client.set_api_creds(creds)
+
+
+def _load_creds_cache(address, path):
+    try:
+        st = os.stat(path)
+        if st.st_mode & 0o077 or st.st_uid != os.getuid():
+            print(f"Ignoring {path}: it must be owned by us and not accessible by others (chmod 600)")
+            return None
+        with open(path) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get('address', '').lower() != address.lower():
+        return None
+    return cached
+
+
+def load_cached_api_creds(address, path=CREDS_CACHE_FILE):
+    """Cached creds of this signer, None if there are none or the file is readable by others."""
+    cached = _load_creds_cache(address, path)
+    try:
+        return ApiCreds(api_key=cached['api_key'], api_secret=cached['api_secret'],
+                        api_passphrase=cached['api_passphrase'])
+    except (TypeError, KeyError):
+        return None
+
+
+def cached_allowances_set(client, path=CREDS_CACHE_FILE):
+    """True if an earlier run set the allowances with the creds the client uses now."""
+    cached = _load_creds_cache(client.get_address(), path)
+    creds = client.creds
+    return (cached is not None and cached.get('allowances_set', False) and creds is not None
+            and cached.get('api_key') == creds.api_key)
+
+
+def save_cached_api_creds(address, creds, path=CREDS_CACHE_FILE, allowances_set=False):
+    try:
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        # Created with 0600 and renamed into place, the secret is never readable by others
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({
+                'address': address,
+                'api_key': creds.api_key,
+                'api_secret': creds.api_secret,
+                'api_passphrase': creds.api_passphrase,
+                'allowances_set': allowances_set,
+            }, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Could not cache API creds: {e}")
+
+
 if __name__ == '__main__':
     client = get_client()
     event = get_current_event(Asset.Bitcoin)
@@ -0,0 +1,278 @@
+import asyncio
+import hashlib
+import json
+import time
+
+import websockets
+
+from crypto.api.polymarket.get_orderbook import get_token_ids, get_order_book_with_token_ids_async
+
+WS_MARKET_URL = "wss://ws-subscriptions-clob.polymarket.com/ws/market"
+
+# The server drops market connections that stay silent for longer than this
+PING_INTERVAL_SECS = 10
+RECONNECT_DELAY_SECS = 1.0
+MAX_RECONNECT_DELAY_SECS = 30.0
+# Don't hammer /books if every update suddenly fails the hash check
+MIN_RESYNC_INTERVAL_SECS = 2.0
+
+
+class LocalOrderBook:
+    """L2 book for one token, kept in sync from 'book' snapshots and 'price_change' deltas."""
+
+    def __init__(self, asset_id):
+        self.asset_id = asset_id
+        self.market = None
+        # float(price) -> (price, size) as sent by the server
+        self.bids = {}
+        self.asks = {}
+        self.timestamp = None
+        self.hash = None
+        self.min_order_size = None
+        self.tick_size = None
+        self.neg_risk = None
+        self.last_trade_price = None
+        self.is_synced = False
+        self.updated_at = None
+        self._order_book = None
+
+    def apply_snapshot(self, book):
+        self.market = book.get('market', self.market)
+        self.bids = {float(level['price']): (level['price'], level['size']) for level in book['bids']}
+        self.asks = {float(level['price']): (level['price'], level['size']) for level in book['asks']}
+        self.timestamp = book.get('timestamp')
+        self.hash = book.get('hash')
+        # Only REST snapshots carry the market metadata
+        self.min_order_size = book.get('min_order_size', self.min_order_size)
+        self.tick_size = book.get('tick_size', self.tick_size)
+        self.neg_risk = book.get('neg_risk', self.neg_risk)
+        self.last_trade_price = book.get('last_trade_price', self.last_trade_price)
+        self.is_synced = True
+        self._touch()
+
+    def apply_change(self, price, size, side):
+        levels = self.bids if side.upper() == 'BUY' else self.asks
+        key = float(price)
+        if float(size) == 0.:
+            levels.pop(key, None)
+        else:
+            levels[key] = (price, size)
+        self._touch()
+
+    def compute_hash(self):
+        """Same payload and field order as the CLOB server (see py_clob_client.utilities)."""
+        payload = {
+            "market": self.market,
+            "asset_id": self.asset_id,
+            "timestamp": self.timestamp,
+            "hash": "",
+            # Server order: bids ascending, asks descending (best level last)
+            "bids": [{"price": p, "size": s} for _, (p, s) in sorted(self.bids.items())],
+            "asks": [{"price": p, "size": s} for _, (p, s) in sorted(self.asks.items(), reverse=True)],
+            "min_order_size": self.min_order_size,
+            "tick_size": self.tick_size,
+            "neg_risk": self.neg_risk,
+            "last_trade_price": self.last_trade_price,
+        }
+        serialized = json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha1(serialized.encode("utf-8")).hexdigest()
+
+    def to_dict(self):
+        """Same shape as the /books response the bot used to fetch, best level first."""
+        if self._order_book is None:
+            self._order_book = {
+                'market': self.market,
+                'asset_id': self.asset_id,
+                'timestamp': self.timestamp,
+                'hash': self.hash,
+                'bids': [{'price': p, 'size': s} for _, (p, s) in sorted(self.bids.items(), reverse=True)],
+                'asks': [{'price': p, 'size': s} for _, (p, s) in sorted(self.asks.items())],
+                'min_order_size': self.min_order_size,
+                'tick_size': self.tick_size,
+                'neg_risk': self.neg_risk,
+                'last_trade_price': self.last_trade_price,
+            }
+        return self._order_book
+
+    def _touch(self):
+        self.updated_at = time.time()
+        self._order_book = None
+
+
+class OrderBookStream:
+    """Keeps the YES book of an event in memory from the CLOB market channel.
+
+    The bot reads the book with get_order_book_with_token_ids(), which never touches the network.
+    A REST snapshot from /books seeds the book and is used again whenever a gap is detected
+    (reconnect, out-of-order timestamp or hash mismatch).
+    """
+
+    def __init__(self, event, http_client=None, url=WS_MARKET_URL, verify_hash=True, fetch_snapshot=None):
+        self.event = event
+        self.yes_token_id, self.no_token_id = get_token_ids(event)
+        if not self.yes_token_id or not self.no_token_id:
+            raise ValueError("Could not determine 'yes' or 'no' token ID from event data.")
+
+        self.http_client = http_client
+        self.url = url
+        self.verify_hash = verify_hash
+        self.fetch_snapshot = fetch_snapshot or self._fetch_rest_snapshot
+
+        self.book = LocalOrderBook(self.yes_token_id)
+        self.ready = asyncio.Event()
+        self.num_updates = 0
+        self.num_resyncs = 0
+        self.last_resync = 0.
+        self._task = None
+        self._resync_task = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        for task in (self._task, self._resync_task):
+            if task is not None:
+                task.cancel()
+        for task in (self._task, self._resync_task):
+            if task is not None:
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = None
+        self._resync_task = None
+
+    async def wait_ready(self, timeout=10.):
+        await asyncio.wait_for(self.ready.wait(), timeout)
+
+    def get_order_book_with_token_ids(self):
+        if not self.book.is_synced:
+            raise RuntimeError("Order book stream is not synced")
+        return self.book.to_dict(), self.yes_token_id, self.no_token_id
+
+    def age(self):
+        """Seconds since the last applied update."""
+        if self.book.updated_at is None:
+            return float('inf')
+        return time.time() - self.book.updated_at
+
+    async def _run(self):
+        delay = RECONNECT_DELAY_SECS
+        while True:
+            try:
+                async with websockets.connect(self.url, ping_interval=None) as ws:
+                    await ws.send(json.dumps({"assets_ids": [self.yes_token_id], "type": "market"}))
+                    # A fresh subscription always starts with a 'book' snapshot,
+                    # until it arrives we use the REST one
+                    await self._resync()
+                    delay = RECONNECT_DELAY_SECS
+                    heartbeat = asyncio.create_task(self._heartbeat(ws))
+                    try:
+                        async for raw in ws:
+                            self._on_raw_message(raw)
+                    finally:
+                        heartbeat.cancel()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Order book stream error: {e}")
+
+            # Everything we missed while disconnected is a gap
+            self.book.is_synced = False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY_SECS)
+
+    async def _heartbeat(self, ws):
+        while True:
+            await asyncio.sleep(PING_INTERVAL_SECS)
+            await ws.send("PING")
+
+    def _on_raw_message(self, raw):
+        if raw == "PONG":
+            return
+        msg = json.loads(raw)
+        messages = msg if isinstance(msg, list) else [msg]
+        for m in messages:
+            self._on_message(m)
+
+    def _on_message(self, msg):
+        event_type = msg.get('event_type')
+        if event_type == 'book':
+            if msg.get('asset_id') != self.yes_token_id:
+                return
+            self.book.apply_snapshot(msg)
+            self._mark_synced()
+        elif event_type == 'price_change':
+            self._on_price_change(msg)
+        elif event_type == 'tick_size_change':
+            if msg.get('asset_id') == self.yes_token_id:
+                self.book.tick_size = msg['new_tick_size']
+                self.book._touch()
+
+    def _on_price_change(self, msg):
+        if not self.book.is_synced:
+            self._request_resync("update while not synced")
+            return
+
+        timestamp = msg.get('timestamp')
+        if timestamp is not None and self.book.timestamp is not None and int(timestamp) < int(self.book.timestamp):
+            self._request_resync("out-of-order update")
+            return
+
+        # New format: one 'price_changes' list with a hash per entry
+        # Old format: 'changes' list with one hash for the whole message
+        if 'price_changes' in msg:
+            changes = [c for c in msg['price_changes'] if c.get('asset_id') == self.yes_token_id]
+            expected_hash = changes[-1].get('hash') if changes else None
+        else:
+            if msg.get('asset_id') != self.yes_token_id:
+                return
+            changes = msg.get('changes', [])
+            expected_hash = msg.get('hash')
+
+        if not changes:
+            return
+
+        for c in changes:
+            self.book.apply_change(c['price'], c['size'], c['side'])
+        self.book.timestamp = timestamp if timestamp is not None else self.book.timestamp
+        self.num_updates += 1
+
+        if self.verify_hash and expected_hash:
+            local_hash = self.book.compute_hash()
+            if local_hash != expected_hash:
+                self._request_resync("hash mismatch")
+                return
+        self.book.hash = expected_hash or self.book.hash
+
+    def _mark_synced(self):
+        self.num_updates += 1
+        if not self.ready.is_set():
+            self.ready.set()
+
+    def _request_resync(self, reason):
+        self.book.is_synced = False
+        if self._resync_task is not None and not self._resync_task.done():
+            return
+        print(f"Order book gap ({reason}), resyncing from snapshot")
+        self._resync_task = asyncio.create_task(self._resync_in_background())
+
+    async def _resync_in_background(self):
+        try:
+            await self._resync()
+        except Exception as e:
+            print(f"Order book resync failed: {e}")
+
+    async def _resync(self):
+        wait = MIN_RESYNC_INTERVAL_SECS - (time.time() - self.last_resync)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        self.last_resync = time.time()
+        book = await self.fetch_snapshot()
+        self.book.apply_snapshot(book)
+        self.num_resyncs += 1
+        self._mark_synced()
+
+    async def _fetch_rest_snapshot(self):
+        book, _, _ = await get_order_book_with_token_ids_async(self.http_client, self.event)
+        return book
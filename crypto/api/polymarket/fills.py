@@ -0,0 +1,104 @@
+import asyncio
+import threading
+
+from crypto.api.polymarket.account import get_my_trade_history
+
+# match_time has second resolution and trades can still show up late,
+# so every sync re-reads a short overlap and dedupes by trade id
+OVERLAP_SECS = 5
+
+
+def to_type(outcome):
+    return 'YES' if outcome == 'Up' else 'NO'
+
+
+def extract_my_fills(trade, address):
+    """Our side of a trade: either we were the taker or one or more of the maker orders are ours."""
+    if trade['maker_address'] == address:
+        return [{
+            'trade_id': trade['id'],
+            'order_id': trade['taker_order_id'],
+            'size': float(trade['size']),
+            'price': float(trade['price']),
+            'side': trade['side'],
+            'type': to_type(trade['outcome']),
+            'match_time': int(trade['match_time']),
+        }]
+    return [{
+        'trade_id': trade['id'],
+        'order_id': maker_order['order_id'],
+        'size': float(maker_order['matched_amount']),
+        'price': float(maker_order['price']),
+        'side': maker_order['side'],
+        'type': to_type(maker_order['outcome']),
+        'match_time': int(trade['match_time']),
+    } for maker_order in trade['maker_orders'] if maker_order['maker_address'] == address]
+
+
+class MarketFills:
+    def __init__(self):
+        self.trade_ids = set()
+        self.fills = []
+        self.fills_by_order = {}
+        self.last_match_time = None
+
+    def add(self, trade, address):
+        """Returns our new fills from trade, nothing if the trade was seen before."""
+        if trade['id'] in self.trade_ids:
+            return []
+        self.trade_ids.add(trade['id'])
+        match_time = int(trade['match_time'])
+        if self.last_match_time is None or match_time > self.last_match_time:
+            self.last_match_time = match_time
+
+        fills = extract_my_fills(trade, address)
+        for f in fills:
+            self.fills.append(f)
+            self.fills_by_order.setdefault(f['order_id'], []).append(f)
+        return fills
+
+
+class FillStore:
+    """Our fills per market, synced incrementally from the CLOB trade history.
+
+    Each sync only asks for trades matched after the last one we've seen (minus a short
+    overlap), dedupes them by trade id and returns just the new fills, so the cost of a
+    tick grows with the number of new fills instead of with the whole history.
+    """
+
+    def __init__(self, client, address, overlap_secs=OVERLAP_SECS):
+        self.client = client
+        self.address = address
+        self.overlap_secs = overlap_secs
+        self.markets = {}
+        self._lock = threading.Lock()
+
+    def sync(self, condition_id):
+        """Fetches trades newer than the last sync, returns our new fills oldest first."""
+        market = self._get_market(condition_id)
+        after = market.last_match_time - self.overlap_secs if market.last_match_time is not None else None
+        trades = get_my_trade_history(self.client, condition_id=condition_id, after=after)
+
+        new_fills = []
+        with self._lock:
+            for trade in sorted(trades, key=lambda t: int(t['match_time'])):
+                new_fills.extend(market.add(trade, self.address))
+        return new_fills
+
+    async def sync_async(self, condition_id):
+        return await asyncio.to_thread(self.sync, condition_id)
+
+    def get_fills(self, condition_id):
+        return list(self._get_market(condition_id).fills)
+
+    def get_order_fills(self, condition_id, order_id):
+        return list(self._get_market(condition_id).fills_by_order.get(order_id, []))
+
+    def get_filled_size(self, condition_id, order_id):
+        return sum(f['size'] for f in self._get_market(condition_id).fills_by_order.get(order_id, []))
+
+    def _get_market(self, condition_id):
+        with self._lock:
+            if condition_id not in self.markets:
+                self.markets[condition_id] = MarketFills()
+            return self.markets[condition_id]
@@ -1,10 +1,12 @@
 from zoneinfo import ZoneInfo
 
 from crypto.api.polymarket.mod import GAMMA_API_BASE
+from crypto.api.rate_limit import rate_limited
 from crypto.utils import Asset, month_to_str, local_hour_to_eastern_time, hour_to_string
 import requests
 from datetime import datetime
 
+@rate_limited("gamma")
 def get_up_or_down_event(asset: Asset, day: int, month: int, hour: int):
     month_str = month_to_str(month)
     hour = hour_to_string(hour)
@@ -5,9 +5,10 @@ import time
 
 from crypto.api.polymarket.get_event import get_up_or_down_event, get_current_event
 from crypto.api.polymarket.mod import CLOB_API_BASE
+from crypto.api.rate_limit import rate_limited
 from crypto.utils import Asset
 
-def get_order_book_with_token_ids(event):
+def get_token_ids(event):
     market = event["markets"][0]
     token_ids = json.loads(market["clobTokenIds"])
     outcomes = json.loads(market["outcomes"])
@@ -18,6 +19,12 @@ def get_order_book_with_token_ids(event):
     no_token_id = next(
         (tid for tid, outcome in token_to_outcome.items() if outcome.lower() == "down" or outcome.lower() == "no"), None)
 
+    return yes_token_id, no_token_id
+
+@rate_limited("clob.books")
+def get_order_book_with_token_ids(event):
+    yes_token_id, no_token_id = get_token_ids(event)
+
     url = f"{CLOB_API_BASE}/books"
     payload = {"token_id": yes_token_id},
     headers = {
@@ -34,17 +41,10 @@ def get_order_book_with_token_ids(event):
     yes_order_book['asks'].sort(key=lambda x: float(x['price']))
     return yes_order_book, yes_token_id, no_token_id
 
+@rate_limited("clob.books")
 async def get_order_book_with_token_ids_async(http_client: httpx.AsyncClient, event):
     # start = time.time_ns()
-    market = event["markets"][0]
-    token_ids = json.loads(market["clobTokenIds"])
-    outcomes = json.loads(market["outcomes"])
-    token_to_outcome = dict(zip(token_ids, outcomes))
-    yes_token_id = next(
-    (tid for tid, outcome in token_to_outcome.items() if outcome.lower() == "up" or outcome.lower() == "yes"), None)
-
-    no_token_id = next(
-        (tid for tid, outcome in token_to_outcome.items() if outcome.lower() == "down" or outcome.lower() == "no"), None)
+    yes_token_id, no_token_id = get_token_ids(event)
 
     if not yes_token_id or not no_token_id:
         raise ValueError("Could not determine 'yes' or 'no' token ID from event data.")
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+
+import httpx
+import websockets
+
+from crypto.api.binance import SYMBOL, get_latest_bitcoin_price, get_latest_bitcoin_price_async
+
+WS_BASE_URL = "wss://stream.binance.com:9443/ws"
+
+# Older prices fall back to a REST call
+MAX_PRICE_AGE_SECS = 2.0
+HISTORY_SIZE = 600
+RECONNECT_DELAY_SECS = 1.0
+MAX_RECONNECT_DELAY_SECS = 30.0
+
+
+class PriceFeed:
+    """Latest spot price of one symbol, pushed by a Binance aggTrade or bookTicker stream.
+
+    Keeps the latest price, its timestamp and a short tick history in memory.
+    When the stream is down or the price is older than max_age_secs,
+    get_price()/get_price_async() fall back to the REST ticker.
+    """
+
+    def __init__(self, symbol=SYMBOL, stream="aggTrade", max_age_secs=MAX_PRICE_AGE_SECS,
+                 history_size=HISTORY_SIZE, http_client=None):
+        if stream not in ("aggTrade", "bookTicker"):
+            raise ValueError(f"Unsupported stream: {stream}")
+        self.symbol = symbol
+        self.stream = stream
+        self.url = f"{WS_BASE_URL}/{symbol.lower()}@{stream}"
+        self.max_age_secs = max_age_secs
+        self.http_client = http_client
+
+        # (price, timestamp) is replaced as a whole so readers in other threads see a consistent pair
+        self.latest = None
+        self.history = deque(maxlen=history_size)
+        self.is_connected = False
+        self.num_fallbacks = 0
+
+        self._task = None
+        self._thread = None
+        self._loop = None
+
+    async def start(self):
+        # Feeds are shared, so every bot calls start() but only the first one connects
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def start_in_thread(self):
+        """For synchronous callers: runs the stream on its own event loop in a daemon thread."""
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_until_complete, args=(self._run(),), daemon=True)
+        self._thread.start()
+
+    def wait_ready(self, timeout=5.):
+        deadline = time.time() + timeout
+        while self.latest is None and time.time() < deadline:
+            time.sleep(0.01)
+        return self.latest is not None
+
+    def age(self):
+        if self.latest is None:
+            return float('inf')
+        return time.time() - self.latest[1]
+
+    def is_fresh(self):
+        return self.is_connected and self.age() <= self.max_age_secs
+
+    def get_price(self):
+        if self.is_fresh():
+            return self.latest[0]
+        self.num_fallbacks += 1
+        price = get_latest_bitcoin_price(self.symbol)
+        self._update(price, time.time())
+        return price
+
+    async def get_price_async(self):
+        if self.is_fresh():
+            return self.latest[0]
+        self.num_fallbacks += 1
+        if self.http_client is None:
+            async with httpx.AsyncClient() as http_client:
+                price = await get_latest_bitcoin_price_async(http_client, self.symbol)
+        else:
+            price = await get_latest_bitcoin_price_async(self.http_client, self.symbol)
+        self._update(price, time.time())
+        return price
+
+    def get_history(self):
+        """List of (timestamp, price), oldest first."""
+        return list(self.history)
+
+    def _update(self, price, timestamp):
+        self.latest = (price, timestamp)
+        self.history.append((timestamp, price))
+
+    def _on_message(self, msg):
+        # Timestamps are local receive times, so the age check doesn't depend on clock skew
+        if self.stream == "aggTrade":
+            # Last traded price, same as /ticker/price
+            self._update(float(msg['p']), time.time())
+        else:
+            mid = (float(msg['b']) + float(msg['a'])) / 2
+            self._update(mid, time.time())
+
+    async def _run(self):
+        delay = RECONNECT_DELAY_SECS
+        while True:
+            try:
+                async with websockets.connect(self.url) as ws:
+                    self.is_connected = True
+                    delay = RECONNECT_DELAY_SECS
+                    async for raw in ws:
+                        self._on_message(json.loads(raw))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Price feed {self.symbol} error: {e}")
+            finally:
+                self.is_connected = False
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY_SECS)
+
+
+_price_feeds = {}
+_price_feeds_lock = threading.Lock()
+
+
+def get_price_feed(symbol=SYMBOL, **kwargs):
+    """Process-wide feed per symbol, so every consumer shares one stream."""
+    with _price_feeds_lock:
+        if symbol not in _price_feeds:
+            _price_feeds[symbol] = PriceFeed(symbol, **kwargs)
+        return _price_feeds[symbol]
@@ -0,0 +1,172 @@
+import asyncio
+import functools
+import heapq
+import itertools
+import threading
+import time
+
+# Lower value wins: order placement beats market data beats analytics
+PRIORITY_ORDERS = 0
+PRIORITY_MARKET_DATA = 1
+PRIORITY_ANALYTICS = 2
+
+# name -> (requests per second, burst)
+RATE_LIMITS = {
+    "binance": (20, 20),
+    # 1 request per 10 seconds
+    "deribit.instruments": (0.1, 1),
+    "deribit.ticker": (20, 20),
+    "clob.get": (12, 12),
+    # POST /books has no published limit of its own, share the GET budget
+    "clob.books": (12, 12),
+    "clob.allowance": (2, 2),
+    "clob.open_orders": (15, 15),
+    "clob.cancel_all": (20, 20),
+    # Place & Cancel
+    "clob.orders": (240, 240),
+    # No published limit, stay polite
+    "gamma": (10, 10),
+}
+
+
+class TokenBucket:
+    """Token bucket shared by threads and event loops, waiters are served by priority.
+
+    A waiter only takes a token when it is at the head of the queue, so a burst of
+    analytics requests can't starve an order placement that arrives later.
+    """
+
+    def __init__(self, name, rate, capacity=None):
+        self.name = name
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+
+        self.num_acquired = 0
+        self.total_wait_secs = 0.
+
+        self._lock = threading.Lock()
+        self._waiters = []
+        self._seq = itertools.count()
+
+    def remaining(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return self.tokens
+
+    def num_waiting(self):
+        return len(self._waiters)
+
+    def try_acquire(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._waiters or self.tokens < 1:
+                return False
+            self._take(0.)
+            return True
+
+    def acquire(self, priority=PRIORITY_MARKET_DATA):
+        start = time.monotonic()
+        ticket = self._enqueue(priority)
+        try:
+            while True:
+                wait = self._poll(ticket, start)
+                if wait is None:
+                    return
+                time.sleep(wait)
+        except BaseException:
+            self._dequeue(ticket)
+            raise
+
+    async def acquire_async(self, priority=PRIORITY_MARKET_DATA):
+        start = time.monotonic()
+        ticket = self._enqueue(priority)
+        try:
+            while True:
+                wait = self._poll(ticket, start)
+                if wait is None:
+                    return
+                await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            self._dequeue(ticket)
+            raise
+
+    def _enqueue(self, priority):
+        ticket = (priority, next(self._seq))
+        with self._lock:
+            heapq.heappush(self._waiters, ticket)
+        return ticket
+
+    def _dequeue(self, ticket):
+        with self._lock:
+            if ticket in self._waiters:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+
+    def _poll(self, ticket, start):
+        """Takes a token and returns None, or returns how long to sleep before polling again."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            to_next_token = max(0., (1 - self.tokens) / self.rate)
+            if self._waiters[0] == ticket:
+                if self.tokens >= 1:
+                    heapq.heappop(self._waiters)
+                    self._take(now - start)
+                    return None
+                return to_next_token
+            # Not our turn yet, check back once the waiters ahead had a chance
+            return max(to_next_token, 1 / self.rate)
+
+    def _take(self, waited):
+        self.tokens -= 1
+        self.num_acquired += 1
+        self.total_wait_secs += waited
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name):
+    """Process-wide bucket per endpoint group, see RATE_LIMITS."""
+    with _limiters_lock:
+        if name not in _limiters:
+            rate, capacity = RATE_LIMITS[name]
+            _limiters[name] = TokenBucket(name, rate, capacity)
+        return _limiters[name]
+
+
+def get_budget():
+    """{name: {'remaining', 'waiting', 'acquired', 'avg_wait_ms'}} for every bucket in use."""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {l.name: {
+        'remaining': l.remaining(),
+        'waiting': l.num_waiting(),
+        'acquired': l.num_acquired,
+        'avg_wait_ms': 1000 * l.total_wait_secs / max(l.num_acquired, 1),
+    } for l in limiters}
+
+
+def rate_limited(name, priority=PRIORITY_MARKET_DATA):
+    """Decorator: every call of the (sync or async) function takes one token from the bucket."""
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                await get_rate_limiter(name).acquire_async(priority)
+                return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            get_rate_limiter(name).acquire(priority)
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,115 @@
+import math
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from crypto.pricing_backend import NumpyBackend, get_backend
+
+FILENAME = "../data/btc_1m_log_returns.csv"
+# GARCH(1,1) in log-return units, roughly what the fit gives on 1m BTC returns
+GARCH_PARAMS = {'omega': 2e-9, 'alpha': 0.08, 'beta': 0.9, 'last_resid': 5e-4, 'last_sigma_sq': 3e-7}
+# (target / current, horizon in minutes)
+CASES = [(1.0, 60), (1.001, 30), (0.998, 15), (1.003, 5)]
+PARITY_SIMULATIONS = 1_000_000
+BENCHMARK_SIMULATIONS = [100_000, 1_000_000]
+REPEATS = 3
+# Two independent estimates differ by more than this many standard errors ~1 in 16000 times
+PARITY_Z = 4.
+# Bound for the matrix cells, 20 checks at 5 standard errors fail falsely ~1 in 90000 runs
+MATRIX_PARITY_Z = 5.
+PARITY_HORIZONS = [1, 5, 15, 30, 60]
+
+
+def _agree(label, p_rust, p_numpy, se, z=PARITY_Z):
+    passed = abs(p_rust - p_numpy) <= z * se
+    print(f"{label}: rust {p_rust:.5f} numpy {p_numpy:.5f} ({abs(p_rust - p_numpy) / se:.1f} se) "
+          f"{'ok' if passed else 'MISMATCH'}")
+    return passed
+
+
+def _binomial_se(p_rust, p_numpy, num_simulations):
+    mean = (p_rust + p_numpy) / 2
+    # Floored at one path, so a case that's (almost) never hit doesn't fail on a single path
+    return math.sqrt(max(mean * (1 - mean), 1 / num_simulations) * 2 / num_simulations)
+
+
+def parity(rust, numpy_backend, returns_handles, residuals_handles):
+    """Both backends price the same cases, the difference has to be within sampling error."""
+    ok = True
+    for ratio, horizon_minutes in CASES:
+        prices = {'current_price': 100_000., 'target_price': 100_000. * ratio, 'horizon_minutes': horizon_minutes,
+                  'num_simulations': PARITY_SIMULATIONS}
+        p = {}
+        for name, backend in (('rust', rust), ('numpy', numpy_backend)):
+            p[name] = {
+                'plain': backend.calculate_probability_plain(returns=returns_handles[name], **prices),
+                'only': backend.calculate_probability_only(residuals=residuals_handles[name], **GARCH_PARAMS, **prices),
+                'vr': backend.calculate_probability_vr(residuals=residuals_handles[name], **GARCH_PARAMS, **prices,
+                                                       antithetic=True, control_variate=True, qmc=True,
+                                                       num_replicates=16),
+            }
+        for kind in ('plain', 'only'):
+            ok &= _agree(f"{kind:<6} {ratio:.4f}x {horizon_minutes:>3} min", p['rust'][kind], p['numpy'][kind],
+                         _binomial_se(p['rust'][kind], p['numpy'][kind], PARITY_SIMULATIONS))
+        (p_rust, se_rust), (p_numpy, se_numpy) = p['rust']['vr'], p['numpy']['vr']
+        ok &= _agree(f"{'vr':<6} {ratio:.4f}x {horizon_minutes:>3} min", p_rust, p_numpy,
+                     max(math.sqrt(se_rust ** 2 + se_numpy ** 2), 1 / PARITY_SIMULATIONS))
+
+    # Every cell of the grid is a separate check, hence the wider bound
+    matrix = {name: backend.calculate_probability_matrix(
+        residuals=residuals_handles[name], **GARCH_PARAMS, current_price=100_000.,
+        target_prices=[100_000. * ratio for ratio, _ in CASES], horizons=PARITY_HORIZONS,
+        num_simulations=PARITY_SIMULATIONS) for name, backend in (('rust', rust), ('numpy', numpy_backend))}
+    for (ratio, _), row_rust, row_numpy in zip(CASES, matrix['rust'], matrix['numpy']):
+        for horizon_minutes, p_rust, p_numpy in zip(PARITY_HORIZONS, row_rust, row_numpy):
+            ok &= _agree(f"matrix {ratio:.4f}x {horizon_minutes:>3} min", p_rust, p_numpy,
+                         _binomial_se(p_rust, p_numpy, PARITY_SIMULATIONS), MATRIX_PARITY_Z)
+    return ok
+
+
+def benchmark(backends, returns_handles, residuals_handles):
+    for num_simulations in BENCHMARK_SIMULATIONS:
+        for name, backend in backends.items():
+            for kind in ('plain', 'only'):
+                start = time.perf_counter()
+                for _ in range(REPEATS):
+                    prices = {'current_price': 100_000., 'target_price': 100_100., 'horizon_minutes': 60,
+                              'num_simulations': num_simulations}
+                    if kind == 'plain':
+                        backend.calculate_probability_plain(returns=returns_handles[name], **prices)
+                    else:
+                        backend.calculate_probability_only(residuals=residuals_handles[name], **GARCH_PARAMS, **prices)
+                ms = (time.perf_counter() - start) / REPEATS * 1000
+                print(f"{name:<6} {kind:<6} {num_simulations:>9,} paths x 60 min: {ms:8.1f} ms")
+
+            # The same paths priced for a 50 strike x 60 horizon grid
+            start = time.perf_counter()
+            for _ in range(REPEATS):
+                backend.calculate_probability_matrix(
+                    residuals=residuals_handles[name], **GARCH_PARAMS, current_price=100_000.,
+                    target_prices=list(100_000. * np.linspace(0.99, 1.01, 50)), horizons=list(range(1, 61)),
+                    num_simulations=num_simulations)
+            ms = (time.perf_counter() - start) / REPEATS * 1000
+            print(f"{name:<6} matrix {num_simulations:>9,} paths, 50 x 60 grid: {ms:8.1f} ms")
+
+
+if __name__ == "__main__":
+    returns = pd.read_csv(FILENAME)["log_return"].dropna().to_numpy()
+    residuals = np.sort(returns / returns.std())
+
+    backends = {'numpy': NumpyBackend()}
+    try:
+        backends['rust'] = get_backend('rust')
+    except ImportError:
+        print("garch_monte_carlo is not built, benchmarking the NumPy backend only")
+
+    returns_handles = {name: b.register_returns(returns) for name, b in backends.items()}
+    residuals_handles = {name: b.register_returns(residuals) for name, b in backends.items()}
+    benchmark(backends, returns_handles, residuals_handles)
+    # Without the extension there is nothing to compare against, that isn't a pass
+    if 'rust' not in backends:
+        sys.exit("Parity NOT checked: build garch_monte_carlo (maturin develop) and rerun")
+    if not parity(backends['rust'], backends['numpy'], returns_handles, residuals_handles):
+        sys.exit(1)
@@ -0,0 +1,56 @@
+import time
+
+import numpy as np
+
+from crypto.garch import FastGARCHSimulator, NUM_SIMULATIONS
+
+START_PRICE = 100_000.
+# (target / start, horizon in seconds)
+CASES = [(1.0005, 60 * 15), (1.003, 60 * 30), (0.995, 60 * 60)]
+PATH_COUNTS = [25_000, 100_000, 400_000]
+METHODS = {
+    'plain': {},
+    'antithetic': {'antithetic': True, 'control_variate': False, 'qmc': False},
+    'control variate': {'antithetic': False, 'control_variate': True, 'qmc': False},
+    'qmc': {'antithetic': False, 'control_variate': False, 'qmc': True},
+    'all': {'antithetic': True, 'control_variate': True, 'qmc': True},
+}
+REPEATS = 20
+REFERENCE_SIMULATIONS = 10_000_000
+
+
+def run(sim, method, target_price, horizon_seconds, num_simulations):
+    if method == 'plain':
+        return sim.get_probability(START_PRICE, target_price, horizon_seconds, num_simulations)
+    return sim.get_probability_vr(START_PRICE, target_price, horizon_seconds, num_simulations, **METHODS[method])[0]
+
+
+def benchmark(sim):
+    """RMSE against a long reference run per method and path count, and the paths each
+    method needs for the plain error at NUM_SIMULATIONS (error ~ 1/sqrt(paths))."""
+    for ratio, horizon_seconds in CASES:
+        target_price = START_PRICE * ratio
+        reference, reference_se = sim.get_probability_vr(START_PRICE, target_price, horizon_seconds,
+                                                         REFERENCE_SIMULATIONS)
+        plain_rmse = None
+        print(f"\nTarget {ratio:.4f}x in {horizon_seconds // 60} min: p = {reference:.5f} ± {reference_se:.5f}")
+        print(f"{'method':<16} {'paths':>9} {'rmse':>9} {'ms':>8} {'paths for plain error':>22}")
+        for method in METHODS:
+            for num_simulations in PATH_COUNTS:
+                start = time.perf_counter()
+                estimates = np.array([run(sim, method, target_price, horizon_seconds, num_simulations)
+                                      for _ in range(REPEATS)])
+                ms = (time.perf_counter() - start) / REPEATS * 1000
+                rmse = np.sqrt(np.mean((estimates - reference) ** 2))
+                if method == 'plain' and num_simulations == PATH_COUNTS[-1]:
+                    plain_rmse = rmse * np.sqrt(num_simulations / NUM_SIMULATIONS)
+                print(f"{method:<16} {num_simulations:>9,} {rmse:>9.5f} {ms:>8.1f}", end='')
+                if plain_rmse:
+                    print(f" {num_simulations * (rmse / plain_rmse) ** 2:>22,.0f}")
+                else:
+                    print()
+        print(f"(plain at {NUM_SIMULATIONS:,} paths: rmse ≈ {plain_rmse:.5f})")
+
+
+if __name__ == "__main__":
+    benchmark(FastGARCHSimulator())
@@ -1,16 +1,18 @@
 import threading
 import time
 
-from crypto.api.binance import update_file
+from crypto.api.binance import FILENAME, SYMBOL, update_file
 
 # To let binance update its 1-minute candle
 DELAY_SECS = 1
 
 class CandleManager:
-    """Runs update_file() once per minute in a background thread."""
+    """Runs update_file() for one symbol's candle file once per minute in a background thread."""
 
-    def __init__(self, file_lock, call_back):
+    def __init__(self, file_lock, call_back, symbol=SYMBOL, filename=FILENAME):
         self.file_lock = file_lock
+        self.symbol = symbol
+        self.filename = filename
         self.stop_event = threading.Event()
         self.thread = threading.Thread(target=self._run, daemon=True)
         self.call_back = call_back
@@ -24,6 +26,10 @@ class CandleManager:
         self.stop_event.set()
         self.thread.join()
 
+    def update(self):
+        """Backfills or updates the file once, in the calling thread."""
+        self._update_file()
+
     def _run(self):
         while not self.stop_event.is_set():
             # sleep until the next minute boundary
@@ -38,6 +44,6 @@ class CandleManager:
     def _update_file(self):
         try:
             with self.file_lock:
-                update_file()
+                update_file(self.symbol, self.filename)
         except Exception as e:
             print(f"Error updating candle file: {e}")
@@ -0,0 +1,128 @@
+import numpy as np
+
+# Remaining sizes below this count as filled
+EPSILON = 1e-9
+
+
+def to_yes_side(order, book):
+    """(is_bid, tick) of an order in the YES book: a NO buy at p rests as a YES ask at 1 - p."""
+    tick = book.tick(order['price'])
+    is_buy = order['side'] == 'BUY'
+    if order['type'] == 'NO':
+        return not is_buy, book.n_ticks - tick
+    return is_buy, tick
+
+
+def walk_book(book, is_bid, tick, size):
+    """(filled size, average YES price) of a marketable order taking depth up to its limit tick."""
+    if is_bid:
+        ticks = np.arange(tick + 1)
+        sizes = book.ask_sizes[:tick + 1]
+    else:
+        ticks = np.arange(book.n_ticks, tick - 1, -1)
+        sizes = book.bid_sizes[tick:][::-1]
+    taken = np.minimum(sizes, np.maximum(size - (np.cumsum(sizes) - sizes), 0.))
+    filled = float(taken.sum())
+    if filled <= EPSILON:
+        return 0., None
+    return filled, float(taken @ ticks) / filled * book.tick_size
+
+
+class QueueFillSimulator:
+    """Paper fills that respect depth and queue position.
+
+    A new order first takes the opposing depth up to its limit, the rest joins the back
+    of its price level: the displayed size there is the queue ahead of it. On every book
+    snapshot, all resting orders are updated at once with array operations:
+    - At the touch, a level that shrank traded from the front: the queue ahead goes first,
+      what is left of the decrease fills our order, partially if need be.
+    - Behind the touch, a shrinking level is cancels: the queue ahead is capped at the level.
+    - If the opposite side trades at or through our price, the level was swept: that depth
+      fills our order. Snapshots don't show our own trades, so the depth a crossing order
+      already took on placement (consumed) is still displayed; only depth beyond it fills.
+    The book is in YES terms, NO orders rest on the mirrored side (see to_yes_side).
+    """
+
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.is_bid = np.empty(0, dtype=bool)
+        self.ticks = np.empty(0, dtype=np.int64)
+        self.remaining = np.empty(0)
+        self.queue_ahead = np.empty(0)
+        self.level_sizes = np.empty(0)
+        # Opposing depth at or through the limit that we already took, see update()
+        self.consumed = np.empty(0)
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def place(self, order, book):
+        """Takes liquidity first, then rests the remainder. Returns (filled size, average price in
+        the order's own outcome), and sets order['sim_id'] if anything rests."""
+        is_bid, tick = to_yes_side(order, book)
+        filled, yes_price = walk_book(book, is_bid, tick, order['size'])
+        price = None
+        if filled > 0:
+            price = round(1. - yes_price if order['type'] == 'NO' else yes_price, 6)
+
+        remaining = order['size'] - filled
+        if remaining > EPSILON:
+            level_size = float(book.bid_sizes[tick] if is_bid else book.ask_sizes[tick])
+            order['sim_id'] = self._next_id
+            self.ids = np.append(self.ids, self._next_id)
+            self.is_bid = np.append(self.is_bid, is_bid)
+            self.ticks = np.append(self.ticks, tick)
+            self.remaining = np.append(self.remaining, remaining)
+            self.queue_ahead = np.append(self.queue_ahead, level_size)
+            self.level_sizes = np.append(self.level_sizes, level_size)
+            self.consumed = np.append(self.consumed, filled)
+            self._next_id += 1
+        return filled, price
+
+    def retain(self, sim_ids):
+        """Drops every resting order that isn't in sim_ids, i.e. cancels the others."""
+        self._keep(np.isin(self.ids, np.fromiter(sim_ids, dtype=np.int64)))
+
+    def update(self, book):
+        """Applies the next snapshot, returns {sim_id: filled size} of the orders that (partially) filled."""
+        if len(self.ids) == 0:
+            return {}
+        is_bid = self.is_bid
+        ticks = self.ticks
+        level = np.where(is_bid, book.bid_sizes[ticks], book.ask_sizes[ticks])
+
+        # Our order would be the best on its side even if its level is empty in the snapshot
+        at_touch = np.where(is_bid, ticks >= book.best_bid_tick, ticks <= book.best_ask_tick)
+        swept = np.where(is_bid, book.has_asks & (book.best_ask_tick <= ticks),
+                         book.has_bids & (book.best_bid_tick >= ticks))
+
+        # Opposing depth at or through our price; what we consumed can only still be shown up to that
+        crossing = np.where(is_bid, book.cum_ask_depth[ticks], book.cum_bid_depth[ticks])
+        consumed = np.minimum(self.consumed, crossing)
+        sweep_fills = np.where(swept, np.minimum(crossing - consumed, self.remaining), 0.)
+        self.consumed = consumed + sweep_fills
+
+        decrease = np.maximum(self.level_sizes - level, 0.)
+        traded = np.where(at_touch, decrease, 0.)
+        fills = np.clip(traded - self.queue_ahead, 0., self.remaining)
+        fills = np.where(swept, sweep_fills, fills)
+
+        self.queue_ahead = np.where(at_touch, np.maximum(self.queue_ahead - decrease, 0.),
+                                    np.minimum(self.queue_ahead, level))
+        self.level_sizes = level
+        self.remaining = self.remaining - fills
+
+        filled = fills > EPSILON
+        result = dict(zip(self.ids[filled].tolist(), fills[filled].tolist()))
+        self._keep(self.remaining > EPSILON)
+        return result
+
+    def _keep(self, mask):
+        self.ids = self.ids[mask]
+        self.is_bid = self.is_bid[mask]
+        self.ticks = self.ticks[mask]
+        self.remaining = self.remaining[mask]
+        self.queue_ahead = self.queue_ahead[mask]
+        self.level_sizes = self.level_sizes[mask]
+        self.consumed = self.consumed[mask]
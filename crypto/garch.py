@@ -1,104 +1,276 @@
+import numpy as np
 import pandas as pd
 import time
 import math
-import pickle
+import json
+import os
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
 from pathlib import Path
 import hashlib
 from arch import arch_model
 
-try:
-    import garch_monte_carlo
-except ImportError:
-    print("=" * 80)
-    print("!!! ERROR: Could not import 'garch_monte_carlo'")
-    print("Run 'maturin develop' in the Rust project directory.")
-    print("=" * 80)
-    exit()
+from crypto.pricing_backend import get_backend
+
+# The Rust extension, or the NumPy backend where it isn't built
+garch_monte_carlo = get_backend()
 
 FILENAME = "../data/btc_1m_log_returns.csv"
 NUM_SIMULATIONS = 800000
+# Paths for the variance-reduced simulation, about the plain error at NUM_SIMULATIONS:
+# benchmark_variance_reduction.py measured 130k-220k with all three methods
+VR_NUM_SIMULATIONS = 250000
+
+# Cache entries are ~0.8 MB per 100k returns
+CACHE_MAX_ENTRIES = 16
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Online mode: full refit on this schedule, or earlier when the model drifts
+REFIT_SECS = 6 * 60 * 60
+# EWMA of the squared standardized residuals (half-life 4h of 1m returns), ~1 while the fit holds
+DRIFT_DECAY = 0.5 ** (1 / 240)
+DRIFT_THRESHOLD = 0.5
+# Optimizer iterations for a warm-started refit, it usually converges in under 10
+REFIT_MAXITER = 25
+# After a failed or unconverged refit, the next one waits this long
+REFIT_RETRY_SECS = 15 * 60
 
 
 class GARCHCache:
-    """Cache GARCH model to avoid refitting"""
+    """Cache of GARCH fits, so an unchanged window is never refit.
+
+    An entry is garch_<key>.npy, the sorted standardized residuals (memory-mapped on load),
+    plus garch_<key>.json with the parameters and terminal state. The key hashes the
+    window's values. Loads touch the entry, the least recently used ones are evicted
+    beyond max_entries or max_bytes.
+    """
 
-    def __init__(self, cache_dir="../cache"):
+    def __init__(self, cache_dir="../cache", max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
 
     def get_cache_key(self, log_returns):
-        """Hash based on data length + last value"""
-        key_data = f"{len(log_returns)}_{log_returns.iloc[-1]:.10f}"
-        return hashlib.md5(key_data.encode()).hexdigest()
+        """Content hash of the window"""
+        values = np.ascontiguousarray(log_returns, dtype=np.float64)
+        return hashlib.blake2b(values.tobytes(), digest_size=16).hexdigest()
 
     def load(self, log_returns):
         cache_key = self.get_cache_key(log_returns)
-        cache_file = self.cache_dir / f"garch_{cache_key}.pkl"
-
-        if cache_file.exists():
-            with open(cache_file, 'rb') as f:
-                return pickle.load(f)
+        header_file = self.cache_dir / f"garch_{cache_key}.json"
+        try:
+            with open(header_file) as f:
+                fit = json.load(f)
+            # Written before unconverged fits were kept out of the cache
+            if not fit.get('converged'):
+                return None
+            fit['residuals'] = np.load(self.cache_dir / f"garch_{cache_key}.npy", mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        os.utime(header_file)
+        return fit
+
+    def load_latest(self, source):
+        """Header of the most recently used entry fit on returns from source, without residuals, or None.
+        Entries of other sources (another asset's file) have another scale, they are no starting point."""
+        headers = sorted(self.cache_dir.glob("garch_*.json"), key=lambda f: f.stat().st_mtime, reverse=True)
+        for header_file in headers:
+            try:
+                with open(header_file) as f:
+                    header = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if header.get('source') == source:
+                return header
         return None
 
-    def save(self, log_returns, garch_res, std_residuals):
+    def save(self, log_returns, fit, source=None):
         cache_key = self.get_cache_key(log_returns)
-        cache_file = self.cache_dir / f"garch_{cache_key}.pkl"
-
-        with open(cache_file, 'wb') as f:
-            pickle.dump({
-                'garch_res': garch_res,
-                'std_residuals': std_residuals
-            }, f)
-
-
-def fit_garch_cached(log_returns, cache):
-    """Fit GARCH with caching"""
+        header = {k: v for k, v in fit.items() if k != 'residuals'}
+        header['source'] = source
+        # Written atomically, the header last: it marks the entry complete
+        for name, write in ((f"garch_{cache_key}.npy", lambda f: np.save(f, fit['residuals'])),
+                            (f"garch_{cache_key}.json", lambda f: f.write(json.dumps(header).encode()))):
+            tmp_file = self.cache_dir / f".{name}.tmp"
+            with open(tmp_file, 'wb') as f:
+                write(f)
+            os.replace(tmp_file, self.cache_dir / name)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for header_file in self.cache_dir.glob("garch_*.json"):
+            data_file = header_file.with_suffix('.npy')
+            try:
+                size = header_file.stat().st_size + (data_file.stat().st_size if data_file.exists() else 0)
+                entries.append((header_file.stat().st_mtime, size, header_file, data_file))
+            except OSError:
+                continue
+        # Most recently used first
+        entries.sort(key=lambda entry: entry[0], reverse=True)
+        total_bytes = 0
+        for i, (_, size, header_file, data_file) in enumerate(entries):
+            total_bytes += size
+            if i >= self.max_entries or total_bytes > self.max_bytes:
+                header_file.unlink(missing_ok=True)
+                data_file.unlink(missing_ok=True)
+
+
+def fit_garch(log_returns, previous=None, maxiter=None):
+    """GARCH(1,1) with t innovations, as a dict: arch's parameters and scale (percent
+    returns times arch's rescaling), the terminal state in log-return units and the
+    sorted standardized residuals.
+
+    previous, an earlier fit (or cache header), warm-starts the optimizer from its
+    parameters; maxiter caps the optimizer's iterations.
+    """
+    start = time.perf_counter()
+    options = {'maxiter': maxiter} if maxiter else None
+    if previous is None:
+        multiplier = 100
+        am = arch_model(log_returns * multiplier, p=1, q=1, vol='Garch', dist='t', rescale=True)
+        res = am.fit(disp='off', options=options)
+    else:
+        # In the previous fit's units, so its parameters are the starting point as they are
+        multiplier = previous['scale']
+        am = arch_model(log_returns * multiplier, p=1, q=1, vol='Garch', dist='t', rescale=False)
+        starting_values = np.array(list(previous['params'].values()))
+        # arch grid-searches volatility starting values even when given all of them, the
+        # search costs more than the warm-started optimization
+        am.volatility.starting_values = lambda resids: starting_values[1:4]
+        res = am.fit(disp='off', starting_values=starting_values, options=options)
+    fit_secs = time.perf_counter() - start
+    iterations = int(res.optimization_result.nit)
+    converged = res.convergence_flag == 0
+
+    if not converged:
+        print(f"⚠️  WARNING: GARCH optimizer stopped without converging: {res.optimization_result.message}")
+
+    print(f"GARCH fit in {fit_secs:.2f}s, {iterations} iterations"
+          f"{' (warm start)' if previous is not None else ''}, α+β = {res.params['alpha[1]'] + res.params['beta[1]']:.4f}")
+
+    scale = multiplier * getattr(res, 'scale', 1.)
+    std_resid = (res.resid / res.conditional_volatility).dropna()
+    return {
+        'params': {name: float(value) for name, value in res.params.items()},
+        'scale': scale,
+        'last_resid': float(res.resid.iloc[-1] / scale),
+        'last_sigma_sq': float((res.conditional_volatility.iloc[-1] / scale) ** 2),
+        'num_returns': len(log_returns),
+        'fit_secs': fit_secs,
+        'iterations': iterations,
+        'converged': converged,
+        'residuals': np.sort(std_resid.to_numpy().astype(np.float64)),
+    }
+
+
+def fit_garch_cached(log_returns, cache, previous=None, maxiter=None, source=None):
+    """Fit GARCH with caching. Without a previous fit, a miss warm-starts from the most
+    recently used cache entry of the same source (the returns file).
+
+    A warm start that doesn't converge within maxiter is redone cold. Only converged
+    fits are cached, check fit['converged'] before using one.
+    """
+    start = time.perf_counter()
     cached = cache.load(log_returns)
     if cached:
-        print("✅ Using cached GARCH model")
-        return cached['garch_res'], cached['std_residuals']
+        print(f"✅ Using cached GARCH model ({(time.perf_counter() - start) * 1e6:.0f} µs)")
+        return cached
 
     print("🔄 Fitting new GARCH model...")
-    scaled_returns = log_returns * 100
-    am = arch_model(scaled_returns, p=1, q=1, vol='Garch', dist='t', rescale=True)
-    res = am.fit(disp='off')
-
-    if not res.convergence_flag:
-        print("⚠️  WARNING: GARCH model did not converge properly!")
-
-    print(res.summary())
-
-    std_resid = res.resid / res.conditional_volatility
-    cache.save(log_returns, res, std_resid.dropna())
-
-    return res, std_resid.dropna()
+    if previous is None and source is not None:
+        previous = cache.load_latest(source)
+    fit = fit_garch(log_returns, previous, maxiter)
+    if not fit['converged'] and previous is not None:
+        print("🔄 Warm start did not converge, fitting from scratch...")
+        fit = fit_garch(log_returns)
+    if fit['converged']:
+        cache.save(log_returns, fit, source)
+    return fit
+
+
+@dataclass(frozen=True)
+class GARCHState:
+    """Fitted parameters and the filtered state, in log-return units. Swapped as a whole."""
+    omega: float
+    alpha: float
+    beta: float
+    mu: float
+    last_resid: float
+    last_sigma_sq: float
+    # Sorted standardized residuals and their handle in the pricing backend
+    residuals: np.ndarray
+    residuals_handle: int
+
+    def sigma_sq_next(self):
+        return self.omega + self.alpha * self.last_resid ** 2 + self.beta * self.last_sigma_sq
+
+    def step(self, log_return):
+        """The state after one more return, O(1): the GARCH recursion with fixed parameters."""
+        return replace(self, last_resid=log_return - self.mu, last_sigma_sq=self.sigma_sq_next())
+
+
+def state_from_fit(fit):
+    params = fit['params']
+    # The model is fit on percent returns (and arch may rescale further), the
+    # simulation compounds log returns: omega and mu go back to those units
+    scale = fit['scale']
+    # Read-only (a cached fit is a read-only memory map) and registered once, the extension
+    # uses it without copying per call. Sorted, so index i and n - 1 - i are mirrored
+    # quantiles for antithetic pairs; the bootstrap draws uniform indices, order doesn't matter to it
+    residuals = fit['residuals']
+    residuals.flags.writeable = False
+    return GARCHState(
+        omega=params['omega'] / scale ** 2,
+        alpha=params['alpha[1]'],
+        beta=params['beta[1]'],
+        mu=params.get('mu', 0.) / scale,
+        last_resid=fit['last_resid'],
+        last_sigma_sq=fit['last_sigma_sq'],
+        residuals=residuals,
+        residuals_handle=garch_monte_carlo.register_returns(residuals),
+    )
 
 
 class FastGARCHSimulator:
-    """Optimized simulator - fit once, query many times"""
+    """Optimized simulator - fit once, query many times.
+
+    update() advances the state by each new 1m return with the fitted parameters fixed.
+    The full fit only reruns every REFIT_SECS, or earlier when the squared standardized
+    residuals drift away from 1, in a background thread; the new state is swapped in whole.
+    """
 
-    def __init__(self, filename=FILENAME):
+    def __init__(self, filename=FILENAME, file_lock=None):
         self.filename = filename
+        # Shared with a CandleManager writing the file, see sync_with_file()
+        self.file_lock = file_lock or threading.Lock()
         self.cache = GARCHCache()
 
         # Load data
-        self.log_returns = pd.read_csv(filename)['log_return'].dropna()
+        with self.file_lock:
+            candles = pd.read_csv(filename)
+        self.log_returns = candles['log_return'].dropna()
+        self.last_open_time = candles['open_time'].iloc[-1] if 'open_time' in candles else None
 
         # Fit GARCH (cached)
-        self.garch_res, self.std_residuals = fit_garch_cached(
-            self.log_returns, self.cache
-        )
-
-        # Extract parameters once
-        params = self.garch_res.params
-        self.omega = params['omega']
-        self.alpha = params['alpha[1]']
-        self.beta = params['beta[1]']
-        self.residuals_list = self.std_residuals.tolist()
-
-        # Cache state
-        self.last_resid = self.garch_res.resid.iloc[-1]
-        self.last_sigma_sq = self.garch_res.conditional_volatility.iloc[-1] ** 2
+        self.fit = fit_garch_cached(self.log_returns, self.cache, source=os.path.abspath(filename))
+        self.state = state_from_fit(self.fit)
+
+        # Online mode: the refit window rolls forward with every update
+        self.window = deque(self.log_returns.to_numpy(), maxlen=len(self.log_returns))
+        self.num_updates = 0
+        self.fitted_at = time.time()
+        self.drift = 1.
+        self.num_refits = 0
+        self._lock = threading.Lock()
+        self._refitting = False
+        self.retry_at = 0.
+        self._retired_handle = None
+        self._refit_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="garch-refit")
 
         # Diagnostics
         alpha_beta_sum = self.alpha + self.beta
@@ -107,24 +279,153 @@ class FastGARCHSimulator:
             print("   ⚠️  WARNING: Close to non-stationarity")
         print()
 
+    # The current parameters and state, read through self.state so a swap is atomic
+    omega = property(lambda self: self.state.omega)
+    alpha = property(lambda self: self.state.alpha)
+    beta = property(lambda self: self.state.beta)
+    last_resid = property(lambda self: self.state.last_resid)
+    last_sigma_sq = property(lambda self: self.state.last_sigma_sq)
+
+    def update(self, log_return):
+        """Filters one new 1m log return into the state, refits in the background if due."""
+        with self._lock:
+            state = self.state
+            sigma_sq = state.sigma_sq_next()
+            if sigma_sq > 0:
+                self.drift = DRIFT_DECAY * self.drift + (1 - DRIFT_DECAY) * (log_return - state.mu) ** 2 / sigma_sq
+            self.state = state.step(log_return)
+            self.window.append(log_return)
+            self.num_updates += 1
+        if self.refit_due():
+            self.refit_in_background()
+
+    def sync_with_file(self):
+        """Feeds the returns appended to the candle file since the last sync to update(). Meant as
+        the CandleManager callback: CandleManager(sim.file_lock, sim.sync_with_file, symbol, filename).
+        Needs the open_time column the candle files have. Returns how many returns were new."""
+        with self.file_lock:
+            candles = pd.read_csv(self.filename).dropna(subset=['log_return'])
+        if self.last_open_time is None:
+            raise ValueError(f"{self.filename} has no open_time column to sync by")
+        # ISO timestamps, they compare as strings
+        new = candles[candles['open_time'] > self.last_open_time]
+        for log_return in new['log_return']:
+            self.update(float(log_return))
+        if len(new):
+            self.last_open_time = new['open_time'].iloc[-1]
+        return len(new)
+
+    def refit_due(self):
+        return (not self._refitting and time.time() >= self.retry_at
+                and (time.time() - self.fitted_at > REFIT_SECS or abs(self.drift - 1) > DRIFT_THRESHOLD))
+
+    def refit_in_background(self):
+        with self._lock:
+            if self._refitting:
+                return None
+            self._refitting = True
+            window = pd.Series(np.array(self.window))
+            num_updates = self.num_updates
+        print(f"Refitting GARCH in the background (drift {self.drift:.2f}, "
+              f"fitted {(time.time() - self.fitted_at) / 60:.0f} min ago)")
+        return self._refit_executor.submit(self._refit, window, num_updates)
+
+    def _refit(self, window, num_updates):
+        try:
+            fit = fit_garch_cached(window, self.cache, previous=self.fit, maxiter=REFIT_MAXITER,
+                                   source=os.path.abspath(self.filename))
+            if not fit['converged']:
+                # The current parameters stay, a later refit tries again
+                print(f"GARCH refit did not converge, keeping the current fit, retrying in {REFIT_RETRY_SECS // 60} min")
+                self.retry_at = time.time() + REFIT_RETRY_SECS
+                return
+            state = state_from_fit(fit)
+            with self._lock:
+                # Returns that arrived during the fit are filtered with the new parameters
+                missed = self.num_updates - num_updates
+                for log_return in itertools.islice(self.window, len(self.window) - missed, None):
+                    state = state.step(log_return)
+                old_state, self.state = self.state, state
+                self.fit = fit
+                self.fitted_at = time.time()
+                self.drift = 1.
+                self.num_refits += 1
+            # A pricing call may still use the previous residuals, they are released one refit later
+            if self._retired_handle is not None:
+                garch_monte_carlo.unregister_returns(self._retired_handle)
+            self._retired_handle = old_state.residuals_handle
+            print(f"GARCH refit swapped in: α+β = {state.alpha + state.beta:.4f}")
+        except Exception as e:
+            print(f"GARCH refit failed, retrying in {REFIT_RETRY_SECS // 60} min: {e}")
+            self.retry_at = time.time() + REFIT_RETRY_SECS
+        finally:
+            self._refitting = False
+
     def get_probability(self, start_price, target_price, horizon_seconds,
-                        num_simulations=NUM_SIMULATIONS):
-        """Calculate probability using optimized Rust function"""
+                        num_simulations=NUM_SIMULATIONS, antithetic=False, control_variate=False, qmc=False):
+        """Calculate probability using optimized Rust function.
+
+        antithetic, control_variate and qmc switch on the variance reductions of
+        calculate_probability_vr, which reach the plain error with far fewer paths
+        (see benchmark_variance_reduction.py).
+        """
         horizon_minutes = max(1, math.ceil(horizon_seconds / 60))
 
+        if antithetic or control_variate or qmc:
+            return self.get_probability_vr(start_price, target_price, horizon_seconds, num_simulations,
+                                           antithetic, control_variate, qmc)[0]
+
+        state = self.state
         return garch_monte_carlo.calculate_probability_only(
-            omega=self.omega,
-            alpha=self.alpha,
-            beta=self.beta,
-            last_resid=self.last_resid,
-            last_sigma_sq=self.last_sigma_sq,
-            residuals=self.residuals_list,
+            omega=state.omega,
+            alpha=state.alpha,
+            beta=state.beta,
+            last_resid=state.last_resid,
+            last_sigma_sq=state.last_sigma_sq,
+            residuals=state.residuals_handle,
             current_price=start_price,
             target_price=target_price,
             horizon_minutes=horizon_minutes,
             num_simulations=num_simulations
         )
 
+    def get_probability_matrix(self, start_price, target_prices, horizons_seconds, num_simulations=NUM_SIMULATIONS):
+        """P(price > target) for every target x horizon, as a (len(target_prices), len(horizons_seconds))
+        array. One path set simulated to the longest horizon prices all of them."""
+        state = self.state
+        return np.array(garch_monte_carlo.calculate_probability_matrix(
+            omega=state.omega,
+            alpha=state.alpha,
+            beta=state.beta,
+            last_resid=state.last_resid,
+            last_sigma_sq=state.last_sigma_sq,
+            residuals=state.residuals_handle,
+            current_price=start_price,
+            target_prices=[float(t) for t in target_prices],
+            horizons=[max(1, math.ceil(h / 60)) for h in horizons_seconds],
+            num_simulations=num_simulations,
+        ))
+
+    def get_probability_vr(self, start_price, target_price, horizon_seconds, num_simulations=VR_NUM_SIMULATIONS,
+                           antithetic=True, control_variate=True, qmc=True):
+        """(probability, standard error) from the variance-reduced simulation."""
+        state = self.state
+        return garch_monte_carlo.calculate_probability_vr(
+            omega=state.omega,
+            alpha=state.alpha,
+            beta=state.beta,
+            last_resid=state.last_resid,
+            last_sigma_sq=state.last_sigma_sq,
+            residuals=state.residuals_handle,
+            current_price=start_price,
+            target_price=target_price,
+            horizon_minutes=max(1, math.ceil(horizon_seconds / 60)),
+            num_simulations=num_simulations,
+            antithetic=antithetic,
+            control_variate=control_variate,
+            qmc=qmc,
+        )
+
 
 if __name__ == "__main__":
     # Initialize simulator once
@@ -155,30 +456,19 @@ if __name__ == "__main__":
     print(f"⏱️  Simulation time: {elapsed:.3f}s\n")
     print(f"{elapsed:.3f}s - {prob:.2%}")
 
-    # Multiple rapid queries
-    # print("=" * 60)
-    # print("Running multiple rapid queries...")
-    # print("=" * 60)
-    #
-    # queries = [
-    #     (start_price * 1.005, 900, "+0.5% in 15min"),
-    #     (start_price * 1.01, 1800, "+1.0% in 30min"),
-    #     (start_price * 0.995, 300, "-0.5% in 5min"),
-    #     (start_price * 1.002, 600, "+0.2% in 10min"),
-    #     (start_price * 1.008, 1200, "+0.8% in 20min"),
-    # ]
-    #
-    # total_start = time.time()
-    #
-    # for target, horizon_sec, description in queries:
-    #     query_start = time.time()
-    #     prob = sim.get_probability(start_price, target, horizon_sec, NUM_SIMULATIONS)
-    #     query_time = time.time() - query_start
-    #     print(f"{description:20} = {prob:6.2%}  [{query_time:.3f}s]")
-    #
-    # total_elapsed = time.time() - total_start
-    #
-    # print(f"\n{'=' * 60}")
-    # print(f"Total time: {total_elapsed:.3f}s")
-    # print(f"Average per query: {total_elapsed / len(queries):.3f}s")
-    # print(f"Queries per second: {len(queries) / total_elapsed:.2f}")
\ No newline at end of file
+    # Strike ladder x term structure from one path set
+    print("=" * 60)
+    print("Probability matrix: 50 strikes x 60 horizons...")
+    print("=" * 60)
+
+    targets = start_price * np.linspace(0.99, 1.01, 50)
+    horizons = 60 * np.arange(1, 61)
+
+    start_time = time.time()
+    matrix = sim.get_probability_matrix(start_price, targets, horizons, NUM_SIMULATIONS)
+    elapsed = time.time() - start_time
+
+    for horizon_index in (4, 14, 29, 59):
+        row = "  ".join(f"{p:6.2%}" for p in matrix[::10, horizon_index])
+        print(f"{horizons[horizon_index] // 60:2d} min: {row}")
+    print(f"\n⏱️  {matrix.size} probabilities in {elapsed:.3f}s")
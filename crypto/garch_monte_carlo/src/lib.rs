@@ -5,65 +5,453 @@
 // rayon = "1.8"
 // rand = "0.8"
 // rand_xoshiro = "0.6"
+// numpy = "0.20"
 
+use numpy::{PyArray1, PyReadonlyArray1};
+use pyo3::exceptions::PyValueError;
 use pyo3::prelude::*;
 use rand::prelude::*;
 use rand_xoshiro::Xoshiro256PlusPlus;
 use rayon::prelude::*;
+use std::collections::HashMap;
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::sync::{Mutex, OnceLock};
 
+// Returns/residuals arrays registered once and then referenced by handle, so a call
+// doesn't convert 100k Python floats. The registry holds a reference to the NumPy array
+// itself, nothing is copied; the Python side marks it read-only before registering.
+static REGISTRY: OnceLock<Mutex<HashMap<u64, Py<PyArray1<f64>>>>> = OnceLock::new();
+static NEXT_HANDLE: AtomicU64 = AtomicU64::new(1);
+
+fn registry() -> &'static Mutex<HashMap<u64, Py<PyArray1<f64>>>> {
+    REGISTRY.get_or_init(|| Mutex::new(HashMap::new()))
+}
+
+#[pyfunction]
+fn register_returns(returns: &PyArray1<f64>) -> PyResult<u64> {
+    if !returns.is_contiguous() {
+        return Err(PyValueError::new_err("returns must be a contiguous float64 array"));
+    }
+    let handle = NEXT_HANDLE.fetch_add(1, Ordering::Relaxed);
+    registry().lock().unwrap().insert(handle, returns.into());
+    Ok(handle)
+}
+
+#[pyfunction]
+fn unregister_returns(handle: u64) -> bool {
+    registry().lock().unwrap().remove(&handle).is_some()
+}
+
+// Anything the pricing functions accept as returns/residuals: a handle from
+// register_returns, a float64 NumPy array (borrowed, not copied) or a list of floats.
+#[derive(FromPyObject)]
+enum Returns<'py> {
+    Handle(u64),
+    Array(PyReadonlyArray1<'py, f64>),
+    List(Vec<f64>),
+}
+
+impl<'py> Returns<'py> {
+    // Swaps a handle for a read-only view of the registered array
+    fn resolve(self, py: Python<'py>) -> PyResult<Returns<'py>> {
+        match self {
+            Returns::Handle(handle) => {
+                let array = registry()
+                    .lock()
+                    .unwrap()
+                    .get(&handle)
+                    .map(|a| a.clone_ref(py))
+                    .ok_or_else(|| PyValueError::new_err(format!("unknown returns handle {}", handle)))?;
+                Ok(Returns::Array(array.into_ref(py).readonly()))
+            }
+            other => Ok(other),
+        }
+    }
+
+    fn as_slice(&self) -> PyResult<&[f64]> {
+        match self {
+            Returns::Array(array) => array
+                .as_slice()
+                .map_err(|_| PyValueError::new_err("returns must be a contiguous float64 array")),
+            Returns::List(values) => Ok(values.as_slice()),
+            Returns::Handle(_) => Err(PyValueError::new_err("unresolved returns handle")),
+        }
+    }
+}
+
+// Both functions release the GIL while simulating, so Python can run
+// the next market-data fetch in parallel with the pricing worker thread.
 #[pyfunction]
-fn calculate_probability_only(
+fn calculate_probability_only<'py>(
+    py: Python<'py>,
     omega: f64,
     alpha: f64,
     beta: f64,
     last_resid: f64,
     last_sigma_sq: f64,
-    residuals: Vec<f64>,
+    residuals: Returns<'py>,
     current_price: f64,
     target_price: f64,
     horizon_minutes: usize,
     num_simulations: usize,
 ) -> PyResult<f64> {
     let initial_sigma_sq = omega + alpha * last_resid.powi(2) + beta * last_sigma_sq;
+    let residuals = residuals.resolve(py)?;
+    let residuals = residuals.as_slice()?;
     let residuals_len = residuals.len();
 
     // Count successes without storing all prices (saves memory)
-    let count_above: usize = (0..num_simulations)
-        .into_par_iter()
-        .map_init(
-            || Xoshiro256PlusPlus::from_entropy(),
-            |rng, _| {
-                let mut price = current_price;
-                let mut current_sigma_sq = initial_sigma_sq;
+    let count_above: usize = py.allow_threads(|| {
+        (0..num_simulations)
+            .into_par_iter()
+            .map_init(
+                || Xoshiro256PlusPlus::from_entropy(),
+                |rng, _| {
+                    let mut price = current_price;
+                    let mut current_sigma_sq = initial_sigma_sq;
 
-                for _ in 0..horizon_minutes {
-                    let idx = rng.gen_range(0..residuals_len);
-                    let shock = residuals[idx];
-                    let sigma = current_sigma_sq.sqrt();
-                    let simulated_return = sigma * shock;
-                    price *= (simulated_return).exp();
-                    current_sigma_sq = omega + alpha * shock * shock + beta * current_sigma_sq;
-                }
+                    for _ in 0..horizon_minutes {
+                        let idx = rng.gen_range(0..residuals_len);
+                        let shock = residuals[idx];
+                        let sigma = current_sigma_sq.sqrt();
+                        let simulated_return = sigma * shock;
+                        price *= (simulated_return).exp();
+                        // The recursion takes the return itself, not the standardized residual
+                        current_sigma_sq = omega + alpha * simulated_return * simulated_return + beta * current_sigma_sq;
+                    }
 
-                (price > target_price) as usize
-            },
-        )
-        .sum();
+                    (price > target_price) as usize
+                },
+            )
+            .sum()
+    });
 
     Ok(count_above as f64 / num_simulations as f64)
 }
 
+// Probabilities for every (target, horizon) pair from one set of paths, same model as
+// calculate_probability_only. Paths run to the longest horizon; at each requested minute the
+// log price is binary-searched among the sorted log barriers and counted in a histogram,
+// suffix sums of which give P(price > target). Returns rows of targets, columns of horizons.
 #[pyfunction]
-fn calculate_probability_plain(
-    returns: Vec<f64>,
+fn calculate_probability_matrix<'py>(
+    py: Python<'py>,
+    omega: f64,
+    alpha: f64,
+    beta: f64,
+    last_resid: f64,
+    last_sigma_sq: f64,
+    residuals: Returns<'py>,
+    current_price: f64,
+    target_prices: Vec<f64>,
+    horizons: Vec<usize>,
+    num_simulations: usize,
+) -> PyResult<Vec<Vec<f64>>> {
+    if horizons.iter().any(|&h| h == 0) {
+        return Err(PyValueError::new_err("horizons must be at least 1 minute"));
+    }
+    if target_prices.iter().any(|p| p.is_nan()) {
+        return Err(PyValueError::new_err("target_prices must not contain NaN"));
+    }
+    if horizons.is_empty() || target_prices.is_empty() {
+        return Ok(vec![vec![0.0; horizons.len()]; target_prices.len()]);
+    }
+    let initial_sigma_sq = omega + alpha * last_resid.powi(2) + beta * last_sigma_sq;
+    let residuals = residuals.resolve(py)?;
+    let residuals = residuals.as_slice()?;
+    let residuals_len = residuals.len();
+    if residuals_len == 0 {
+        return Err(PyValueError::new_err("residuals must not be empty"));
+    }
+
+    let mut order: Vec<usize> = (0..target_prices.len()).collect();
+    order.sort_by(|&a, &b| target_prices[a].total_cmp(&target_prices[b]));
+    let barriers: Vec<f64> = order.iter().map(|&i| (target_prices[i] / current_price).ln()).collect();
+    let mut steps = horizons.clone();
+    steps.sort_unstable();
+    steps.dedup();
+    let max_horizon = *steps.last().unwrap();
+    let num_bins = barriers.len() + 1;
+
+    // histogram[step * num_bins + j]: paths whose log price exceeds exactly barriers[..j] at that step
+    let histogram: Vec<u64> = py.allow_threads(|| {
+        (0..num_simulations)
+            .into_par_iter()
+            .fold(
+                || (Xoshiro256PlusPlus::from_entropy(), vec![0u64; steps.len() * num_bins]),
+                |(mut rng, mut histogram), _| {
+                    let mut log_price = 0.0;
+                    let mut sigma_sq = initial_sigma_sq;
+                    let mut next = 0;
+                    for minute in 1..=max_horizon {
+                        let simulated_return = sigma_sq.sqrt() * residuals[rng.gen_range(0..residuals_len)];
+                        log_price += simulated_return;
+                        sigma_sq = omega + alpha * simulated_return * simulated_return + beta * sigma_sq;
+                        if minute == steps[next] {
+                            histogram[next * num_bins + barriers.partition_point(|&b| b < log_price)] += 1;
+                            next += 1;
+                        }
+                    }
+                    (rng, histogram)
+                },
+            )
+            .map(|(_, histogram)| histogram)
+            .reduce(
+                || vec![0u64; steps.len() * num_bins],
+                |mut a, b| {
+                    a.iter_mut().zip(b).for_each(|(x, y)| *x += y);
+                    a
+                },
+            )
+    });
+
+    let mut matrix = vec![vec![0.0; horizons.len()]; target_prices.len()];
+    for (column, horizon) in horizons.iter().enumerate() {
+        let step = steps.binary_search(horizon).unwrap();
+        let counts = &histogram[step * num_bins..(step + 1) * num_bins];
+        // Paths above sorted barrier k: those that exceed more than k barriers
+        let mut above = 0;
+        for k in (0..barriers.len()).rev() {
+            above += counts[k + 1];
+            matrix[order[k]][column] = above as f64 / num_simulations as f64;
+        }
+    }
+    Ok(matrix)
+}
+
+// Standard normal CDF, erfc from Numerical Recipes (relative error < 1.2e-7)
+fn norm_cdf(x: f64) -> f64 {
+    let z = x.abs() / std::f64::consts::SQRT_2;
+    let t = 1.0 / (1.0 + 0.5 * z);
+    let erfc = t * (-z * z - 1.26551223
+        + t * (1.00002368
+            + t * (0.37409196
+                + t * (0.09678418
+                    + t * (-0.18628806
+                        + t * (0.27886807
+                            + t * (-1.13520398 + t * (1.48851587 + t * (-0.82215223 + t * 0.17087277)))))))))
+        .exp();
+    if x >= 0.0 { 1.0 - 0.5 * erfc } else { 0.5 * erfc }
+}
+
+// Inverse standard normal CDF, Acklam's rational approximation (relative error < 1.2e-9)
+fn norm_ppf(p: f64) -> f64 {
+    const A: [f64; 6] = [-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+                         1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00];
+    const B: [f64; 5] = [-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+                         6.680131188771972e+01, -1.328068155288572e+01];
+    const C: [f64; 6] = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+                         -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00];
+    const D: [f64; 4] = [7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00,
+                         3.754408661907416e+00];
+    let tail = |q: f64| {
+        (((((C[0] * q + C[1]) * q + C[2]) * q + C[3]) * q + C[4]) * q + C[5])
+            / ((((D[0] * q + D[1]) * q + D[2]) * q + D[3]) * q + 1.0)
+    };
+    if p < 0.02425 {
+        tail((-2.0 * p.ln()).sqrt())
+    } else if p > 1.0 - 0.02425 {
+        -tail((-2.0 * (1.0 - p).ln()).sqrt())
+    } else {
+        let q = p - 0.5;
+        let r = q * q;
+        (((((A[0] * r + A[1]) * r + A[2]) * r + A[3]) * r + A[4]) * r + A[5]) * q
+            / (((((B[0] * r + B[1]) * r + B[2]) * r + B[3]) * r + B[4]) * r + 1.0)
+    }
+}
+
+fn first_primes(count: usize) -> Vec<u64> {
+    let mut primes: Vec<u64> = Vec::with_capacity(count);
+    let mut candidate = 2;
+    while primes.len() < count {
+        if primes.iter().take_while(|&&p| p * p <= candidate).all(|&p| candidate % p != 0) {
+            primes.push(candidate);
+        }
+        candidate += 1;
+    }
+    primes
+}
+
+struct GarchPath<'a> {
+    omega: f64,
+    alpha: f64,
+    beta: f64,
+    initial_sigma_sq: f64,
+    // Sorted ascending, so index i and len - 1 - i are mirrored quantiles
+    residuals: &'a [f64],
+    // Normal quantile of each residual's rank, empty without the control variate
+    normal_quantiles: &'a [f64],
+    // sqrt of the expected GARCH variance per step, the control's deterministic volatility
+    control_sigmas: &'a [f64],
+    log_barrier: f64,
+}
+
+impl<'a> GarchPath<'a> {
+    // (GARCH path ends above the target, Gaussian control path ends above the target)
+    fn simulate(&self, indices: &[usize], mirror: bool) -> (f64, f64) {
+        let last = self.residuals.len() - 1;
+        let mut log_price = 0.0;
+        let mut control_log_price = 0.0;
+        let mut sigma_sq = self.initial_sigma_sq;
+        for (step, &index) in indices.iter().enumerate() {
+            let idx = if mirror { last - index } else { index };
+            let simulated_return = sigma_sq.sqrt() * self.residuals[idx];
+            log_price += simulated_return;
+            sigma_sq = self.omega + self.alpha * simulated_return * simulated_return + self.beta * sigma_sq;
+            if !self.normal_quantiles.is_empty() {
+                control_log_price += self.control_sigmas[step] * self.normal_quantiles[idx];
+            }
+        }
+        ((log_price > self.log_barrier) as u8 as f64, (control_log_price > self.log_barrier) as u8 as f64)
+    }
+}
+
+// Variance-reduced version of calculate_probability_only, same GARCH paths:
+// - antithetic: every path is paired with its mirror, residual i swapped for len - 1 - i
+//   of the sorted residuals, i.e. the opposite quantile.
+// - control_variate: each path also drives a Gaussian path with the same ranks mapped to
+//   normal quantiles and the expected GARCH variance per step. Its probability is known in
+//   closed form, the estimate is corrected by the regression on it.
+// - qmc: residual indices from a randomized Kronecker (Richtmyer) sequence, one sqrt(prime)
+//   per step, instead of independent draws.
+// The paths are split into num_replicates independent batches (own random shift for qmc);
+// the standard error comes from the spread of the batch estimates, which stays valid for
+// correlated paths. Returns (probability, standard error).
+#[pyfunction]
+#[pyo3(signature = (omega, alpha, beta, last_resid, last_sigma_sq, residuals, current_price, target_price, horizon_minutes, num_simulations, antithetic=true, control_variate=true, qmc=true, num_replicates=16))]
+fn calculate_probability_vr<'py>(
+    py: Python<'py>,
+    omega: f64,
+    alpha: f64,
+    beta: f64,
+    last_resid: f64,
+    last_sigma_sq: f64,
+    residuals: Returns<'py>,
     current_price: f64,
     target_price: f64,
     horizon_minutes: usize,
     num_simulations: usize,
-) -> PyResult<f64> {
-    let returns_len = returns.len();
+    antithetic: bool,
+    control_variate: bool,
+    qmc: bool,
+    num_replicates: usize,
+) -> PyResult<(f64, f64)> {
+    if num_replicates < 2 {
+        return Err(PyValueError::new_err("num_replicates must be at least 2"));
+    }
+    let residuals = residuals.resolve(py)?;
+    let residuals = residuals.as_slice()?;
+    if residuals.is_empty() {
+        return Err(PyValueError::new_err("residuals must not be empty"));
+    }
+    let sorted;
+    let residuals = if residuals.windows(2).all(|w| w[0] <= w[1]) {
+        residuals
+    } else {
+        let mut copy = residuals.to_vec();
+        copy.sort_by(|a, b| a.partial_cmp(b).unwrap());
+        sorted = copy;
+        sorted.as_slice()
+    };
+    let n = residuals.len();
+    let initial_sigma_sq = omega + alpha * last_resid.powi(2) + beta * last_sigma_sq;
+    let log_barrier = (target_price / current_price).ln();
+
+    let estimate = py.allow_threads(|| {
+        // E[sigma_{t+1}^2] = omega + (alpha E[z^2] + beta) E[sigma_t^2]
+        let mean_sq = residuals.iter().map(|r| r * r).sum::<f64>() / n as f64;
+        let mut control_sigmas = Vec::with_capacity(horizon_minutes);
+        let mut sigma_sq = initial_sigma_sq;
+        for _ in 0..horizon_minutes {
+            control_sigmas.push(sigma_sq.sqrt());
+            sigma_sq = omega + (alpha * mean_sq + beta) * sigma_sq;
+        }
+        let control_variance: f64 = control_sigmas.iter().map(|s| s * s).sum();
+        let control_mean = if control_variance > 0.0 {
+            norm_cdf(-log_barrier / control_variance.sqrt())
+        } else {
+            (log_barrier < 0.0) as u8 as f64
+        };
+        let normal_quantiles: Vec<f64> = if control_variate {
+            (0..n).map(|i| norm_ppf((i as f64 + 0.5) / n as f64)).collect()
+        } else {
+            Vec::new()
+        };
+        let path = GarchPath {
+            omega,
+            alpha,
+            beta,
+            initial_sigma_sq,
+            residuals,
+            normal_quantiles: &normal_quantiles,
+            control_sigmas: &control_sigmas,
+            log_barrier,
+        };
+
+        let kronecker: Vec<f64> = first_primes(horizon_minutes).iter().map(|&p| (p as f64).sqrt().fract()).collect();
+        let mut shift_rng = Xoshiro256PlusPlus::from_entropy();
+        let paths_per_unit = if antithetic { 2 } else { 1 };
+        let units = (num_simulations / num_replicates / paths_per_unit).max(1);
+
+        // Per replicate: sums of y, x, x^2 and x*y over its units (pair averages if antithetic)
+        let sums: Vec<[f64; 4]> = (0..num_replicates)
+            .map(|_| {
+                let shifts: Vec<f64> = (0..horizon_minutes).map(|_| shift_rng.gen::<f64>()).collect();
+                (0..units)
+                    .into_par_iter()
+                    .map_init(
+                        || (Xoshiro256PlusPlus::from_entropy(), vec![0usize; horizon_minutes]),
+                        |(rng, indices), j| {
+                            for (step, index) in indices.iter_mut().enumerate() {
+                                *index = if qmc {
+                                    let u = (shifts[step] + j as f64 * kronecker[step]).fract();
+                                    ((u * n as f64) as usize).min(n - 1)
+                                } else {
+                                    rng.gen_range(0..n)
+                                };
+                            }
+                            let (mut y, mut x) = path.simulate(&indices[..], false);
+                            if antithetic {
+                                let (y_mirror, x_mirror) = path.simulate(&indices[..], true);
+                                y = 0.5 * (y + y_mirror);
+                                x = 0.5 * (x + x_mirror);
+                            }
+                            [y, x, x * x, x * y]
+                        },
+                    )
+                    .reduce(|| [0.0; 4], |a, b| [a[0] + b[0], a[1] + b[1], a[2] + b[2], a[3] + b[3]])
+            })
+            .collect();
+
+        // One regression coefficient pooled over the replicates
+        let m = units as f64;
+        let (covariance, variance) = sums.iter().fold((0.0, 0.0), |(c, v), s| {
+            (c + s[3] - s[0] * s[1] / m, v + s[2] - s[1] * s[1] / m)
+        });
+        let coefficient = if control_variate && variance > 0.0 { covariance / variance } else { 0.0 };
+
+        let estimates: Vec<f64> = sums
+            .iter()
+            .map(|s| s[0] / m - coefficient * (s[1] / m - control_mean))
+            .collect();
+        let r = num_replicates as f64;
+        let mean = estimates.iter().sum::<f64>() / r;
+        let spread = estimates.iter().map(|e| (e - mean).powi(2)).sum::<f64>() / (r - 1.0);
+        (mean.clamp(0.0, 1.0), (spread / r).sqrt())
+    });
 
-    let count_above: usize = (0..num_simulations)
+    Ok(estimate)
+}
+
+fn simulate_plain_batch(
+    returns: &[f64],
+    current_price: f64,
+    target_price: f64,
+    horizon_minutes: usize,
+    num_simulations: usize,
+) -> usize {
+    let returns_len = returns.len();
+    (0..num_simulations)
         .into_par_iter()
         .map_init(
             || Xoshiro256PlusPlus::from_entropy(),
@@ -79,15 +467,98 @@ fn calculate_probability_plain(
                 (price > target_price) as usize
             },
         )
-        .sum();
+        .sum()
+}
+
+// Standard error with the Agresti-Coull adjustment, so it doesn't collapse to 0 when no
+// (or every) path ends above the target.
+fn standard_error(count_above: usize, num_simulations: usize) -> f64 {
+    let n = num_simulations as f64 + 4.0;
+    let p = (count_above as f64 + 2.0) / n;
+    (p * (1.0 - p) / n).sqrt()
+}
+
+// boundaries is sorted ascending
+fn any_boundary_within(boundaries: &[f64], low: f64, high: f64) -> bool {
+    let i = boundaries.partition_point(|&b| b < low);
+    i < boundaries.len() && boundaries[i] <= high
+}
+
+#[pyfunction]
+fn calculate_probability_plain<'py>(
+    py: Python<'py>,
+    returns: Returns<'py>,
+    current_price: f64,
+    target_price: f64,
+    horizon_minutes: usize,
+    num_simulations: usize,
+) -> PyResult<f64> {
+    let returns = returns.resolve(py)?;
+    let returns = returns.as_slice()?;
+    let count_above = py.allow_threads(|| {
+        simulate_plain_batch(returns, current_price, target_price, horizon_minutes, num_simulations)
+    });
 
     Ok(count_above as f64 / num_simulations as f64)
 }
 
+// Simulates in batches (batch_size, then doubling the total) until no boundary lies within
+// z standard errors of the estimate, or max_simulations is reached. boundaries are the
+// probabilities at which the caller's decision changes, e.g. where the rounded quote moves
+// by a tick. Returns (probability, standard error, number of simulations).
+#[pyfunction]
+#[pyo3(signature = (returns, current_price, target_price, horizon_minutes, boundaries, z=3.0, batch_size=20_000, max_simulations=1_000_000))]
+fn calculate_probability_plain_adaptive<'py>(
+    py: Python<'py>,
+    returns: Returns<'py>,
+    current_price: f64,
+    target_price: f64,
+    horizon_minutes: usize,
+    boundaries: Vec<f64>,
+    z: f64,
+    batch_size: usize,
+    max_simulations: usize,
+) -> PyResult<(f64, f64, usize)> {
+    let mut boundaries = boundaries;
+    boundaries.sort_by(|a, b| a.partial_cmp(b).unwrap());
+    let returns = returns.resolve(py)?;
+    let returns = returns.as_slice()?;
+
+    let (count_above, num_simulations) = py.allow_threads(|| {
+        let mut count_above = 0;
+        let mut num_simulations = 0;
+        let mut batch = batch_size.max(1);
+        while num_simulations < max_simulations {
+            let size = batch.min(max_simulations - num_simulations);
+            count_above += simulate_plain_batch(returns, current_price, target_price, horizon_minutes, size);
+            num_simulations += size;
+
+            let p = count_above as f64 / num_simulations as f64;
+            let margin = z * standard_error(count_above, num_simulations);
+            if !any_boundary_within(&boundaries, p - margin, p + margin) {
+                break;
+            }
+            batch = num_simulations;
+        }
+        (count_above, num_simulations)
+    });
+
+    Ok((
+        count_above as f64 / num_simulations as f64,
+        standard_error(count_above, num_simulations),
+        num_simulations,
+    ))
+}
+
 #[pymodule]
 fn garch_monte_carlo(_py: Python, m: &PyModule) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(calculate_probability_plain, m)?)?;
+    m.add_function(wrap_pyfunction!(calculate_probability_plain_adaptive, m)?)?;
     m.add_function(wrap_pyfunction!(calculate_probability_only, m)?)?;
+    m.add_function(wrap_pyfunction!(calculate_probability_vr, m)?)?;
+    m.add_function(wrap_pyfunction!(calculate_probability_matrix, m)?)?;
+    m.add_function(wrap_pyfunction!(register_returns, m)?)?;
+    m.add_function(wrap_pyfunction!(unregister_returns, m)?)?;
     Ok(())
 }
 
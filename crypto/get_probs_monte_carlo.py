@@ -1,32 +1,34 @@
 import asyncio
 import time
 import pandas as pd
-import sys
 
-from crypto.api.binance import get_latest_bitcoin_price, get_bitcoin_1h_open_price
+from crypto.api.binance import get_bitcoin_1h_open_price
+from crypto.api.price_feed import get_price_feed
 from crypto.api.polymarket.get_event import get_current_event
+from crypto.pricing_backend import get_backend
 from crypto.utils import get_next_hour_timestamp, Asset
 
-try:
-    import garch_monte_carlo
-except ImportError:
-    print("Error: Could not import the 'garch_monte_carlo' module.", file=sys.stderr)
-    sys.exit(1)
+# The Rust extension, or the NumPy backend where it isn't built
+garch_monte_carlo = get_backend()
 
 NUM_SIMULATIONS = 1_000_000
 FILENAME = "../data/btc_1m_log_returns.csv"
 
 if __name__ == "__main__":
-    returns = pd.read_csv(FILENAME)["log_return"].dropna().tolist()
+    # Registered once, the extension reads the array in place on every call
+    returns = garch_monte_carlo.register_returns(pd.read_csv(FILENAME)["log_return"].dropna().to_numpy())
     event = get_current_event(Asset.Bitcoin)
     open_price = get_bitcoin_1h_open_price()
     close_timestamp = get_next_hour_timestamp()
+    price_feed = get_price_feed()
+    price_feed.start_in_thread()
+    price_feed.wait_ready()
 
     while True:
         secs_left = close_timestamp - time.time()
         mins = secs_left // 60
         secs = secs_left % 60
-        current_btc_price = get_latest_bitcoin_price()
+        current_btc_price = price_feed.get_price()
 
         p_fair = garch_monte_carlo.calculate_probability_plain(
             returns=returns,
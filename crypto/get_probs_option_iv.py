@@ -1,11 +1,9 @@
 import pandas as pd
-import matplotlib.pyplot as plt
 from datetime import datetime
-from scipy.interpolate import PchipInterpolator
 import numpy as np
 import time
 
-from crypto.api.binance import get_latest_bitcoin_price
+from crypto.api.price_feed import get_price_feed
 from crypto.api.deribit import fetch_ticker_data, get_bitcoin_0dte_option_chain
 
 
@@ -18,7 +16,7 @@ class OptionDataCache:
     def update_if_needed(self, update_interval_sec=60):
         if time.time() - self.last_update > update_interval_sec:
             options, expiration_timestamp_ms = get_bitcoin_0dte_option_chain()
-            S = get_latest_bitcoin_price()
+            S = get_price_feed().get_price()
             vol_smile = get_vol_smile(options)
             self.iv_interp = smooth_vol_smile(vol_smile)
             self.last_update = time.time()
@@ -50,6 +48,9 @@ def get_vol_smile(options):
     return df_api
 
 def smooth_vol_smile(vol_smile):
+    # scipy and matplotlib are imported where they are used, they take longer to import than the rest
+    from scipy.interpolate import PchipInterpolator
+
     df_unique = vol_smile.groupby('strike')['iv'].mean().reset_index()
     strikes = df_unique['strike'].values
     ivs = df_unique['iv'].values / 100
@@ -66,6 +67,8 @@ def scale_vol_smile(original_iv_interp, T_original_sec, T_target_sec):
     return lambda K: original_iv_interp(K) * scaling_factor
 
 def plot_vol_smile(iv_interp, strike_dense, iv_dense, df_api, min_expiry, S):
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(12, 7))
     calls_api = df_api[df_api['type'] == 'call']
     puts_api = df_api[df_api['type'] == 'put']
@@ -83,6 +86,8 @@ def plot_vol_smile(iv_interp, strike_dense, iv_dense, df_api, min_expiry, S):
     plt.show()
 
 def plot_pdf(S_grid, pdf):
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(10,6))
     plt.plot(S_grid, pdf, color='green')
     plt.title('Risk-Neutral PDF for BTC in 1 Hour')
@@ -113,6 +118,9 @@ def get_prob_above_below(price, S, iv_interp, ms_left):
 
 if __name__ == "__main__":
     cache = OptionDataCache()
+    price_feed = get_price_feed()
+    price_feed.start_in_thread()
+    price_feed.wait_ready()
 
     mins=33
     secs=0
@@ -120,7 +128,7 @@ if __name__ == "__main__":
 
     while True:
         cache.update_if_needed()
-        S = get_latest_bitcoin_price()
+        S = price_feed.get_price()
         target_price = 113699.24
         prob_above, prob_below = get_prob_above_below(
             target_price,
@@ -0,0 +1,226 @@
+import datetime
+import json
+import math
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+# Latency stages stored with every tick, as <stage>_ms
+LATENCY_STAGES = ('fetch.wait', 'pricing.wait', 'plan', 'diff', 'place', 'tick')
+
+TICK_DTYPE = np.dtype([
+    ('time', 'f8'),
+    ('seq', 'u8'),
+    ('btc_price', 'f8'),
+    ('open_price', 'f8'),
+    ('p_fair', 'f8'),
+    ('p_fair_age', 'f4'),
+    ('best_bid', 'f4'),
+    ('best_ask', 'f4'),
+    ('best_bid_size', 'f4'),
+    ('best_ask_size', 'f4'),
+    ('yes_shares', 'f4'),
+    ('no_shares', 'f4'),
+    ('cash', 'f8'),
+    ('num_orders', 'u2'),
+    ('num_fills', 'u2'),
+] + [(f"{stage.replace('.', '_')}_ms", 'f4') for stage in LATENCY_STAGES])
+
+# One row per planned order and per fill, seq points at the tick
+ORDER_DTYPE = np.dtype([
+    ('time', 'f8'),
+    ('seq', 'u8'),
+    ('kind', 'u1'),
+    ('type', 'u1'),
+    ('side', 'u1'),
+    ('price', 'f4'),
+    ('size', 'f4'),
+    ('best_bid', 'f4'),
+    ('best_ask', 'f4'),
+    ('p_fair', 'f8'),
+])
+
+STREAM_DTYPES = {'ticks': TICK_DTYPE, 'orders': ORDER_DTYPE}
+
+KIND_PLANNED = 0
+KIND_FILLED = 1
+TYPES = ('YES', 'NO')
+SIDES = ('BUY', 'SELL')
+
+# Records waiting for the writer thread, beyond that new records are dropped
+MAX_QUEUED_RECORDS = 100_000
+WRITE_BATCH_SIZE = 10_000
+FLUSH_INTERVAL_SECS = 1.0
+
+
+def _nan(x):
+    return math.nan if x is None else x
+
+
+def _day(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%Y%m%d")
+
+
+class TickJournal:
+    """Append-only binary journal of the bot loop, one file pair per day.
+
+    <directory>/<YYYYMMDD>.ticks and .orders hold raw TICK_DTYPE / ORDER_DTYPE records,
+    <YYYYMMDD>.json the dtypes. begin_tick() numbers a tick before anything is recorded for
+    it, so its orders and its tick row share a seq. record_tick()/record_order() only
+    enqueue a tuple; a daemon thread batches them into NumPy arrays and appends them to the files. The
+    queue is bounded, so a stalled disk drops records (num_dropped) instead of growing
+    memory or blocking the loop. Read back with load_journal().
+    """
+
+    def __init__(self, directory, max_queued_records=MAX_QUEUED_RECORDS):
+        self.directory = directory
+        self.seq = 0
+        self.num_written = 0
+        self.num_dropped = 0
+
+        self._queue = queue.Queue(maxsize=max_queued_records)
+        self._thread = None
+        self._files = {}
+
+    def start(self):
+        if self._thread is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # A restart within the day continues the day's seq, so it stays unique per file
+        day = _day(time.time())
+        self.seq = max(self.seq, *(_last_seq(os.path.join(self.directory, f"{day}.{stream}"), dtype)
+                                   for stream, dtype in STREAM_DTYPES.items()))
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def begin_tick(self):
+        self.seq += 1
+        return self.seq
+
+    def record_tick(self, btc_price, open_price, p_fair, p_fair_age, order_book, yes_shares, no_shares, cash,
+                    num_orders, num_fills, latencies):
+        """order_book is an OrderBook, latencies {stage: secs} of this tick."""
+        self._put('ticks', (
+            time.time(), self.seq, _nan(btc_price), _nan(open_price), _nan(p_fair), _nan(p_fair_age),
+            order_book.best_bid_price, order_book.best_ask_price,
+            order_book.best_bid_size, order_book.best_ask_size,
+            yes_shares, no_shares, cash, num_orders, num_fills,
+            *(_nan(latencies.get(stage)) * 1000 for stage in LATENCY_STAGES),
+        ))
+
+    def record_order(self, kind, order, best_bid, best_ask, p_fair):
+        self._put('orders', (
+            time.time(), self.seq, kind, TYPES.index(order['type']), SIDES.index(order['side']),
+            order['price'], order['size'], best_bid, best_ask, _nan(p_fair),
+        ))
+
+    def _put(self, stream, record):
+        if self._thread is None:
+            return
+        try:
+            self._queue.put_nowait((stream, record))
+        except queue.Full:
+            self.num_dropped += 1
+
+    def _run(self):
+        closing = False
+        while not closing:
+            batch = []
+            try:
+                item = self._queue.get(timeout=FLUSH_INTERVAL_SECS)
+                while item is not None:
+                    batch.append(item)
+                    if len(batch) >= WRITE_BATCH_SIZE:
+                        break
+                    item = self._queue.get_nowait()
+                else:
+                    closing = True
+            except queue.Empty:
+                pass
+            if batch:
+                self._write(batch)
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+    def _write(self, batch):
+        by_file = {}
+        for stream, record in batch:
+            by_file.setdefault((_day(record[0]), stream), []).append(record)
+        for (day, stream), records in by_file.items():
+            f = self._get_file(day, stream)
+            np.array(records, dtype=STREAM_DTYPES[stream]).tofile(f)
+            f.flush()
+            self.num_written += len(records)
+
+    def _get_file(self, day, stream):
+        if (day, stream) not in self._files:
+            # A new day closes the previous day's files
+            for key in [k for k in self._files if k[0] != day]:
+                self._files.pop(key).close()
+            header = os.path.join(self.directory, f"{day}.json")
+            if not os.path.exists(header):
+                with open(header, 'w') as f:
+                    json.dump({'ticks': TICK_DTYPE.descr, 'orders': ORDER_DTYPE.descr}, f)
+            path = os.path.join(self.directory, f"{day}.{stream}")
+            # A crash can leave a partial record at the end, appending after it would shift every later record
+            if os.path.exists(path):
+                size = os.path.getsize(path)
+                partial = size % STREAM_DTYPES[stream].itemsize
+                if partial:
+                    print(f"Dropping a partial record ({partial} bytes) at the end of {path}")
+                    os.truncate(path, size - partial)
+            self._files[(day, stream)] = open(path, 'ab')
+        return self._files[(day, stream)]
+
+
+def _last_seq(path, dtype):
+    """seq of the last whole record in path, 0 if there is none."""
+    try:
+        count = os.path.getsize(path) // dtype.itemsize
+        if count == 0:
+            return 0
+        with open(path, 'rb') as f:
+            f.seek((count - 1) * dtype.itemsize)
+            return int(np.frombuffer(f.read(dtype.itemsize), dtype=dtype)['seq'][0])
+    except OSError:
+        return 0
+
+
+def _load(path, dtype):
+    if not os.path.exists(path):
+        return np.empty(0, dtype=dtype)
+    # A crash can leave a partial record at the end
+    count = os.path.getsize(path) // dtype.itemsize
+    return np.fromfile(path, dtype=dtype, count=count)
+
+
+def load_journal(directory, day=None):
+    """(ticks, orders) structured arrays of one day (YYYYMMDD, default today)."""
+    day = day or _day(time.time())
+    with open(os.path.join(directory, f"{day}.json")) as f:
+        header = json.load(f)
+    dtypes = {stream: np.dtype([tuple(field) for field in descr]) for stream, descr in header.items()}
+    ticks = _load(os.path.join(directory, f"{day}.ticks"), dtypes['ticks'])
+    orders = _load(os.path.join(directory, f"{day}.orders"), dtypes['orders'])
+    return ticks, orders
+
+
+if __name__ == "__main__":
+    import sys
+
+    ticks, orders = load_journal(*sys.argv[1:3])
+    fills = orders[orders['kind'] == KIND_FILLED]
+    print(f"{len(ticks)} ticks, {len(orders)} orders, {len(fills)} fills")
+    if len(ticks):
+        print(f"tick p50={np.nanpercentile(ticks['tick_ms'], 50):.1f}ms p99={np.nanpercentile(ticks['tick_ms'], 99):.1f}ms")
@@ -0,0 +1,186 @@
+import math
+import signal
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# Log-linear buckets (HDR style): every bucket is ~1% wider than the previous one,
+# covering 1µs to ~100s with ~1% relative error on every percentile.
+MIN_VALUE_US = 1.
+MAX_VALUE_US = 100e6
+BUCKET_GROWTH = 1.01
+NUM_BUCKETS = int(math.log(MAX_VALUE_US / MIN_VALUE_US, BUCKET_GROWTH)) + 2
+
+# Rolling window, made of NUM_SLOTS slots that are recycled one at a time
+WINDOW_SECS = 300
+NUM_SLOTS = 10
+SUMMARY_INTERVAL_SECS = 60
+PERCENTILES = (50, 95, 99)
+
+
+def _bucket(value_us):
+    if value_us <= MIN_VALUE_US:
+        return 0
+    return min(int(math.log(value_us / MIN_VALUE_US, BUCKET_GROWTH)) + 1, NUM_BUCKETS - 1)
+
+
+def _bucket_value(bucket):
+    # Upper edge, so percentiles never under-report
+    return MIN_VALUE_US * BUCKET_GROWTH ** bucket
+
+
+class LatencyHistogram:
+    """Rolling latency histogram of one stage over the last window_secs."""
+
+    def __init__(self, window_secs=WINDOW_SECS, num_slots=NUM_SLOTS):
+        self.slot_secs = window_secs / num_slots
+        self.counts = np.zeros((num_slots, NUM_BUCKETS), dtype=np.int64)
+        self.maxes = np.zeros(num_slots)
+        self.slot_ids = np.full(num_slots, -1, dtype=np.int64)
+        self.total_count = 0
+
+    def record(self, secs, now=None):
+        value_us = secs * 1e6
+        slot_id = int((now or time.time()) / self.slot_secs)
+        slot = slot_id % len(self.slot_ids)
+        if self.slot_ids[slot] != slot_id:
+            self.counts[slot] = 0
+            self.maxes[slot] = 0.
+            self.slot_ids[slot] = slot_id
+        self.counts[slot, _bucket(value_us)] += 1
+        self.maxes[slot] = max(self.maxes[slot], value_us)
+        self.total_count += 1
+
+    def snapshot(self, now=None):
+        """{'count', 'p50', 'p95', 'p99', 'max'} in ms over the window."""
+        slot_id = int((now or time.time()) / self.slot_secs)
+        live = self.slot_ids > slot_id - len(self.slot_ids)
+        counts = self.counts[live].sum(axis=0)
+        count = int(counts.sum())
+        stats = {'count': count}
+        if count == 0:
+            stats.update({f'p{p}': 0. for p in PERCENTILES}, max=0.)
+            return stats
+        cumulative = np.cumsum(counts)
+        for p in PERCENTILES:
+            bucket = int(np.searchsorted(cumulative, math.ceil(count * p / 100)))
+            stats[f'p{p}'] = _bucket_value(bucket) / 1000
+        stats['max'] = float(self.maxes[live].max()) / 1000
+        # A bucket edge can overshoot the largest value actually seen
+        for p in PERCENTILES:
+            stats[f'p{p}'] = min(stats[f'p{p}'], stats['max'])
+        return stats
+
+
+class LatencyRecorder:
+    """Per-stage latency histograms for the bot loop.
+
+    Stages are plain names like 'fetch.book' or 'plan'. Safe to record from the pricing
+    worker thread. A summary line is printed every summary_interval_secs from
+    maybe_print_summary(), and the full table on SIGUSR1 (see install_signal_handler).
+    """
+
+    def __init__(self, window_secs=WINDOW_SECS, summary_interval_secs=SUMMARY_INTERVAL_SECS, name=None):
+        self.name = name
+        self.window_secs = window_secs
+        self.summary_interval_secs = summary_interval_secs
+        self.histograms = {}
+        # Latest value per stage, e.g. for the tick journal
+        self.last = {}
+        self.last_summary = time.time()
+        # Set by the signal handler, the table is printed by the loop
+        self.table_requested = False
+        self._lock = threading.Lock()
+
+    def record(self, stage, secs):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = LatencyHistogram(self.window_secs)
+            histogram.record(secs)
+            self.last[stage] = secs
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    async def timed(self, stage, awaitable):
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            return {stage: h.snapshot() for stage, h in sorted(self.histograms.items())}
+
+    def summary_line(self):
+        parts = [f"{stage} p50={s['p50']:.1f} p99={s['p99']:.1f} max={s['max']:.1f}"
+                 for stage, s in self.snapshot().items() if s['count'] > 0]
+        return "latency(ms) " + " | ".join(parts)
+
+    def format_table(self):
+        lines = [f"[{self.name}]"] if self.name else []
+        lines += [f"{'stage':<24}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms, last {self.window_secs}s)"]
+        for stage, s in self.snapshot().items():
+            lines.append(f"{stage:<24}{s['count']:>8}{s['p50']:>10.2f}{s['p95']:>10.2f}{s['p99']:>10.2f}{s['max']:>10.2f}")
+        return "\n".join(lines)
+
+    def request_table(self):
+        """Signal-safe: takes no lock and doesn't print, the next maybe_print_summary() does."""
+        self.table_requested = True
+
+    def maybe_print_summary(self):
+        if self.table_requested:
+            self.table_requested = False
+            print(self.format_table())
+        now = time.time()
+        if now - self.last_summary >= self.summary_interval_secs:
+            self.last_summary = now
+            print(self.summary_line())
+
+    def install_signal_handler(self, signum=getattr(signal, 'SIGUSR1', None)):
+        """kill -USR1 <pid> prints the full latency table at the end of the next tick."""
+        if signum is None:
+            return
+        signal.signal(signum, lambda *_: self.request_table())
+
+
+class StartupTimer:
+    """Wall time of each startup phase, reported once when the bot quotes for the first time."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = []
+        self.reported = False
+
+    def add(self, phase, secs):
+        self.phases.append((phase, secs))
+
+    @contextmanager
+    def phase(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start)
+
+    async def timed(self, phase, awaitable):
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.add(phase, time.perf_counter() - start)
+
+    def report(self):
+        self.reported = True
+        parts = [f"{phase} {secs:.2f}s" for phase, secs in self.phases]
+        # Phases can overlap, the total is wall time since the timer started
+        return f"startup {time.perf_counter() - self.start:.2f}s: " + " | ".join(parts)
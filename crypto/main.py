@@ -1,121 +1,132 @@
+import time
+# Reported with the startup phases, `python -X importtime` breaks it down per module
+IMPORT_START = time.perf_counter()
+
 import asyncio
-from time import sleep
-import httpx
-from crypto.api.binance import get_latest_bitcoin_price, get_bitcoin_1h_open_price, get_latest_bitcoin_price_async
-from crypto.api.polymarket.account import cancel_order, place_order, get_client, \
-    get_my_trade_history_async, get_my_open_orders_async, update_allowances
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from crypto.api.binance import get_latest_bitcoin_price, get_bitcoin_1h_open_price
+from crypto.api.price_feed import get_price_feed
+from crypto.api.http_client import create_http_client, warm_up
+from crypto.api.polymarket.account import cancel_orders_async, place_orders_async, get_client, \
+    get_my_open_orders_async, update_allowances, refresh_api_creds, cached_allowances_set, save_cached_api_creds
+from crypto.api.polymarket.fills import FillStore
 from crypto.api.polymarket.get_event import get_current_event
-from crypto.api.polymarket.get_orderbook import get_order_book_with_token_ids_async
+from crypto.api.polymarket.book_stream import OrderBookStream
 from crypto.candle_manager import CandleManager
-import time
+from crypto.fill_sim import QueueFillSimulator
+from crypto.journal import KIND_FILLED, KIND_PLANNED, TickJournal
+from crypto.latency import LatencyRecorder, StartupTimer
+from crypto.order_book import OrderBook, as_order_book
+from crypto.order_diff import diff_orders
+from crypto.pricing_backend import get_backend
+from crypto.pricing_pipeline import PricingPipeline
+from crypto.recording import RecordingBuilder
+from crypto.rollover import RolloverScheduler
+import csv
 import math
+import numpy as np
 import threading
-import pandas as pd
 import os
-import sys
 import datetime
 
 from crypto.tests.simulate_event import get_mock_data, get_mock_p_fair
-from crypto.utils import Asset, get_next_hour_timestamp
-try:
-    import garch_monte_carlo
-except ImportError:
-    print("Error: Could not import the 'garch_monte_carlo' module.", file=sys.stderr)
-    sys.exit(1)
+from crypto.utils import Asset, get_binance_symbol, get_next_hour_timestamp
+# The Rust extension, or the NumPy backend where it isn't built
+garch_monte_carlo = get_backend()
+
+IMPORT_SECS = time.perf_counter() - IMPORT_START
 
 FILENAME = "../data/btc_1m_log_returns.csv"
+JOURNAL_DIR = "../journal"
+# Between attempts to switch to the next event after the current one closed
+SWITCH_RETRY_DELAY_SECS = 5
+
+BOT_CONFIG = {
+    "PORTFOLIO_SIZE": 10.,
+    "MAX_POSITION_PERCENT": 0.5,
+    "MAX_PAYOUT_PERCENT": 2.0, # Max payout (profit) as % of portfolio
+    "RISK_THRESHOLD": 0.005, # 0.5 %
+    "LIMIT_ORDER_SIZE": 10,
+    "LOOP_DELAY_SECS": 0,
+    "NUM_SIMULATIONS": 1_000_000, # Upper bound with ADAPTIVE_MC
+    "ADAPTIVE_MC": True, # Stop simulating once the error can't move the rounded bid/ask
+    "MC_BATCH_SIZE": 20_000,
+    "MC_Z": 3.0, # Standard errors between p_fair and the nearest quote boundary
+    "MAX_P_FAIR_AGE_SECS": 2.0, # Wait for a fresh p_fair instead of quoting on an older one
+    "FILL_MODEL": "queue", # Paper fills: "queue" tracks depth and queue position, "touch" fills once the price trades through
+    "FAST_START": True, # Reuse the cached L2 API creds instead of deriving them on every start
+    "RECORD_DIR": None, # Save every event as a replayable recording, e.g. "../recordings"
+}
+
+BOT_CONFIG["MAX_INVENTORY"] = BOT_CONFIG["PORTFOLIO_SIZE"] * BOT_CONFIG["MAX_POSITION_PERCENT"]
+BOT_CONFIG["MAX_PAYOUT"] = BOT_CONFIG["PORTFOLIO_SIZE"] * BOT_CONFIG["MAX_PAYOUT_PERCENT"]
+
+
+def make_config(**overrides):
+    """BOT_CONFIG with overrides, the derived limits recomputed."""
+    config = {**BOT_CONFIG, **overrides}
+    config["MAX_INVENTORY"] = config["PORTFOLIO_SIZE"] * config["MAX_POSITION_PERCENT"]
+    config["MAX_PAYOUT"] = config["PORTFOLIO_SIZE"] * config["MAX_PAYOUT_PERCENT"]
+    return config
+
+
+def read_log_returns(filename):
+    """The log_return column of a candle file, without the pandas import on the startup path."""
+    with open(filename, newline='') as f:
+        return [float(row['log_return']) for row in csv.DictReader(f)
+                if row['log_return'] not in ('', 'nan', 'NaN')]
+
 
 def to_size(x):
     return max(round(float(x), 2), 0.)
 
 
-def is_matching(a, b):
-    return a['type'] == b['type'] and a['side'] == b['side'] and math.isclose(a['price'], b['price'])
-
-
-def less_than(a, b):
-    return a <= b + 1e-6
-
-
 # If previous Limit Order (Pending Order) was executed
 # We assume Limit Orders are executed if better than the best offer
 def was_executed(order_book, limit_order):
-    bids = order_book['bids']
-    asks = order_book['asks']
-    best_bid_price = float(bids[0]['price']) if len(bids) > 0 else 0.
-    best_ask_price = float(asks[0]['price']) if len(asks) > 0 else 1.
     o = limit_order
-    if o['type'] == 'YES':
-        if o['side'] == 'BUY':
-            price_matched = math.isclose(best_bid_price, o['price'])
-            return not price_matched and best_bid_price < o['price']
-        elif o['side'] == 'SELL':
-            price_matched = math.isclose(best_ask_price, o['price'])
-            return not price_matched and best_ask_price > o['price']
-    elif o['type'] == 'NO':
-        if o['side'] == 'BUY':
-            best_bid_price_no = 1. - best_ask_price
-            price_matched = math.isclose(best_bid_price_no, o['price'])
-            return not price_matched and best_bid_price_no < o['price']
-        elif o['side'] == 'SELL':
-            best_ask_price_no = 1. - best_bid_price
-            price_matched = math.isclose(best_ask_price_no, o['price'])
-            return not price_matched and best_ask_price_no > o['price']
+    book = as_order_book(order_book)
+    if o['type'] == 'NO':
+        book = book.no_view()
+    elif o['type'] != 'YES':
+        return False
+    tick = book.tick(o['price'])
+    if o['side'] == 'BUY':
+        return book.best_bid_tick < tick
+    elif o['side'] == 'SELL':
+        return book.best_ask_tick > tick
     return False
 
 
 # If order matches an opposing order in the order_book and will be executed immediately
 def order_matches_order_book(order, order_book):
-    bids = order_book['bids']
-    asks = order_book['asks']
-    best_bid_price = float(bids[0]['price']) if len(bids) > 0 else 0.
-    best_ask_price = float(asks[0]['price']) if len(asks) > 0 else 1.
     o = order
-    if o['type'] == 'YES':
-        if o['side'] == 'BUY':
-            is_matching = math.isclose(best_ask_price, o['price'])
-            return is_matching or o['price'] > best_ask_price
-        elif o['side'] == 'SELL':
-            is_matching = math.isclose(best_bid_price, o['price'])
-            return is_matching or o['price'] < best_bid_price
-    elif o['type'] == 'NO':
-        if o['side'] == 'BUY':
-            best_ask_price_no = 1. - best_bid_price
-            is_matching = math.isclose(best_ask_price_no, o['price'])
-            return is_matching or o['price'] > best_ask_price_no
-        elif o['side'] == 'SELL':
-            best_bid_price_no = 1. - best_ask_price
-            is_matching = math.isclose(best_bid_price_no, o['price'])
-            return is_matching or o['price'] < best_bid_price_no
-
+    book = as_order_book(order_book)
+    if o['type'] == 'NO':
+        book = book.no_view()
+    elif o['type'] != 'YES':
+        return False
+    tick = book.tick(o['price'])
+    if o['side'] == 'BUY':
+        return tick >= book.best_ask_tick
+    elif o['side'] == 'SELL':
+        return tick <= book.best_bid_tick
     return False
 
 def get_market_sell_value(position, order_book):
-    bids = order_book['bids']
-    asks = order_book['asks']
     p = position
-    size = p['size']
-    value = 0.
+    book = as_order_book(order_book)
     if p['type'] == 'YES':
-        for bid in bids:
-            price = float(bid['price'])
-            size_matched = min(size, float(bid['size']))
-            value += size_matched * price
-            size -= size_matched
-            if size < 0.01:
-                return value
+        return book.market_sell_value(p['size'])
     elif p['type'] == 'NO':
-        for ask in asks:
-            price = 1. - float(ask['price'])
-            size_matched = min(size, float(ask['size']))
-            value += size_matched * price
-            size -= size_matched
-            if size < 0.01:
-                return value
-    return value
+        return book.no_view().market_sell_value(p['size'])
+    return 0.
 
 class MarketMakerBot:
-    def __init__(self, config, asset: Asset, get_open_price, get_latest_price, get_current_event, get_close_timestamp):
+    def __init__(self, config, asset: Asset, get_open_price, get_latest_price, get_current_event, get_close_timestamp,
+                 client=None, price_feed=None, returns_filename=FILENAME, journal_dir=None, returns=None,
+                 offline=False):
         self.yes_shares = 0.
         self.no_shares = 0.
         self.longs = 0.
@@ -125,102 +136,242 @@ class MarketMakerBot:
         self.pending_orders = []
         self.pending_trades = []
         self.config = config
+        self.fill_sim = QueueFillSimulator() if config.get('FILL_MODEL', 'queue') == 'queue' else None
 
         self.get_latest_price = get_latest_price
         self.get_open_price = get_open_price
         self.get_current_event = get_current_event
         self.get_close_timestamp = get_close_timestamp
 
+        self.startup = StartupTimer()
+        self.startup.add('imports', IMPORT_SECS)
+
         self.close_timestamp = self.get_close_timestamp()
-        self.open_price = self.get_open_price()
-        self.event = self.get_current_event(asset)
+        with self.startup.phase('event'), ThreadPoolExecutor(max_workers=2) as executor:
+            open_price = executor.submit(self.get_open_price)
+            event = executor.submit(self.get_current_event, asset)
+            self.open_price = open_price.result()
+            self.event = event.result()
         self.asset = asset
         self.tick_size = 0.01
 
+        self.returns_filename = returns_filename
         self.file_lock = threading.Lock()
-        self.candle_manager = CandleManager(self.file_lock, self.read_returns())
+        self.candle_manager = CandleManager(self.file_lock, self.read_returns, get_binance_symbol(asset),
+                                            returns_filename)
         self.returns = None
-
-        self.client = get_client()
+        self.returns_handle = None
+        self._retired_handle = None
+        if returns is not None:
+            self.set_returns(returns)
+
+        # A multi-market runtime passes one client and one feed per symbol to all bots.
+        # Created on first use otherwise. An offline bot (a replay) never has one.
+        self._client = client
+        self.offline = offline
+        self._fill_store = None
+        # Fills synced but not yet taken by a tick, see sync_fills
+        self.unapplied_fills = []
+        # Trade history syncs still running in a thread, see flush_fills
+        self.fill_syncs = set()
         self.address = os.getenv("POLYMARKET_PROXY_ADDRESS")
 
         self.cash = config['PORTFOLIO_SIZE']
         self.min_order_size = None
         self.p_fair = None
-
-        self.logs = []
-
+        self.p_fair_se = None
+
+        # Every tick, planned order and fill goes to disk instead of an in-memory list
+        self.journal = TickJournal(journal_dir or os.path.join(JOURNAL_DIR, asset.value))
+        self.num_tick_fills = 0
+        self.recorder = None
+
+        # Created by run_async, live as long as the event loop
+        self.http_client = None
+        self.book_stream = None
+        self.price_feed = price_feed if price_feed is not None else get_price_feed(get_binance_symbol(asset))
+        self.rollover = None
+        self.open_price_task = None
+        self.fetch_task = None
+        # Recordings being saved in a thread, see switch_events
+        self.save_tasks = set()
+
+        self.latency = LatencyRecorder(name=asset.value)
+        self.pricing = PricingPipeline(self.price_p_fair)
+        self.p_fair_age = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            if self.offline:
+                raise RuntimeError("An offline bot has no CLOB client")
+            self._client = get_client(use_cached_creds=self.config.get('FAST_START', True))
+        return self._client
+
+    @property
+    def fill_store(self):
+        if self._fill_store is None:
+            self._fill_store = FillStore(self.client, self.address)
+        return self._fill_store
 
     def run(self):
-        self.read_returns()
-
-        if not update_allowances(self.client):
-           print("Failed to update allowances. Exiting.")
-           exit(1)
+        try:
+            asyncio.run(self.run_async())
+        except asyncio.CancelledError:
+            # SIGTERM, after the cleanup
+            print("Stopped")
+
+    async def run_async(self):
+        with self.startup.phase('returns'):
+            self.read_returns()
+        with self.startup.phase('client'):
+            self.client
 
         # self.candle_manager.start()
         # print(self.event)
 
+        self.latency.install_signal_handler()
+        # kill <pid> shuts down like Ctrl-C: close_market() flushes the journal
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+
+        # One loop and one keep-alive connection pool for the whole life of the bot
+        async with create_http_client() as http_client:
+            allowances = asyncio.create_task(self.startup.timed('allowances', asyncio.to_thread(self.ensure_allowances)))
+            # Only once an earlier run has set them with these creds, orders are rejected until then
+            if not cached_allowances_set(self.client) and not await allowances:
+                print("Failed to update allowances. Exiting.")
+                exit(1)
+            market = asyncio.create_task(self.run_market(http_client))
+            try:
+                if not await allowances:
+                    # Set on an earlier run, quoting goes on
+                    print("Failed to refresh allowances, keeping the ones set on an earlier run")
+                await market
+            finally:
+                market.cancel()
+                await self.close_market()
+
+    def ensure_allowances(self):
+        if not update_allowances(self.client):
+            # The cached creds may have been revoked, derive them once more
+            refresh_api_creds(self.client)
+            if not update_allowances(self.client):
+                return False
+        # The next start can quote before they are refreshed
+        save_cached_api_creds(self.client.get_address(), self.client.creds, allowances_set=True)
+        return True
+
+    async def run_market(self, http_client):
+        """Quotes this bot's market until cancelled. http_client and the price feed may be shared with other bots."""
+        self.http_client = http_client
+        if self.returns is None:
+            self.read_returns()
+        self.journal.start()
+        if self.price_feed.http_client is None:
+            self.price_feed.http_client = self.http_client
+        await self.price_feed.start()
+        await asyncio.gather(
+            self.startup.timed('warm_up', warm_up(self.http_client)),
+            self.startup.timed('book_stream', self.start_book_stream()),
+        )
+        first_tick_start = time.perf_counter()
+        self.rollover = RolloverScheduler(self.asset, self.http_client, self.price_feed,
+                                          get_open_price=self.get_open_price)
+
+        self.start_recording()
+
+        # The fetch for tick n+1 is in flight while tick n is priced and planned
+        self.pricing.reset()
+        self.fetch_task = asyncio.create_task(self.fetch_market_data())
+
         while True:
-            print("_" * 60)
+            print(f"{self.asset.value} " + "_" * 60)
 
             secs_left = self.close_timestamp - time.time()
+            if self.rollover.should_prepare(self.close_timestamp):
+                self.rollover.prepare_in_background(self.close_timestamp)
             if secs_left <= 0:
-                self.switch_events()
+                self.fetch_task.cancel()
+                if not await self.switch_events():
+                    await asyncio.sleep(SWITCH_RETRY_DELAY_SECS)
+                    continue
+                self.fetch_task = asyncio.create_task(self.fetch_market_data())
                 continue
-            mins = secs_left // 60
-            secs = secs_left % 60
-            # print(f"{mins:.0f} Minuten und {secs:.0f} Sekunden verbleibend")
 
             # 440ms
             # fetched_data = get_mock_data()
-            fetched_data = asyncio.run(self.fetch_market_data())
+            # Only the part of the fetch that didn't overlap with the previous tick
+            fetched_data = await self.latency.timed('fetch.wait', self.fetch_task)
+            tick_start = time.perf_counter()
+            # Orders and fills of this tick are journaled with its seq, before the tick row
+            self.journal.begin_tick()
+            fetched_at = time.time()
             current_btc_price = fetched_data[0]
             order_book, yes_token_id, no_token_id = fetched_data[1]
-            my_trade_history = fetched_data[2]
+            order_book = OrderBook.from_dict(order_book)
+            my_new_fills = self.take_fills()
             my_open_orders = fetched_data[3]
 
-            # 70ms
-            self.p_fair = garch_monte_carlo.calculate_probability_plain(
-                returns=self.returns,
+            secs_left = self.close_timestamp - fetched_at
+            mins = secs_left // 60
+            secs = secs_left % 60
+            # print(f"{mins:.0f} Minuten und {secs:.0f} Sekunden verbleibend")
+
+            # 70ms, runs in the pricing worker while the next fetch is in flight
+            self.pricing.submit(
                 current_price=current_btc_price,
                 target_price=self.open_price,
                 horizon_minutes=max(1, round(mins + secs / 60)),
-                num_simulations=self.config['NUM_SIMULATIONS'],
+                input_time=fetched_at,
             )
+            self.fetch_task = asyncio.create_task(self.fetch_market_data())
+
+            # Plan with the freshest completed p_fair, unless it is too stale to quote on
+            pricing = self.pricing.latest
+            if pricing is None or pricing.age() > self.config['MAX_P_FAIR_AGE_SECS']:
+                pricing = await self.latency.timed('pricing.wait', self.pricing.wait_for_result_async(
+                    min_input_time=fetched_at, timeout=self.config['MAX_P_FAIR_AGE_SECS']))
+            if pricing is None:
+                print("No fresh p_fair, skipping tick")
+                continue
+            self.p_fair = pricing.p_fair
+            self.p_fair_se = pricing.p_fair_se
+            self.p_fair_age = pricing.age()
             # self.p_fair = get_mock_p_fair()
-            print(f"p_fair: {self.p_fair}")
+            error = f" ± {self.p_fair_se:.4f} ({pricing.num_simulations} paths)" if self.p_fair_se is not None else ""
+            print(f"p_fair: {self.p_fair}{error} (age: {self.p_fair_age * 1000:.0f}ms, "
+                  f"BTC moved {current_btc_price - pricing.current_price:+.2f} since, "
+                  f"book age: {self.book_stream.age() * 1000:.0f}ms)")
 
-            self.min_order_size = float(order_book['min_order_size'])
-            self.tick_size = float(order_book['tick_size'])
+            self.min_order_size = order_book.min_order_size
+            self.tick_size = order_book.tick_size
+            if self.recorder is not None:
+                self.recorder.add(fetched_at, current_btc_price, order_book, self.p_fair)
 
             # Inventory
-            # my_trades = self.get_my_trades(my_trade_history)
+            # my_trades = self.get_my_trades(my_new_fills)
             # self.update_inventory_trades(my_trades)
 
             # self.add_new_orders_to_pending_trades(my_open_orders)
 
             self.update_pending_orders(order_book)
 
-            order_plan = self.get_order_plan(order_book)
+            with self.latency.measure('plan'):
+                order_plan = self.get_order_plan(order_book)
+            num_planned = len(order_plan)
+            for o in order_plan:
+                self.journal.record_order(KIND_PLANNED, o, order_book.best_bid_price, order_book.best_ask_price, self.p_fair)
 
-            order_plan = self.reduce_order_plan_size_based_on_pending_orders(order_plan)
+            # Keep matching orders, resize or cancel the others, place what is missing
+            with self.latency.measure('diff'):
+                order_plan = self.reconcile_with_pending_orders(order_plan)
 
             # self.remove_pending_orders_from_orders(my_open_orders)
 
-            # Keep matching orders, reduce current orders, cancel all other
-            # orders_to_cancel = self.remove_order_plan_from_open_orders(order_plan, my_open_orders)
-
-            # Cancel orders
-            # for o in orders_to_cancel:
-            # cancel_order(self.client, o['id'])
-
-            # Filter out orders
-            # order_plan = [o for o in order_plan if o['size'] >= self.min_order_size]
-
-            # Execute orders
-            # self.execute_orders(order_plan, yes_token_id, no_token_id)
-            self.simulate_execute_orders(order_plan, order_book)
+            # diff = diff_orders(order_plan, my_open_orders, self.tick_size, self.min_order_size)
+            # await self.execute_orders(diff.orders_to_place(), yes_token_id, no_token_id, diff.orders_to_cancel())
+            with self.latency.measure('place'):
+                self.simulate_execute_orders(order_plan, order_book)
 
             print(f"Pending: {self.pending_orders}")
             self.print_positions(order_book)
@@ -228,7 +379,20 @@ class MarketMakerBot:
 
             position_value = self.get_position_value(order_book)
             print(f"PnL: ${(self.cash + position_value - self.config['PORTFOLIO_SIZE']):.2f}")
-            time.sleep(self.config['LOOP_DELAY_SECS'])
+
+            self.latency.record('tick', time.perf_counter() - tick_start)
+            if not self.startup.reported:
+                self.startup.add('first_tick', time.perf_counter() - first_tick_start)
+                print(self.startup.report())
+            self.journal.record_tick(
+                btc_price=current_btc_price, open_price=self.open_price, p_fair=self.p_fair,
+                p_fair_age=self.p_fair_age, order_book=order_book, yes_shares=self.yes_shares,
+                no_shares=self.no_shares, cash=self.cash, num_orders=num_planned,
+                num_fills=self.num_tick_fills, latencies=self.latency.last,
+            )
+            self.num_tick_fills = 0
+            self.latency.maybe_print_summary()
+            await asyncio.sleep(self.config['LOOP_DELAY_SECS'])
 
     def print_positions(self, order_book):
         yes_value = 0.
@@ -298,32 +462,18 @@ class MarketMakerBot:
 
     def add_order_to_logs(self, order, order_book):
         o = order
-        bids = order_book['bids']
-        asks = order_book['asks']
-        best_bid_price = float(bids[0]['price']) if len(bids) > 0 else 0.
-        best_ask_price = float(asks[0]['price']) if len(asks) > 0 else 1.
-        self.logs.append({
-            'time': time.time(),
-            'type': o['type'],
-            'side': o['side'],
-            'size': o['size'],
-            'price': o['price'],
-            'best_bid': best_bid_price,
-            'best_ask': best_ask_price,
-            'p_fair': self.p_fair
-        })
-
-    def print_logs(self):
-        print("#" * 100)
-
-        for o in self.logs:
-            dt_object = datetime.datetime.fromtimestamp(o['time'])
-            time_string = dt_object.strftime("%H:%M:%S")
-            print(f"{time_string} {o['side']} {o['type']} @ ${o['price']:.2f} | Best Bid: ${o['best_bid']:.2f}, Best Ask: ${o['best_ask']:.2f}, P_fair: {o['p_fair']}")
+        book = as_order_book(order_book)
+        best_bid_price = book.best_bid_price
+        best_ask_price = book.best_ask_price
+        self.journal.record_order(KIND_FILLED, o, best_bid_price, best_ask_price, self.p_fair)
+        self.num_tick_fills += 1
 
-        print("#" * 100)
+        time_string = datetime.datetime.now().strftime("%H:%M:%S")
+        print(f"{time_string} {o['side']} {o['type']} @ ${o['price']:.2f} | Best Bid: ${best_bid_price:.2f}, Best Ask: ${best_ask_price:.2f}, P_fair: {self.p_fair}")
 
     def update_pending_orders(self, order_book):
+        if self.fill_sim is not None:
+            return self.update_pending_orders_queued(order_book)
         new_pending_orders = []
         self.pending_longs = 0.
         self.pending_shorts = 0.
@@ -333,53 +483,268 @@ class MarketMakerBot:
                 print("LIMIT")
                 self.update_inventory(o)
                 self.add_order_to_logs(o, order_book)
-                self.print_logs()
             else:
                 new_pending_orders.append(o)
                 self.update_pending_inventory(o)
 
         self.pending_orders = new_pending_orders
 
+    def update_pending_orders_queued(self, order_book):
+        fills = self.fill_sim.update(order_book)
+        new_pending_orders = []
+        self.pending_longs = 0.
+        self.pending_shorts = 0.
+
+        for o in self.pending_orders:
+            filled = fills.get(o.get('sim_id'), 0.)
+            if filled > 0:
+                print("LIMIT")
+                self.fill_order(o, filled, o['price'], order_book)
+                o['size'] -= filled
+            if o['size'] > 1e-9:
+                new_pending_orders.append(o)
+                self.update_pending_inventory(o)
+
+        self.pending_orders = new_pending_orders
+
+    def fill_order(self, order, size, price, order_book):
+        executed = {**order, 'size': size, 'price': price}
+        self.update_inventory(executed)
+        self.add_order_to_logs(executed, order_book)
+
+    def price_p_fair(self, current_price, target_price, horizon_minutes):
+        # Called from the pricing worker thread, the Rust kernel releases the GIL
+        with self.latency.measure('pricing'):
+            if self.config.get('ADAPTIVE_MC') and hasattr(garch_monte_carlo, 'calculate_probability_plain_adaptive'):
+                return garch_monte_carlo.calculate_probability_plain_adaptive(
+                    returns=self.get_returns_arg(),
+                    current_price=current_price,
+                    target_price=target_price,
+                    horizon_minutes=horizon_minutes,
+                    boundaries=self.get_quote_boundaries(),
+                    z=self.config['MC_Z'],
+                    batch_size=self.config['MC_BATCH_SIZE'],
+                    max_simulations=self.config['NUM_SIMULATIONS'],
+                )
+            return garch_monte_carlo.calculate_probability_plain(
+                returns=self.get_returns_arg(),
+                current_price=current_price,
+                target_price=target_price,
+                horizon_minutes=horizon_minutes,
+                num_simulations=self.config['NUM_SIMULATIONS'],
+            )
+
+    async def close_market(self):
+        """Stops what run_market left running, on shutdown or before it is run again after a crash.
+        Recordings still being saved are waited for, the journal is flushed and closed."""
+        for task in (self.fetch_task, self.open_price_task):
+            if task is not None:
+                task.cancel()
+        self.fetch_task = None
+        self.open_price_task = None
+        if self.rollover is not None:
+            await self.rollover.close()
+            self.rollover = None
+        if self.book_stream is not None:
+            await self.book_stream.stop()
+            self.book_stream = None
+        if self.save_tasks:
+            await asyncio.gather(*self.save_tasks, return_exceptions=True)
+        # Flushes what is still queued, run_market starts the journal again
+        await asyncio.to_thread(self.journal.close)
+
+    async def start_book_stream(self):
+        if self.book_stream is not None:
+            await self.book_stream.stop()
+        self.book_stream = OrderBookStream(self.event, http_client=self.http_client)
+        await self.book_stream.start()
+        await self.book_stream.wait_ready()
+
+    async def get_order_book_with_token_ids(self, timeout=5.):
+        # Read from memory, the stream resyncs itself on gaps
+        deadline = time.time() + timeout
+        while not self.book_stream.book.is_synced and time.time() < deadline:
+            await asyncio.sleep(0.01)
+        if not self.book_stream.book.is_synced:
+            # Never quote on a book with a gap, the fetch is retried
+            raise RuntimeError(f"Order book not in sync after {timeout:.0f}s")
+        return self.book_stream.get_order_book_with_token_ids()
 
     async def fetch_market_data(self, max_retries=5, initial_delay=1.0, backoff_factor=2.0):
         market_condition_id = self.event['markets'][0]['conditionId']
-        async with httpx.AsyncClient() as http_client:
-            for attempt in range(max_retries):
-                try:
-                    tasks = [
-                        get_latest_bitcoin_price_async(http_client),
-                        get_order_book_with_token_ids_async(http_client, self.event),
-                        get_my_trade_history_async(self.client, condition_id=market_condition_id),
-                        get_my_open_orders_async(self.client, condition_id=market_condition_id),
-                    ]
-                    results = await asyncio.gather(*tasks, return_exceptions=True)
-                    errors = [res for res in results if isinstance(res, Exception)]
-                    if not errors:
-                        return results
-                    if attempt >= max_retries - 1:
-                        raise errors[0]
-                except Exception as e:
-                    if attempt >= max_retries - 1:
-                        raise e
-
-                delay = (initial_delay * (backoff_factor ** attempt))
-                await asyncio.sleep(delay)
+        for attempt in range(max_retries):
+            try:
+                tasks = [
+                    self.latency.timed('fetch.price', self.price_feed.get_price_async()),
+                    self.latency.timed('fetch.book', self.get_order_book_with_token_ids()),
+                    self.latency.timed('fetch.trades', self.sync_fills(market_condition_id)),
+                    self.latency.timed('fetch.open_orders', get_my_open_orders_async(self.client, condition_id=market_condition_id)),
+                ]
+                results = await self.latency.timed('fetch', asyncio.gather(*tasks, return_exceptions=True))
+                errors = [res for res in results if isinstance(res, Exception)]
+                if not errors:
+                    return results
+                if attempt >= max_retries - 1:
+                    raise errors[0]
+            except Exception as e:
+                if attempt >= max_retries - 1:
+                    raise e
+
+            delay = (initial_delay * (backoff_factor ** attempt))
+            await asyncio.sleep(delay)
 
         return results
 
-    def switch_events(self):
+    async def sync_fills(self, condition_id):
+        # The store marks fills seen as soon as it returns them, a retried fetch won't return
+        # them again: they stay on the bot until a tick takes them, whatever else failed.
+        # Shielded, the thread keeps running when the fetch is cancelled (at the rollover)
+        # and its fills must not be dropped with the fetch
+        sync = asyncio.ensure_future(self.fill_store.sync_async(condition_id))
+        self.fill_syncs.add(sync)
+        sync.add_done_callback(self._on_fills_synced)
+        await asyncio.shield(sync)
+
+    def _on_fills_synced(self, sync):
+        self.fill_syncs.discard(sync)
+        if not sync.cancelled() and sync.exception() is None:
+            self.unapplied_fills.extend(sync.result())
+
+    def take_fills(self):
+        fills, self.unapplied_fills = self.unapplied_fills, []
+        return fills
+
+    async def flush_fills(self):
+        """Journals the fills of the current market that no tick took, before it is left:
+        syncs still in flight are waited for, then one last sync catches fills at the close."""
+        if self.fill_syncs:
+            await asyncio.gather(*self.fill_syncs, return_exceptions=True)
+        if not self.offline:
+            try:
+                await self.sync_fills(self.event['markets'][0]['conditionId'])
+            except Exception as e:
+                print(f"Could not sync the last fills: {e}")
+        for fill in self.take_fills():
+            print(f"Fill at the close: {fill}")
+            self.journal.record_order(KIND_FILLED, fill, math.nan, math.nan, self.p_fair)
+
+    async def switch_events(self):
+        # The next event was prepared before the hour, only the open price is new
         print("switching events")
-        sleep(60)
-        self.close_timestamp = self.get_close_timestamp()
-        self.open_price = self.get_open_price()
-        self.event = self.get_current_event(self.asset)
+        switch_start = time.time()
+        try:
+            next_event = await self.rollover.get_next_event(self.close_timestamp)
+        except Exception as e:
+            # Nothing to quote on until the next event shows up, the loop tries again
+            print(f"Could not switch events: {e}")
+            await self.cancel_pending_orders()
+            return False
+        self.open_price = await self.rollover.capture_open_price(next_event.start_timestamp)
+        await self.flush_fills()
+
+        old_stream = self.book_stream
+        self.event = next_event.event
+        self.close_timestamp = next_event.close_timestamp
+        self.book_stream = next_event.book_stream
+        if next_event.tick_size:
+            self.tick_size = next_event.tick_size
+        if next_event.min_order_size:
+            self.min_order_size = next_event.min_order_size
         self.yes_shares = 0.
         self.no_shares = 0.
-        print("event gewechselt")
+        # Orders on the old market can't fill anymore
+        self.pending_orders = []
+        if self.fill_sim is not None:
+            self.fill_sim.retain(())
+        self.pricing.reset()
+        if self.recorder is not None:
+            # Off the loop, the next event is already quoting
+            save_task = asyncio.create_task(asyncio.to_thread(self.save_recording, self.recorder))
+            self.save_tasks.add(save_task)
+            save_task.add_done_callback(self._on_recording_saved)
+        self.start_recording()
+
+        if self.open_price_task is not None:
+            self.open_price_task.cancel()
+        self.open_price_task = asyncio.create_task(self.confirm_open_price(next_event.start_timestamp))
+        if old_stream is not None:
+            await old_stream.stop()
+        await warm_up(self.http_client)
+        print(f"event gewechselt in {time.time() - switch_start:.2f}s, open price {self.open_price}")
+        return True
+
+    async def cancel_pending_orders(self):
+        # Paper orders have no exchange id
+        order_ids = [o['id'] for o in self.pending_orders if 'id' in o]
+        if order_ids:
+            await cancel_orders_async(self.client, order_ids)
+        self.pending_orders = []
+        if self.fill_sim is not None:
+            self.fill_sim.retain(())
+
+    def start_recording(self):
+        if self.config.get('RECORD_DIR'):
+            self.recorder = RecordingBuilder(self.open_price, self.close_timestamp)
+
+    def _on_recording_saved(self, task):
+        self.save_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Saving the recording failed: {task.exception()}")
+
+    def save_recording(self, recorder):
+        if len(recorder) == 0:
+            return
+        directory = os.path.join(self.config['RECORD_DIR'], self.asset.value, str(int(recorder.close_timestamp)))
+        recorder.save(directory)
+        print(f"Saved {len(recorder)} ticks to {directory}")
+
+    async def confirm_open_price(self, start_timestamp):
+        # The first trade after the hour is close to the candle open, swap in the real one once Binance has it
+        open_price = await self.rollover.confirm_open_price(start_timestamp)
+        if open_price is None or self.close_timestamp != start_timestamp + 3600:
+            return
+        if open_price != self.open_price:
+            print(f"open price confirmed {open_price} (provisional {self.open_price})")
+            self.open_price = open_price
+            self.pricing.reset()
+            if self.recorder is not None:
+                self.recorder.open_price = open_price
 
     def read_returns(self):
         with self.file_lock:
-            self.returns = pd.read_csv(FILENAME)["log_return"].dropna().tolist()
+            returns = read_log_returns(self.returns_filename)
+        self.set_returns(returns)
+
+    def set_returns(self, returns):
+        """Keeps the returns as one read-only float64 array, registered with the extension so
+        pricing calls pass a handle instead of converting 100k floats every time."""
+        returns = np.ascontiguousarray(returns, dtype=np.float64)
+        returns.flags.writeable = False
+        old_handle = self.returns_handle
+        self.returns = returns
+        if hasattr(garch_monte_carlo, 'register_returns'):
+            self.returns_handle = garch_monte_carlo.register_returns(returns)
+        # A pricing call may still use the previous returns, they are released one swap later
+        if self._retired_handle is not None:
+            garch_monte_carlo.unregister_returns(self._retired_handle)
+        self._retired_handle = old_handle
+
+    def unregister_returns(self):
+        for handle in (self.returns_handle, self._retired_handle):
+            if handle is not None:
+                garch_monte_carlo.unregister_returns(handle)
+        self.returns_handle = None
+        self._retired_handle = None
+
+    def get_returns_arg(self):
+        return self.returns_handle if self.returns_handle is not None else self.returns
+
+    def get_quote_boundaries(self):
+        """p_fair values at which get_my_best_bid_ask's rounded bid or ask moves by a tick."""
+        a = round(1 / self.tick_size)
+        risk = self.config['RISK_THRESHOLD']
+        # The bid floors p_fair - risk, the ask ceils p_fair + risk
+        return sorted(b for k in range(a + 1) for b in (k / a + risk, k / a - risk) if 0. <= b <= 1.)
 
     def get_my_best_bid_ask(self, best_bid_price, best_ask_price):
         a = 1 / self.tick_size
@@ -420,30 +785,15 @@ class MarketMakerBot:
 
         return sniping_bid, sniping_ask
 
-    def get_my_trades(self, my_trade_history):
-        my_trades = []
-        for taker_trade in my_trade_history:
-            if taker_trade['maker_address'] == self.address:
-                outcome = taker_trade['outcome']
-                my_trades.append({
-                    'order_id': taker_trade['taker_order_id'],
-                    'size': to_size(taker_trade['size']),
-                    'price': self.to_price(taker_trade['price']),
-                    'side': taker_trade['side'],
-                    'type': 'YES' if outcome == 'Up' else 'NO'
-                })
-            else:
-                for maker_trade in taker_trade['maker_orders']:
-                    if maker_trade['maker_address'] == self.address:
-                        outcome = maker_trade['outcome']
-                        my_trades.append({
-                            'order_id': maker_trade['order_id'],
-                            'size': to_size(maker_trade['matched_amount']),
-                            'price': self.to_price(maker_trade['price']),
-                            'side': maker_trade['side'],
-                            'type': 'YES' if outcome == 'Up' else 'NO'
-                        })
-        return my_trades
+    # Only the fills since the last sync, see FillStore
+    def get_my_trades(self, my_new_fills):
+        return [{
+            'order_id': f['order_id'],
+            'size': to_size(f['size']),
+            'price': self.to_price(f['price']),
+            'side': f['side'],
+            'type': f['type']
+        } for f in my_new_fills]
 
     def update_inventory_trades(self, my_trades):
         for trade in my_trades:
@@ -499,47 +849,12 @@ class MarketMakerBot:
         open_order_ids = [o['id'] for o in my_open_orders]
         self.pending_orders = [o for o in self.pending_orders if o['id'] not in open_order_ids]
 
-    def remove_order_plan_from_open_orders(self, order_plan, my_open_orders):
-        matching_open_order_ids = []
-        for order in order_plan:
-            value = order['price'] * order['size']
-            print(
-                f"price: {order['price']}, size: {order['size']}, side: {order['side']}, type: {order['type']}, value: {value:.2f}")
-
-            # Reduce size from orders which already are in open_orders
-            matching_open_orders = [o for o in my_open_orders
-                                    if math.isclose(self.to_price(o['price']), order['price'])
-                                    and o['side'] == order['side']
-                                    and order['type'] == ('YES' if o['outcome'] == 'Up' else 'NO')]
-
-            for o in matching_open_orders:
-                matching_open_order_ids.append(o['id'])
-                size_reduction = float(o['original_size']) - float(o['size_matched'])
-                print(f"Reducing Size (Open Order): {size_reduction}")
-                order['size'] = to_size(order['size'] - size_reduction)
-
-            # Reduce size from orders which already are in pending orders
-            matching_pending_orders = [o for o in self.pending_orders
-                                       if math.isclose(self.to_price(o['price']), order['price'])
-                                       and o['side'] == order['side']
-                                       and order['type'] == o['type']]
-
-            for o in matching_pending_orders:
-                print(f"Reducing Size (Pending Order): {o['size']}")
-                order['size'] = to_size(order['size'] - o['size'])
-
-        orders_to_cancel = [o for o in my_open_orders if o['id'] not in matching_open_order_ids]
-        return orders_to_cancel
-
     def get_order_plan(self, order_book):
-        bids = order_book['bids']
-        asks = order_book['asks']
-        best_bid = bids[0] if len(bids) > 0 else None
-        best_ask = asks[0] if len(asks) > 0 else None
-        best_bid_price = self.to_price(best_bid['price']) if not best_bid is None else 0.
-        best_ask_price = self.to_price(best_ask['price']) if not best_ask is None else 1.
-        best_bid_size = to_size(best_bid['size']) if not best_bid is None else 0.
-        best_ask_size = to_size(best_ask['size']) if not best_ask is None else 0.
+        book = as_order_book(order_book)
+        best_bid_price = self.to_price(book.best_bid_price) if book.has_bids else 0.
+        best_ask_price = self.to_price(book.best_ask_price) if book.has_asks else 1.
+        best_bid_size = to_size(book.best_bid_size)
+        best_ask_size = to_size(book.best_ask_size)
 
         print(f"Best Bid: {best_bid_price}, Best Ask: {best_ask_price}")
 
@@ -626,15 +941,22 @@ class MarketMakerBot:
 
         return order_plan
 
-    def execute_orders(self, order_plan, yes_token_id, no_token_id):
-        for o in order_plan:
-            order_id = place_order(
-                self.client,
-                yes_token_id if o['type'] == 'YES' else no_token_id,
-                o['price'],
-                o['size'],
-                o['side']
-            )
+    async def execute_orders(self, order_plan, yes_token_id, no_token_id, orders_to_cancel=()):
+        # Bulk cancel first so the freed collateral is available, then the whole plan in one batch
+        if orders_to_cancel:
+            canceled = await cancel_orders_async(self.client, [o['id'] for o in orders_to_cancel])
+            print(f"Canceled {sum(canceled.values())}/{len(canceled)} orders")
+
+        orders = [{
+            'token_id': yes_token_id if o['type'] == 'YES' else no_token_id,
+            'price': o['price'],
+            'size': o['size'],
+            'side': o['side'],
+        } for o in order_plan]
+        results = await place_orders_async(self.client, orders)
+
+        for o, r in zip(order_plan, results):
+            order_id = r['order_id']
             if not order_id:
                 continue
 
@@ -647,9 +969,11 @@ class MarketMakerBot:
             })
             print(
                 f"Placed: {o['side']} {o['size']} {o['type']} shares for ${o['price']} (${(o['price'] * o['size']):.2f})")
-            order_value = to_size(o['size']) * self.to_price(o['price'])
+        return results
 
     def simulate_execute_orders(self, order_plan, order_book):
+        if self.fill_sim is not None:
+            return self.simulate_execute_orders_queued(order_plan, order_book)
         order_plan.extend(self.pending_orders)
         new_pending_orders = []
         self.pending_longs = 0.
@@ -660,31 +984,43 @@ class MarketMakerBot:
                 print("Market")
                 self.update_inventory(o)
                 self.add_order_to_logs(o, order_book)
-                self.print_logs()
             else:
                 new_pending_orders.append(o)
                 self.update_pending_inventory(o)
 
         self.pending_orders = new_pending_orders
 
-    # Reduce current orders size by matching open orders size
-    # if is matching and p_size > o_size: cancel pending order
-    def reduce_order_plan_size_based_on_pending_orders(self, order_plan):
+    def simulate_execute_orders_queued(self, order_plan, order_book):
+        # New orders take depth up to their limit and rest at the back of the queue,
+        # resting orders were already filled by update_pending_orders
+        order_plan.extend(self.pending_orders)
+        new_pending_orders = []
         self.pending_longs = 0.
         self.pending_shorts = 0.
-        new_pending_orders = []
-        for p in self.pending_orders:
-            for o in order_plan:
-                if is_matching(o, p) and less_than(p['size'], o['size']):
-                    o['size'] -= p['size']
-                    new_pending_orders.append(p)
-                    self.update_pending_inventory(o)
 
-        order_plan = [o for o in order_plan if o['size'] >= self.min_order_size]
+        for o in order_plan:
+            if 'sim_id' not in o:
+                filled, price = self.fill_sim.place(o, order_book)
+                if filled > 0:
+                    print("Market")
+                    self.fill_order(o, filled, price, order_book)
+                    o['size'] -= filled
+                if 'sim_id' not in o:
+                    continue
+            new_pending_orders.append(o)
+            self.update_pending_inventory(o)
 
         self.pending_orders = new_pending_orders
-        return order_plan
 
+    # Paper trading: our resting orders are the simulated pending orders.
+    # Pending orders that match the plan stay, the others are dropped (canceled),
+    # returns the orders that still have to be placed.
+    def reconcile_with_pending_orders(self, order_plan):
+        diff = diff_orders(order_plan, self.pending_orders, self.tick_size, self.min_order_size)
+        self.pending_orders = diff.keeps
+        if self.fill_sim is not None:
+            self.fill_sim.retain(o['sim_id'] for o in diff.keeps if 'sim_id' in o)
+        return diff.orders_to_place()
 
     def clamp_price(self, x):
         low = self.tick_size
@@ -697,19 +1033,6 @@ class MarketMakerBot:
 
 
 if __name__ == "__main__":
-    BOT_CONFIG = {
-        "PORTFOLIO_SIZE": 10.,
-        "MAX_POSITION_PERCENT": 0.5,
-        "MAX_PAYOUT_PERCENT": 2.0, # Max payout (profit) as % of portfolio
-        "RISK_THRESHOLD": 0.005, # 0.5 %
-        "LIMIT_ORDER_SIZE": 10,
-        "LOOP_DELAY_SECS": 0,
-        "NUM_SIMULATIONS": 1_000_000
-    }
-
-    BOT_CONFIG["MAX_INVENTORY"] = BOT_CONFIG["PORTFOLIO_SIZE"] * BOT_CONFIG["MAX_POSITION_PERCENT"]
-    BOT_CONFIG["MAX_PAYOUT"] = BOT_CONFIG["PORTFOLIO_SIZE"] * BOT_CONFIG["MAX_PAYOUT_PERCENT"]
-
     bot = MarketMakerBot(
         config = BOT_CONFIG,
         asset = Asset.Bitcoin,
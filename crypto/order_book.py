@@ -0,0 +1,166 @@
+import numpy as np
+
+
+class OrderBook:
+    """YES order book on Polymarket's fixed tick grid.
+
+    bid_sizes[i] / ask_sizes[i] hold the resting size at price i * tick_size, so a level lookup
+    is an index and the best bid/ask are tracked as tick indices. An empty bid side reports
+    tick 0 (price 0.) and an empty ask side tick n_ticks (price 1.), like the dict helpers did.
+    no_view() gives the NO book as reversed views of the same arrays, without copying.
+    """
+
+    def __init__(self, bid_sizes, ask_sizes, tick_size=0.01, min_order_size=None,
+                 best_bid_tick=None, best_ask_tick=None, **meta):
+        self.tick_size = float(tick_size)
+        self.n_ticks = len(bid_sizes) - 1
+        self.bid_sizes = bid_sizes
+        self.ask_sizes = ask_sizes
+        self.min_order_size = float(min_order_size) if min_order_size is not None else None
+        self.meta = meta
+
+        self.best_bid_tick = self._find_best_bid() if best_bid_tick is None else best_bid_tick
+        self.best_ask_tick = self._find_best_ask() if best_ask_tick is None else best_ask_tick
+        self._cum_bid_depth = None
+        self._cum_ask_depth = None
+        self._no_view = None
+
+    @classmethod
+    def empty(cls, tick_size=0.01, **kwargs):
+        n_ticks = int(round(1 / float(tick_size)))
+        return cls(np.zeros(n_ticks + 1), np.zeros(n_ticks + 1), tick_size, **kwargs)
+
+    @classmethod
+    def from_dict(cls, order_book):
+        """Parses a /books response (or the book stream's dict) once."""
+        book = cls.empty(
+            tick_size=order_book.get('tick_size') or 0.01,
+            min_order_size=order_book.get('min_order_size'),
+            asset_id=order_book.get('asset_id'),
+            market=order_book.get('market'),
+            hash=order_book.get('hash'),
+            timestamp=order_book.get('timestamp'),
+        )
+        for level in order_book['bids']:
+            book.bid_sizes[book.tick(level['price'])] = float(level['size'])
+        for level in order_book['asks']:
+            book.ask_sizes[book.tick(level['price'])] = float(level['size'])
+        book.best_bid_tick = book._find_best_bid()
+        book.best_ask_tick = book._find_best_ask()
+        return book
+
+    def tick(self, price):
+        return int(round(float(price) / self.tick_size))
+
+    def price(self, tick):
+        return round(tick * self.tick_size, 6)
+
+    @property
+    def has_bids(self):
+        return self.bid_sizes[self.best_bid_tick] > 0
+
+    @property
+    def has_asks(self):
+        return self.ask_sizes[self.best_ask_tick] > 0
+
+    @property
+    def best_bid_price(self):
+        return self.price(self.best_bid_tick)
+
+    @property
+    def best_ask_price(self):
+        return self.price(self.best_ask_tick)
+
+    @property
+    def best_bid_size(self):
+        return float(self.bid_sizes[self.best_bid_tick])
+
+    @property
+    def best_ask_size(self):
+        return float(self.ask_sizes[self.best_ask_tick])
+
+    def set_level(self, side, price, size):
+        """Applies one L2 update, side is 'BUY' for bids and 'SELL' for asks."""
+        tick = self.tick(price)
+        size = float(size)
+        if side.upper() == 'BUY':
+            self.bid_sizes[tick] = size
+            if size > 0 and tick > self.best_bid_tick:
+                self.best_bid_tick = tick
+            elif size == 0 and tick == self.best_bid_tick:
+                self.best_bid_tick = self._find_best_bid(tick)
+        else:
+            self.ask_sizes[tick] = size
+            if size > 0 and tick < self.best_ask_tick:
+                self.best_ask_tick = tick
+            elif size == 0 and tick == self.best_ask_tick:
+                self.best_ask_tick = self._find_best_ask(tick)
+        self._cum_bid_depth = None
+        self._cum_ask_depth = None
+        self._no_view = None
+
+    def no_view(self):
+        """NO book: a NO bid at p is a YES ask at 1 - p, so the sides swap and reverse."""
+        if self._no_view is None:
+            self._no_view = OrderBook(
+                self.ask_sizes[::-1], self.bid_sizes[::-1], self.tick_size, self.min_order_size,
+                best_bid_tick=self.n_ticks - self.best_ask_tick,
+                best_ask_tick=self.n_ticks - self.best_bid_tick,
+                **self.meta,
+            )
+        return self._no_view
+
+    @property
+    def cum_bid_depth(self):
+        """cum_bid_depth[i]: total bid size at price >= i * tick_size."""
+        if self._cum_bid_depth is None:
+            self._cum_bid_depth = np.cumsum(self.bid_sizes[::-1])[::-1]
+        return self._cum_bid_depth
+
+    @property
+    def cum_ask_depth(self):
+        """cum_ask_depth[i]: total ask size at price <= i * tick_size."""
+        if self._cum_ask_depth is None:
+            self._cum_ask_depth = np.cumsum(self.ask_sizes)
+        return self._cum_ask_depth
+
+    def bid_levels(self):
+        """(prices, sizes) of the non-empty bid levels, best first."""
+        ticks = np.flatnonzero(self.bid_sizes)[::-1]
+        return np.round(ticks * self.tick_size, 6), self.bid_sizes[ticks]
+
+    def ask_levels(self):
+        """(prices, sizes) of the non-empty ask levels, best first."""
+        ticks = np.flatnonzero(self.ask_sizes)
+        return np.round(ticks * self.tick_size, 6), self.ask_sizes[ticks]
+
+    def market_sell_value(self, size):
+        """Proceeds of selling size shares into the bids, walking the book."""
+        prices, sizes = self.bid_levels()
+        filled_before = np.cumsum(sizes) - sizes
+        filled = np.clip(size - filled_before, 0., sizes)
+        return float(filled @ prices)
+
+    def to_dict(self):
+        return {
+            **self.meta,
+            'bids': [{'price': str(p), 'size': str(s)} for p, s in zip(*map(np.ndarray.tolist, self.bid_levels()))],
+            'asks': [{'price': str(p), 'size': str(s)} for p, s in zip(*map(np.ndarray.tolist, self.ask_levels()))],
+            'tick_size': str(self.tick_size),
+            'min_order_size': str(self.min_order_size),
+        }
+
+    def _find_best_bid(self, start=None):
+        start = self.n_ticks if start is None else start
+        ticks = np.flatnonzero(self.bid_sizes[:start + 1])
+        return int(ticks[-1]) if len(ticks) > 0 else 0
+
+    def _find_best_ask(self, start=0):
+        ticks = np.flatnonzero(self.ask_sizes[start:])
+        return int(ticks[0]) + start if len(ticks) > 0 else self.n_ticks
+
+
+def as_order_book(order_book):
+    if isinstance(order_book, OrderBook):
+        return order_book
+    return OrderBook.from_dict(order_book)
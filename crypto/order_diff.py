@@ -0,0 +1,92 @@
+from dataclasses import dataclass, field
+
+
+def to_type(order):
+    """Our plan/pending orders carry 'type', CLOB open orders carry 'outcome'."""
+    if 'type' in order:
+        return order['type']
+    return 'YES' if order['outcome'] in ('Up', 'Yes') else 'NO'
+
+
+def remaining_size(order):
+    if 'original_size' in order:
+        return float(order['original_size']) - float(order.get('size_matched') or 0.)
+    return float(order['size'])
+
+
+def order_key(order, tick_size):
+    """(outcome, side, price tick): orders with the same key are interchangeable."""
+    return to_type(order), order['side'].upper(), int(round(float(order['price']) / tick_size))
+
+
+@dataclass
+class OrderDiff:
+    # Live orders that stay untouched and keep their queue position
+    keeps: list = field(default_factory=list)
+    # Live orders to cancel with nothing replacing them at their key
+    cancels: list = field(default_factory=list)
+    # Orders at keys that currently have no live order, or top-ups next to kept orders
+    places: list = field(default_factory=list)
+    # Size changes: the CLOB can't amend, so {'cancel': live order, 'place': new order}
+    resizes: list = field(default_factory=list)
+
+    def orders_to_cancel(self):
+        return self.cancels + [r['cancel'] for r in self.resizes]
+
+    def orders_to_place(self):
+        return self.places + [r['place'] for r in self.resizes]
+
+    def num_api_calls(self):
+        return len(self.cancels) + len(self.places) + 2 * len(self.resizes)
+
+
+def diff_orders(desired, live, tick_size, min_order_size=0.):
+    """Minimal changes that turn the live orders into the desired order plan.
+
+    desired: plan orders {'type', 'side', 'price', 'size'}.
+    live: our resting orders, either pending orders or CLOB open orders.
+    Runs in O(len(desired) + len(live)) plus sorting the distinct keys, and the output
+    order is deterministic. Per key, live orders are kept oldest first (queue priority)
+    as long as they fit into the desired size. A missing size below min_order_size is
+    not placed, since the CLOB would reject it.
+    """
+    wanted = {}
+    for o in desired:
+        key = order_key(o, tick_size)
+        if key in wanted:
+            wanted[key] = {**wanted[key], 'size': wanted[key]['size'] + o['size']}
+        else:
+            wanted[key] = dict(o)
+
+    resting = {}
+    for o in live:
+        resting.setdefault(order_key(o, tick_size), []).append(o)
+
+    diff = OrderDiff()
+    for key in sorted(wanted.keys() | resting.keys()):
+        target = wanted.get(key)
+        orders = resting.get(key, [])
+        target_size = target['size'] if target is not None else 0.
+
+        kept_size = 0.
+        to_cancel = []
+        for o in orders:
+            size = remaining_size(o)
+            if kept_size + size <= target_size + 1e-9:
+                diff.keeps.append(o)
+                kept_size += size
+            else:
+                to_cancel.append(o)
+
+        missing = round(target_size - kept_size, 2)
+        top_up = {**target, 'size': missing} if target is not None and missing >= max(min_order_size, 0.01) else None
+
+        # Replacing one cancelled order with one smaller order is a size change
+        if top_up is not None and to_cancel:
+            diff.resizes.append({'cancel': to_cancel.pop(0), 'place': top_up})
+            top_up = None
+        diff.cancels.extend(to_cancel)
+        if top_up is not None:
+            diff.places.append(top_up)
+
+    return diff
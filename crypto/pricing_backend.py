@@ -0,0 +1,364 @@
+import atexit
+import contextlib
+import itertools
+import math
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# "rust", "numpy", or unset for Rust when the extension is built and NumPy otherwise
+BACKEND_ENV = "PRICING_BACKEND"
+# Paths per vectorized step in a worker, bounds the index matrix to a few MB
+CHUNK_PATHS = 20_000
+# Below this many paths a call runs in the calling process, the pool round trip costs more
+MIN_POOL_PATHS = 100_000
+
+
+def _norm_cdf(x):
+    return 0.5 * math.erfc(-x / math.sqrt(2))
+
+
+def _norm_ppf(p):
+    # Acklam's approximation, vectorized, same as the Rust kernel
+    a = [-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+         1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00]
+    b = [-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+         6.680131188771972e+01, -1.328068155288572e+01]
+    c = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+         -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00]
+    d = [7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00, 3.754408661907416e+00]
+
+    def tail(q):
+        return (((((c[0] * q + c[1]) * q + c[2]) * q + c[3]) * q + c[4]) * q + c[5]) / \
+            ((((d[0] * q + d[1]) * q + d[2]) * q + d[3]) * q + 1)
+
+    p = np.asarray(p, dtype=np.float64)
+    q = p - 0.5
+    r = q * q
+    central = (((((a[0] * r + a[1]) * r + a[2]) * r + a[3]) * r + a[4]) * r + a[5]) * q / \
+        (((((b[0] * r + b[1]) * r + b[2]) * r + b[3]) * r + b[4]) * r + 1)
+    low = tail(np.sqrt(-2 * np.log(np.minimum(p, 0.5))))
+    high = -tail(np.sqrt(-2 * np.log(np.minimum(1 - p, 0.5))))
+    return np.where(p < 0.02425, low, np.where(p > 1 - 0.02425, high, central))
+
+
+def _standard_error(count_above, num_simulations):
+    # Agresti-Coull, as in the Rust kernel
+    n = num_simulations + 4
+    p = (count_above + 2) / n
+    return math.sqrt(p * (1 - p) / n)
+
+
+# Worker side: shared memory segments attached once per process. Segments of per-call arrays
+# are unlinked by the parent after the call, the oldest attachments are closed to unmap them
+_attached = {}
+MAX_ATTACHED = 4
+
+
+def _get_array(name, length):
+    if name not in _attached:
+        while len(_attached) >= MAX_ATTACHED:
+            oldest = next(iter(_attached))
+            shm, _ = _attached.pop(oldest)
+            shm.close()
+        shm = shared_memory.SharedMemory(name=name)
+        _attached[name] = (shm, np.ndarray((length,), dtype=np.float64, buffer=shm.buf))
+    return _attached[name][1]
+
+
+def _count_plain(array, num_paths, seed, current_price, target_price, horizon_minutes):
+    rng = np.random.default_rng(seed)
+    count = 0
+    for start in range(0, num_paths, CHUNK_PATHS):
+        size = min(CHUNK_PATHS, num_paths - start)
+        growth = np.prod(1. + array[rng.integers(0, len(array), (size, horizon_minutes))], axis=1)
+        count += int(np.count_nonzero(current_price * growth > target_price))
+    return count
+
+
+def _count_garch(array, num_paths, seed, omega, alpha, beta, initial_sigma_sq, current_price, target_price,
+                 horizon_minutes):
+    rng = np.random.default_rng(seed)
+    log_barrier = math.log(target_price / current_price)
+    count = 0
+    for start in range(0, num_paths, CHUNK_PATHS):
+        size = min(CHUNK_PATHS, num_paths - start)
+        log_price = np.zeros(size)
+        sigma_sq = np.full(size, initial_sigma_sq)
+        for _ in range(horizon_minutes):
+            simulated_return = np.sqrt(sigma_sq) * array[rng.integers(0, len(array), size)]
+            log_price += simulated_return
+            sigma_sq = omega + alpha * simulated_return ** 2 + beta * sigma_sq
+        count += int(np.count_nonzero(log_price > log_barrier))
+    return count
+
+
+def _count_above_garch(array, num_paths, seed, omega, alpha, beta, initial_sigma_sq, barriers, steps):
+    """(len(steps), len(barriers)) counts of paths whose log price ends above each barrier at each step."""
+    rng = np.random.default_rng(seed)
+    counts = np.zeros((len(steps), len(barriers)), dtype=np.int64)
+    step_index = {step: i for i, step in enumerate(steps)}
+    for start in range(0, num_paths, CHUNK_PATHS):
+        size = min(CHUNK_PATHS, num_paths - start)
+        log_price = np.zeros(size)
+        sigma_sq = np.full(size, initial_sigma_sq)
+        log_prices = np.empty((len(steps), size))
+        for minute in range(1, steps[-1] + 1):
+            simulated_return = np.sqrt(sigma_sq) * array[rng.integers(0, len(array), size)]
+            log_price += simulated_return
+            sigma_sq = omega + alpha * simulated_return ** 2 + beta * sigma_sq
+            if minute in step_index:
+                log_prices[step_index[minute]] = log_price
+        # Sorting the paths and searching the few barriers in them beats searching every path
+        log_prices.sort(axis=1)
+        for i, row in enumerate(log_prices):
+            counts[i] += size - np.searchsorted(row, barriers, side='right')
+    return counts
+
+
+def _sums_vr(array, num_units, seed, omega, alpha, beta, initial_sigma_sq, log_barrier, horizon_minutes,
+             control_sigmas, antithetic, control_variate, qmc):
+    """One replicate of calculate_probability_vr: sums of y, x, x^2 and x*y over its units."""
+    rng = np.random.default_rng(seed)
+    n = len(array)
+    normal_quantiles = _norm_ppf((np.arange(n) + 0.5) / n) if control_variate else None
+    kronecker = np.sqrt(_first_primes(horizon_minutes)) % 1
+    shifts = rng.random(horizon_minutes)
+    sums = np.zeros(4)
+    for start in range(0, num_units, CHUNK_PATHS):
+        size = min(CHUNK_PATHS, num_units - start)
+        if qmc:
+            u = (shifts + np.arange(start, start + size)[:, None] * kronecker) % 1
+            indices = np.minimum((u * n).astype(np.int64), n - 1)
+        else:
+            indices = rng.integers(0, n, (size, horizon_minutes))
+
+        def simulate(indices):
+            log_price = np.zeros(size)
+            control_log_price = np.zeros(size)
+            sigma_sq = np.full(size, initial_sigma_sq)
+            for step in range(horizon_minutes):
+                simulated_return = np.sqrt(sigma_sq) * array[indices[:, step]]
+                log_price += simulated_return
+                sigma_sq = omega + alpha * simulated_return ** 2 + beta * sigma_sq
+                if control_variate:
+                    control_log_price += control_sigmas[step] * normal_quantiles[indices[:, step]]
+            return (log_price > log_barrier).astype(float), (control_log_price > log_barrier).astype(float)
+
+        y, x = simulate(indices)
+        if antithetic:
+            y_mirror, x_mirror = simulate(n - 1 - indices)
+            y, x = 0.5 * (y + y_mirror), 0.5 * (x + x_mirror)
+        sums += [y.sum(), x.sum(), (x * x).sum(), (x * y).sum()]
+    return sums
+
+
+def _run_task(task, name, length, num_paths, seed, args):
+    return task(_get_array(name, length), num_paths, seed, *args)
+
+
+def _first_primes(count):
+    primes = []
+    for candidate in itertools.count(2):
+        if len(primes) == count:
+            return np.array(primes, dtype=np.float64)
+        if all(candidate % p for p in primes if p * p <= candidate):
+            primes.append(candidate)
+
+
+class NumpyBackend:
+    """The Rust kernel's GARCH(1,1) bootstrap in NumPy, for hosts without the extension.
+
+    Same functions and signatures as the garch_monte_carlo module. Paths are split across a
+    process pool: returns are copied once into shared memory by register_returns, workers
+    attach to it by name and only get a path count and a seed per task. Calls with a plain
+    array or list copy it into shared memory for the duration of the call.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.executor = None
+        self._segments = {}
+        self._next_handle = itertools.count(1)
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def register_returns(self, returns):
+        array = np.ascontiguousarray(returns, dtype=np.float64)
+        shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=np.float64, buffer=shm.buf)[:] = array
+        with self._lock:
+            handle = next(self._next_handle)
+            # The array itself serves in-process calls, so no view of the segment outlives it
+            self._segments[handle] = (shm, array)
+        return handle
+
+    def unregister_returns(self, handle):
+        with self._lock:
+            segment = self._segments.pop(handle, None)
+        if segment is None:
+            return False
+        segment[0].close()
+        segment[0].unlink()
+        return True
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+        for handle in list(self._segments):
+            self.unregister_returns(handle)
+
+    def calculate_probability_plain(self, returns, current_price, target_price, horizon_minutes, num_simulations):
+        count = self._count(_count_plain, returns, num_simulations,
+                            (current_price, target_price, horizon_minutes))
+        return count / num_simulations
+
+    def calculate_probability_plain_adaptive(self, returns, current_price, target_price, horizon_minutes, boundaries,
+                                             z=3.0, batch_size=20_000, max_simulations=1_000_000):
+        boundaries = np.sort(np.asarray(boundaries, dtype=np.float64))
+        with self._registered(returns) as handle:
+            count_above = num_simulations = 0
+            batch = max(batch_size, 1)
+            while num_simulations < max_simulations:
+                size = min(batch, max_simulations - num_simulations)
+                count_above += self._count(_count_plain, handle, size, (current_price, target_price, horizon_minutes))
+                num_simulations += size
+
+                p = count_above / num_simulations
+                margin = z * _standard_error(count_above, num_simulations)
+                i = np.searchsorted(boundaries, p - margin)
+                if i == len(boundaries) or boundaries[i] > p + margin:
+                    break
+                batch = num_simulations
+        return count_above / num_simulations, _standard_error(count_above, num_simulations), num_simulations
+
+    def calculate_probability_only(self, omega, alpha, beta, last_resid, last_sigma_sq, residuals, current_price,
+                                   target_price, horizon_minutes, num_simulations):
+        initial_sigma_sq = omega + alpha * last_resid ** 2 + beta * last_sigma_sq
+        count = self._count(_count_garch, residuals, num_simulations,
+                            (omega, alpha, beta, initial_sigma_sq, current_price, target_price, horizon_minutes))
+        return count / num_simulations
+
+    def calculate_probability_matrix(self, omega, alpha, beta, last_resid, last_sigma_sq, residuals, current_price,
+                                     target_prices, horizons, num_simulations):
+        if any(h < 1 for h in horizons):
+            raise ValueError("horizons must be at least 1 minute")
+        if any(math.isnan(p) for p in target_prices):
+            raise ValueError("target_prices must not contain NaN")
+        if len(horizons) == 0 or len(target_prices) == 0:
+            return [[0.] * len(horizons) for _ in target_prices]
+        if len(self._resolve(residuals)) == 0:
+            raise ValueError("residuals must not be empty")
+        initial_sigma_sq = omega + alpha * last_resid ** 2 + beta * last_sigma_sq
+        barriers = np.log(np.asarray(target_prices, dtype=np.float64) / current_price)
+        steps = sorted(set(int(h) for h in horizons))
+        args = (omega, alpha, beta, initial_sigma_sq, barriers, steps)
+        if num_simulations < MIN_POOL_PATHS or self.max_workers == 1:
+            counts = _count_above_garch(self._resolve(residuals), num_simulations, np.random.SeedSequence(), *args)
+        else:
+            with self._registered(residuals) as handle:
+                shares = [num_simulations // self.max_workers + (i < num_simulations % self.max_workers)
+                          for i in range(self.max_workers)]
+                counts = sum(self._map(_count_above_garch, handle, shares, args))
+
+        columns = [steps.index(int(h)) for h in horizons]
+        return (counts[columns].T / num_simulations).tolist()
+
+    def calculate_probability_vr(self, omega, alpha, beta, last_resid, last_sigma_sq, residuals, current_price,
+                                 target_price, horizon_minutes, num_simulations, antithetic=True, control_variate=True,
+                                 qmc=True, num_replicates=16):
+        if num_replicates < 2:
+            raise ValueError("num_replicates must be at least 2")
+        array = self._resolve(residuals)
+        if np.any(np.diff(array) < 0):
+            residuals = array = np.sort(array)
+        initial_sigma_sq = omega + alpha * last_resid ** 2 + beta * last_sigma_sq
+        log_barrier = math.log(target_price / current_price)
+
+        # E[sigma_{t+1}^2] = omega + (alpha E[z^2] + beta) E[sigma_t^2]
+        mean_sq = float(np.mean(array ** 2))
+        control_sigma_sq = [initial_sigma_sq]
+        for _ in range(horizon_minutes - 1):
+            control_sigma_sq.append(omega + (alpha * mean_sq + beta) * control_sigma_sq[-1])
+        control_sigmas = np.sqrt(control_sigma_sq)
+        control_variance = float(np.sum(control_sigma_sq))
+        control_mean = _norm_cdf(-log_barrier / math.sqrt(control_variance)) if control_variance > 0 \
+            else float(log_barrier < 0)
+
+        units = max(num_simulations // num_replicates // (2 if antithetic else 1), 1)
+        args = (omega, alpha, beta, initial_sigma_sq, log_barrier, horizon_minutes, control_sigmas,
+                antithetic, control_variate, qmc)
+        with self._registered(residuals) as handle:
+            sums = np.array(self._map(_sums_vr, handle, [units] * num_replicates, args))
+
+        # One regression coefficient pooled over the replicates, as in the Rust kernel
+        covariance = np.sum(sums[:, 3] - sums[:, 0] * sums[:, 1] / units)
+        variance = np.sum(sums[:, 2] - sums[:, 1] ** 2 / units)
+        coefficient = covariance / variance if control_variate and variance > 0 else 0.
+        estimates = sums[:, 0] / units - coefficient * (sums[:, 1] / units - control_mean)
+        return (float(np.clip(estimates.mean(), 0., 1.)),
+                float(estimates.std(ddof=1) / math.sqrt(num_replicates)))
+
+    def _resolve(self, returns):
+        if isinstance(returns, (int, np.integer)):
+            with self._lock:
+                return self._segments[int(returns)][1]
+        return np.ascontiguousarray(returns, dtype=np.float64)
+
+    @contextlib.contextmanager
+    def _registered(self, returns):
+        """A handle to returns, registering an array or list only for the duration of the call."""
+        if isinstance(returns, (int, np.integer)):
+            yield int(returns)
+            return
+        handle = self.register_returns(returns)
+        try:
+            yield handle
+        finally:
+            self.unregister_returns(handle)
+
+    def _count(self, task, returns, num_paths, args):
+        if num_paths < MIN_POOL_PATHS or self.max_workers == 1:
+            return task(self._resolve(returns), num_paths, np.random.SeedSequence(), *args)
+        with self._registered(returns) as handle:
+            shares = [num_paths // self.max_workers + (i < num_paths % self.max_workers)
+                      for i in range(self.max_workers)]
+            return sum(self._map(task, handle, shares, args))
+
+    def _map(self, task, handle, path_counts, args):
+        seeds = np.random.SeedSequence().spawn(len(path_counts))
+        if self.max_workers == 1:
+            array = self._resolve(handle)
+            return [task(array, n, seed, *args) for n, seed in zip(path_counts, seeds)]
+        with self._lock:
+            shm, array = self._segments[handle]
+            if self.executor is None:
+                # Not forked: the bot runs threads (price feeds, the event loop) a fork would copy mid-state
+                self.executor = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+        futures = [self.executor.submit(_run_task, task, shm.name, len(array), n, seed, args)
+                   for n, seed in zip(path_counts, seeds)]
+        return [f.result() for f in futures]
+
+
+def get_backend(name=None):
+    """The garch_monte_carlo extension, or a NumpyBackend with the same functions.
+
+    name (or $PRICING_BACKEND) picks one, by default the extension if it's built.
+    """
+    name = name or os.environ.get(BACKEND_ENV)
+    if name != "numpy":
+        try:
+            import garch_monte_carlo
+            return garch_monte_carlo
+        except ImportError:
+            if name == "rust":
+                raise
+            print("garch_monte_carlo is not built ('maturin develop' in crypto/garch_monte_carlo), "
+                  "pricing with the NumPy backend", file=sys.stderr)
+    return NumpyBackend()
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class PricingResult:
+    p_fair: float
+    current_price: float
+    horizon_minutes: int
+    # When the market data behind this price was fetched / when the simulation finished
+    input_time: float
+    completed_time: float
+    # Monte Carlo error and path count, None if price_fn only returns p_fair
+    p_fair_se: float = None
+    num_simulations: int = None
+
+    def age(self, now=None):
+        """Seconds since the inputs of this p_fair were fetched."""
+        return (now or time.time()) - self.input_time
+
+
+class PricingPipeline:
+    """Runs the p_fair simulation in a worker thread while the next market-data fetch is in flight.
+
+    At most one simulation runs at a time. Requests that arrive while it is busy replace each
+    other, so when the worker frees up it prices the freshest inputs instead of working
+    through a backlog. The planner reads `latest`, the freshest completed result.
+    """
+
+    def __init__(self, price_fn):
+        # price_fn(current_price, target_price, horizon_minutes) -> p_fair or (p_fair, se, num_simulations),
+        # must release the GIL
+        self.price_fn = price_fn
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pricing")
+        self.latest = None
+        self.num_dropped = 0
+
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._running = False
+        self._queued = None
+        self._completed = threading.Condition(self._lock)
+
+    def submit(self, current_price, target_price, horizon_minutes, input_time=None):
+        with self._lock:
+            job = (current_price, target_price, horizon_minutes, input_time or time.time(), self._generation)
+            if self._running:
+                if self._queued is not None:
+                    self.num_dropped += 1
+                self._queued = job
+                return
+            self._running = True
+        self.executor.submit(self._work, job)
+
+    def reset(self):
+        """Forgets results priced for another event, e.g. after switching markets."""
+        with self._lock:
+            self._generation += 1
+            self._queued = None
+            self.latest = None
+
+    def wait_for_result(self, min_input_time=0., timeout=None):
+        """Blocks until a result priced from inputs fetched at or after min_input_time is available.
+        None on timeout, an older result is exactly what the caller waited to replace."""
+        with self._completed:
+            ready = self._completed.wait_for(
+                lambda: self.latest is not None and self.latest.input_time >= min_input_time, timeout)
+            return self.latest if ready else None
+
+    async def wait_for_result_async(self, min_input_time=0., timeout=None):
+        return await asyncio.to_thread(self.wait_for_result, min_input_time, timeout)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _work(self, job):
+        while job is not None:
+            current_price, target_price, horizon_minutes, input_time, generation = job
+            try:
+                estimate = self.price_fn(current_price, target_price, horizon_minutes)
+                p_fair, p_fair_se, num_simulations = estimate if isinstance(estimate, tuple) else (estimate, None, None)
+                result = PricingResult(p_fair, current_price, horizon_minutes, input_time, time.time(),
+                                       p_fair_se, num_simulations)
+            except Exception as e:
+                print(f"Pricing failed: {e}")
+                result = None
+
+            with self._lock:
+                is_current = result is not None and generation == self._generation
+                if is_current and (self.latest is None or result.input_time >= self.latest.input_time):
+                    self.latest = result
+                    self._completed.notify_all()
+                job, self._queued = self._queued, None
+                if job is None:
+                    self._running = False
@@ -0,0 +1,106 @@
+import json
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+from crypto.order_book import OrderBook
+
+# One .npy file per array, so every array can be memory-mapped on its own
+ARRAYS = ('timestamps', 'btc_prices', 'bid_sizes', 'ask_sizes', 'p_fair')
+
+
+@dataclass
+class Recording:
+    """One hourly event as arrays: tick i is timestamps[i], btc_prices[i] and the YES book
+    bid_sizes[i] / ask_sizes[i] on the tick grid (see OrderBook). p_fair is optional."""
+    timestamps: np.ndarray
+    btc_prices: np.ndarray
+    bid_sizes: np.ndarray
+    ask_sizes: np.ndarray
+    open_price: float
+    close_timestamp: float
+    tick_size: float = 0.01
+    min_order_size: float = 5.
+    p_fair: np.ndarray = None
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def order_book(self, i):
+        # Rows of a memory-mapped recording are read-only views, nothing is copied
+        return OrderBook(self.bid_sizes[i], self.ask_sizes[i], self.tick_size, self.min_order_size)
+
+
+def save_recording(directory, recording):
+    os.makedirs(directory, exist_ok=True)
+    for name in ARRAYS:
+        array = getattr(recording, name)
+        if array is not None:
+            np.save(os.path.join(directory, f"{name}.npy"), np.asarray(array))
+    with open(os.path.join(directory, "meta.json"), 'w') as f:
+        json.dump({
+            'open_price': recording.open_price,
+            'close_timestamp': recording.close_timestamp,
+            'tick_size': recording.tick_size,
+            'min_order_size': recording.min_order_size,
+        }, f)
+
+
+def load_recording(directory, mmap_mode='r'):
+    """mmap_mode='r' maps the arrays instead of reading them, pass None to load into memory."""
+    with open(os.path.join(directory, "meta.json")) as f:
+        meta = json.load(f)
+    arrays = {}
+    for name in ARRAYS:
+        path = os.path.join(directory, f"{name}.npy")
+        arrays[name] = np.load(path, mmap_mode=mmap_mode) if os.path.exists(path) else None
+    return Recording(**arrays, **meta)
+
+
+class RecordingBuilder:
+    """Collects the live loop's ticks of one event, save() writes them as a Recording."""
+
+    def __init__(self, open_price, close_timestamp):
+        self.open_price = open_price
+        self.close_timestamp = close_timestamp
+        self.tick_size = None
+        self.min_order_size = None
+        self.timestamps = []
+        self.btc_prices = []
+        self.bid_sizes = []
+        self.ask_sizes = []
+        self.p_fair = []
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def add(self, timestamp, btc_price, order_book, p_fair=None):
+        if self.tick_size is None:
+            self.tick_size = order_book.tick_size
+            self.min_order_size = order_book.min_order_size
+        elif order_book.tick_size != self.tick_size:
+            # The grid changed mid event, the arrays can't hold both
+            print(f"Tick size changed to {order_book.tick_size}, not recording this tick")
+            return
+        self.timestamps.append(timestamp)
+        self.btc_prices.append(btc_price)
+        self.bid_sizes.append(np.array(order_book.bid_sizes))
+        self.ask_sizes.append(np.array(order_book.ask_sizes))
+        self.p_fair.append(np.nan if p_fair is None else p_fair)
+
+    def to_recording(self):
+        return Recording(
+            timestamps=np.array(self.timestamps),
+            btc_prices=np.array(self.btc_prices),
+            bid_sizes=np.array(self.bid_sizes),
+            ask_sizes=np.array(self.ask_sizes),
+            open_price=self.open_price,
+            close_timestamp=self.close_timestamp,
+            tick_size=self.tick_size or 0.01,
+            min_order_size=self.min_order_size or 5.,
+            p_fair=np.array(self.p_fair),
+        )
+
+    def save(self, directory):
+        save_recording(directory, self.to_recording())
@@ -0,0 +1,163 @@
+import contextlib
+import math
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from crypto.main import MarketMakerBot
+from crypto.recording import load_recording
+from crypto.utils import Asset
+
+FILL_DTYPE = np.dtype([
+    ('time', 'f8'),
+    ('type', 'U3'),
+    ('side', 'U4'),
+    ('price', 'f8'),
+    ('size', 'f8'),
+])
+
+
+class VirtualClock:
+    """Replay time: jumps from one recorded timestamp to the next, nothing sleeps."""
+
+    def __init__(self, now=0.):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def advance_to(self, timestamp):
+        self.now = max(self.now, float(timestamp))
+
+
+class ReplayJournal:
+    """Stands in for the bot's TickJournal and keeps the fills in memory."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.fills = []
+
+    def record_order(self, kind, order, best_bid, best_ask, p_fair):
+        # The bot only journals planned orders from its live loop, everything here is a fill
+        self.fills.append((self.clock.time(), order['type'], order['side'], order['price'], order['size']))
+
+    def record_tick(self, **kwargs):
+        pass
+
+
+@dataclass
+class ReplayResult:
+    timestamps: np.ndarray
+    # Mark to market: cash plus what the positions would fetch in the book, minus the starting cash
+    pnl: np.ndarray
+    yes_shares: np.ndarray
+    no_shares: np.ndarray
+    cash: np.ndarray
+    fills: np.ndarray
+    # After the market resolved against the open price
+    final_pnl: float
+    num_skipped: int
+    elapsed_secs: float
+
+    def summary(self):
+        return (f"{len(self.timestamps)} ticks in {self.elapsed_secs:.2f}s, {len(self.fills)} fills, "
+                f"max YES {self.yes_shares.max(initial=0):.2f}, max NO {self.no_shares.max(initial=0):.2f}, "
+                f"min PnL ${self.pnl.min(initial=0):.2f}, final PnL ${self.final_pnl:.2f}")
+
+
+def make_offline_bot(config, recording, asset=Asset.Bitcoin, returns=None):
+    """A MarketMakerBot that never touches the network: event, prices and client come from the recording."""
+    return MarketMakerBot(
+        config=config,
+        asset=asset,
+        get_open_price=lambda: recording.open_price,
+        get_latest_price=lambda: float(recording.btc_prices[0]),
+        get_current_event=lambda asset: {},
+        get_close_timestamp=lambda: recording.close_timestamp,
+        offline=True,
+        returns=returns,
+    )
+
+
+def replay(recording, config, price_fn=None, asset=Asset.Bitcoin, returns=None, reprice=False):
+    """Runs the bot's plan/execute logic over every tick of a recording under a virtual clock.
+
+    p_fair comes from the recording, ticks without a recorded p_fair are priced with
+    price_fn(current_price, target_price, horizon_minutes) or skipped if there is none.
+    reprice=True ignores the recorded p_fair and prices every tick with the bot's own
+    Monte Carlo (returns and config['NUM_SIMULATIONS']).
+    """
+    start = time.perf_counter()
+    bot = make_offline_bot(config, recording, asset, returns)
+    clock = VirtualClock(float(recording.timestamps[0]) if len(recording) else 0.)
+    journal = bot.journal = ReplayJournal(clock)
+    if reprice:
+        price_fn = bot.price_p_fair
+
+    n = len(recording)
+    pnl = np.zeros(n)
+    yes_shares = np.zeros(n)
+    no_shares = np.zeros(n)
+    cash = np.zeros(n)
+    num_skipped = 0
+
+    # The bot prints every step, printing to None is a no-op
+    with contextlib.redirect_stdout(None):
+        for i in range(n):
+            clock.advance_to(recording.timestamps[i])
+            book = recording.order_book(i)
+            btc_price = float(recording.btc_prices[i])
+
+            p_fair = float(recording.p_fair[i]) if recording.p_fair is not None and not reprice else math.nan
+            if math.isnan(p_fair) and price_fn is not None:
+                secs_left = recording.close_timestamp - clock.time()
+                p_fair = price_fn(btc_price, recording.open_price, max(1, round(secs_left / 60)))
+                if isinstance(p_fair, tuple):
+                    p_fair = p_fair[0]
+
+            bot.min_order_size = book.min_order_size
+            bot.tick_size = book.tick_size
+            if not math.isnan(p_fair):
+                bot.p_fair = p_fair
+                bot.update_pending_orders(book)
+                order_plan = bot.get_order_plan(book)
+                order_plan = bot.reconcile_with_pending_orders(order_plan)
+                bot.simulate_execute_orders(order_plan, book)
+            else:
+                num_skipped += 1
+
+            yes_shares[i] = bot.yes_shares
+            no_shares[i] = bot.no_shares
+            cash[i] = bot.cash
+            pnl[i] = bot.cash + bot.get_position_value(book) - config['PORTFOLIO_SIZE']
+
+    bot.unregister_returns()
+
+    # Up resolves to 1 if the close is at or above the open
+    final_price = float(recording.btc_prices[-1]) if n else recording.open_price
+    yes_payout = 1. if final_price >= recording.open_price else 0.
+    final_pnl = bot.cash + bot.yes_shares * yes_payout + bot.no_shares * (1. - yes_payout) - config['PORTFOLIO_SIZE']
+
+    return ReplayResult(
+        timestamps=np.asarray(recording.timestamps),
+        pnl=pnl,
+        yes_shares=yes_shares,
+        no_shares=no_shares,
+        cash=cash,
+        fills=np.array(journal.fills, dtype=FILL_DTYPE),
+        final_pnl=final_pnl,
+        num_skipped=num_skipped,
+        elapsed_secs=time.perf_counter() - start,
+    )
+
+
+if __name__ == "__main__":
+    import sys
+
+    from crypto.main import BOT_CONFIG
+    from crypto.tests.simulate_event import get_mock_recording
+
+    recording = load_recording(sys.argv[1]) if len(sys.argv) > 1 else get_mock_recording()
+    result = replay(recording, BOT_CONFIG)
+    print(result.summary())
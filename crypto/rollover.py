@@ -0,0 +1,154 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from crypto.api.binance import get_bitcoin_1h_open_price
+from crypto.api.polymarket.book_stream import OrderBookStream
+from crypto.api.polymarket.get_event import get_up_or_down_event
+from crypto.api.polymarket.get_orderbook import get_token_ids
+from crypto.utils import Asset
+
+# Start resolving the next event this long before the hour
+PREFETCH_SECS = 120
+RETRY_DELAY_SECS = 5
+# How long the switch itself keeps trying when the next event wasn't prepared in time
+PREPARE_TIMEOUT_SECS = 30
+# Binance may need a moment to publish the new 1h candle
+OPEN_PRICE_RETRIES = 20
+OPEN_PRICE_RETRY_DELAY_SECS = 0.5
+
+
+@dataclass
+class PreparedEvent:
+    event: dict
+    # The event runs from start_timestamp to close_timestamp
+    start_timestamp: int
+    close_timestamp: int
+    yes_token_id: str
+    no_token_id: str
+    book_stream: OrderBookStream
+    tick_size: float = None
+    min_order_size: float = None
+
+
+class RolloverScheduler:
+    """Prepares the next hourly event ahead of time so the bot can switch within one tick.
+
+    prepare() resolves the next hour's event, its token ids and tick/min size metadata and
+    subscribes to its order book while the current event is still being quoted.
+    capture_open_price() takes the first spot price after the boundary from the price feed,
+    and confirm_open_price() later replaces it with the open of the new 1h candle.
+    """
+
+    def __init__(self, asset: Asset, http_client, price_feed, get_event=get_up_or_down_event,
+                 get_open_price=get_bitcoin_1h_open_price, prefetch_secs=PREFETCH_SECS):
+        self.asset = asset
+        self.http_client = http_client
+        self.price_feed = price_feed
+        self.get_event = get_event
+        self.get_open_price = get_open_price
+        self.prefetch_secs = prefetch_secs
+
+        self.next_event = None
+        self._task = None
+
+    def should_prepare(self, close_timestamp):
+        due = close_timestamp - time.time() <= self.prefetch_secs
+        prepared = self.next_event is not None and self.next_event.start_timestamp == close_timestamp
+        running = self._task is not None and not self._task.done()
+        return due and not prepared and not running
+
+    def prepare_in_background(self, close_timestamp):
+        # Until the hour ends, from then on the switch retries
+        self._task = asyncio.create_task(self._prepare_until_done(close_timestamp, deadline=close_timestamp))
+
+    async def get_next_event(self, close_timestamp, timeout=PREPARE_TIMEOUT_SECS):
+        """The prepared event starting at close_timestamp, prepared now if it isn't yet.
+        Raises TimeoutError if it can't be prepared within timeout."""
+        if self._task is not None and not self._task.done():
+            try:
+                await self._task
+            except Exception:
+                pass
+        if self.next_event is None or self.next_event.start_timestamp != close_timestamp:
+            await self._prepare_until_done(close_timestamp, deadline=time.time() + timeout)
+        next_event, self.next_event = self.next_event, None
+        return next_event
+
+    async def prepare(self, close_timestamp):
+        # The next event starts when the current one closes, its slug uses the ET start hour
+        start_et = datetime.fromtimestamp(close_timestamp, ZoneInfo("America/New_York"))
+        event = await asyncio.to_thread(self.get_event, self.asset, start_et.day, start_et.month, start_et.hour)
+        yes_token_id, no_token_id = get_token_ids(event)
+        if not yes_token_id or not no_token_id:
+            raise ValueError("Could not determine 'yes' or 'no' token ID from event data.")
+
+        book_stream = OrderBookStream(event, http_client=self.http_client)
+        await book_stream.start()
+        try:
+            await book_stream.wait_ready()
+        except BaseException:
+            await book_stream.stop()
+            raise
+        book = book_stream.book
+
+        self.next_event = PreparedEvent(
+            event=event,
+            start_timestamp=close_timestamp,
+            close_timestamp=close_timestamp + 3600,
+            yes_token_id=yes_token_id,
+            no_token_id=no_token_id,
+            book_stream=book_stream,
+            tick_size=float(book.tick_size) if book.tick_size else None,
+            min_order_size=float(book.min_order_size) if book.min_order_size else None,
+        )
+        print(f"Prepared next event {event.get('slug', '')}")
+        return self.next_event
+
+    async def close(self):
+        """Cancels a preparation in flight and stops the prepared event's book stream."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except BaseException:
+                pass
+            self._task = None
+        if self.next_event is not None:
+            await self.next_event.book_stream.stop()
+            self.next_event = None
+
+    async def capture_open_price(self, start_timestamp, timeout=2.):
+        """First spot price at or after the boundary, as soon as it arrives."""
+        await asyncio.sleep(max(0., start_timestamp - time.time()))
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            for ts, price in self.price_feed.get_history():
+                if ts >= start_timestamp:
+                    return price
+            await asyncio.sleep(0.01)
+        return await self.price_feed.get_price_async()
+
+    async def confirm_open_price(self, start_timestamp):
+        """Open of the 1h candle starting at start_timestamp, None if Binance doesn't have it in time."""
+        for _ in range(OPEN_PRICE_RETRIES):
+            try:
+                return await asyncio.to_thread(self.get_open_price, start_time=start_timestamp)
+            except Exception as e:
+                print(f"Open price not available yet: {e}")
+            await asyncio.sleep(OPEN_PRICE_RETRY_DELAY_SECS)
+        return None
+
+    async def _prepare_until_done(self, close_timestamp, deadline):
+        while True:
+            try:
+                return await self.prepare(close_timestamp)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Could not prepare next event yet: {e}")
+            if time.time() + RETRY_DELAY_SECS > deadline:
+                raise TimeoutError(f"Could not prepare the event starting at {close_timestamp}")
+            await asyncio.sleep(RETRY_DELAY_SECS)
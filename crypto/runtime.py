@@ -0,0 +1,99 @@
+import asyncio
+import functools
+import signal
+
+from crypto.api.binance import get_bitcoin_1h_open_price, get_latest_bitcoin_price
+from crypto.api.http_client import create_http_client, warm_up
+from crypto.api.polymarket.account import get_client, update_allowances
+from crypto.api.polymarket.get_event import get_current_event
+from crypto.api.price_feed import get_price_feed
+from crypto.main import BOT_CONFIG, MarketMakerBot
+from crypto.utils import Asset, get_binance_symbol, get_next_hour_timestamp
+
+RESTART_DELAY_SECS = 5
+
+
+def get_returns_filename(asset: Asset):
+    """1m log returns of the asset's spot pair, e.g. ../data/btc_1m_log_returns.csv"""
+    base = get_binance_symbol(asset).removesuffix("USDT").lower()
+    return f"../data/{base}_1m_log_returns.csv"
+
+
+class MultiMarketRuntime:
+    """Quotes the hourly Up or Down market of several assets from one process.
+
+    Every asset gets its own MarketMakerBot task with its own event, book stream,
+    inventory and pricing worker. The bots share the CLOB client, one HTTP connection
+    pool, the process-wide rate limiters and one Binance price feed per symbol.
+    A market that crashes is restarted without touching the others.
+    """
+
+    def __init__(self, config, assets=tuple(Asset)):
+        self.config = config
+        self.client = get_client()
+        self.bots = {}
+        for asset in assets:
+            symbol = get_binance_symbol(asset)
+            self.bots[asset] = MarketMakerBot(
+                config=config,
+                asset=asset,
+                get_latest_price=functools.partial(get_latest_bitcoin_price, symbol),
+                get_open_price=functools.partial(get_bitcoin_1h_open_price, symbol=symbol),
+                get_current_event=get_current_event,
+                get_close_timestamp=get_next_hour_timestamp,
+                client=self.client,
+                price_feed=get_price_feed(symbol),
+                returns_filename=get_returns_filename(asset),
+            )
+
+    def run(self):
+        try:
+            asyncio.run(self.run_async())
+        except asyncio.CancelledError:
+            # SIGTERM, after the cleanup
+            print("Stopped")
+
+    async def run_async(self):
+        if not update_allowances(self.client):
+            print("Failed to update allowances. Exiting.")
+            exit(1)
+
+        self.install_signal_handler()
+        # kill <pid> shuts down like Ctrl-C, every bot's close_market() flushes its journal
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+
+        # Every asset's candle file is backfilled before its bot reads it, then kept up to date
+        await asyncio.gather(*(asyncio.to_thread(bot.candle_manager.update) for bot in self.bots.values()))
+        for bot in self.bots.values():
+            bot.candle_manager.start()
+
+        async with create_http_client() as http_client:
+            await warm_up(http_client)
+            await asyncio.gather(*(self.run_market(bot, http_client) for bot in self.bots.values()))
+
+    async def run_market(self, bot, http_client):
+        while True:
+            try:
+                await bot.run_market(http_client)
+            except asyncio.CancelledError:
+                await bot.close_market()
+                raise
+            except Exception as e:
+                print(f"{bot.asset.value} market crashed, restarting in {RESTART_DELAY_SECS}s: {e}")
+            await bot.close_market()
+            await asyncio.sleep(RESTART_DELAY_SECS)
+
+    def install_signal_handler(self, signum=getattr(signal, 'SIGUSR1', None)):
+        """kill -USR1 <pid> prints the latency table of every market, each at the end of its next tick."""
+        if signum is None:
+            return
+
+        def request_tables(*_):
+            for bot in self.bots.values():
+                bot.latency.request_table()
+
+        signal.signal(signum, request_tables)
+
+
+if __name__ == "__main__":
+    MultiMarketRuntime(BOT_CONFIG).run()
@@ -0,0 +1,131 @@
+import argparse
+import itertools
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from crypto.main import FILENAME, make_config
+from crypto.recording import load_recording, save_recording
+from crypto.replay import replay
+
+PARAM_GRID = {
+    "RISK_THRESHOLD": [0.0025, 0.005, 0.01, 0.02],
+    "MAX_POSITION_PERCENT": [0.25, 0.5, 1.0],
+    "MAX_PAYOUT_PERCENT": [1.0, 2.0, 4.0],
+    # Only matters with --reprice, otherwise the recorded p_fair is used
+    "NUM_SIMULATIONS": [1_000_000],
+}
+
+# (low, high) is sampled uniformly, a list is sampled from
+PARAM_SPACE = {
+    "RISK_THRESHOLD": (0.001, 0.03),
+    "MAX_POSITION_PERCENT": (0.1, 1.0),
+    "MAX_PAYOUT_PERCENT": (0.5, 5.0),
+    "NUM_SIMULATIONS": [100_000, 1_000_000],
+}
+
+
+def grid_search(param_grid=PARAM_GRID):
+    names = list(param_grid)
+    return [dict(zip(names, values)) for values in itertools.product(*param_grid.values())]
+
+
+def random_search(num_samples, param_space=PARAM_SPACE, seed=0):
+    rng = random.Random(seed)
+    samples = []
+    for _ in range(num_samples):
+        params = {}
+        for name, space in param_space.items():
+            params[name] = rng.choice(space) if isinstance(space, list) else rng.uniform(*space)
+        samples.append(params)
+    return samples
+
+
+def find_recordings(root):
+    """Every directory below root that holds a recording."""
+    return sorted(dirpath for dirpath, _, filenames in os.walk(root) if "meta.json" in filenames)
+
+
+# Per worker process: recordings are memory-mapped once, the OS shares the pages between workers
+_recordings = {}
+_returns = None
+
+
+def _init_worker(returns_filename):
+    global _returns
+    if returns_filename is not None:
+        _returns = pd.read_csv(returns_filename)["log_return"].dropna().to_numpy()
+
+
+def _get_recording(directory):
+    if directory not in _recordings:
+        _recordings[directory] = load_recording(directory, mmap_mode='r')
+    return _recordings[directory]
+
+
+def run_params(params, recording_dirs, reprice=False):
+    """One row of the results table: params replayed over every recording."""
+    start = time.perf_counter()
+    config = make_config(**params)
+    results = [replay(_get_recording(d), config, returns=_returns if reprice else None, reprice=reprice)
+               for d in recording_dirs]
+    final_pnls = np.array([r.final_pnl for r in results])
+    return {
+        **params,
+        'mean_pnl': final_pnls.mean(),
+        'std_pnl': final_pnls.std(),
+        'min_pnl': final_pnls.min(),
+        # Worst mark to market dip within an event
+        'max_drawdown': max(float(np.max(np.maximum.accumulate(r.pnl) - r.pnl, initial=0.)) for r in results),
+        'num_fills': sum(len(r.fills) for r in results),
+        'max_yes_shares': max(float(r.yes_shares.max(initial=0.)) for r in results),
+        'max_no_shares': max(float(r.no_shares.max(initial=0.)) for r in results),
+        'num_recordings': len(results),
+        'elapsed_secs': time.perf_counter() - start,
+    }
+
+
+def sweep(param_sets, recording_dirs, max_workers=None, reprice=False, returns_filename=FILENAME):
+    """Replays every parameter set over all recordings across a process pool.
+
+    Workers only get recording paths and map the .npy files themselves, so nothing is
+    pickled per task except the parameters and one result row. Returns one DataFrame
+    row per parameter set, best mean PnL first.
+    """
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(returns_filename if reprice else None,)) as executor:
+        rows = list(executor.map(run_params, param_sets, itertools.repeat(recording_dirs), itertools.repeat(reprice)))
+    table = pd.DataFrame(rows).sort_values('mean_pnl', ascending=False, ignore_index=True)
+    print(f"{len(param_sets)} parameter sets x {len(recording_dirs)} recordings in {time.perf_counter() - start:.1f}s")
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parameter sweep over recorded events")
+    parser.add_argument("recordings", nargs="?", help="Directory with recordings, synthetic ones if omitted")
+    parser.add_argument("--random", type=int, help="Number of random samples instead of the grid")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--reprice", action="store_true", help="Price with the Monte Carlo instead of the recorded p_fair")
+    parser.add_argument("--out", default="sweep_results.csv")
+    args = parser.parse_args()
+
+    if args.recordings:
+        recording_dirs = find_recordings(args.recordings)
+    else:
+        from crypto.tests.simulate_event import get_mock_recording
+
+        root = tempfile.mkdtemp(prefix="recordings_")
+        for seed in range(8):
+            save_recording(os.path.join(root, str(seed)), get_mock_recording(seed=seed))
+        recording_dirs = find_recordings(root)
+
+    param_sets = random_search(args.random) if args.random else grid_search()
+    table = sweep(param_sets, recording_dirs, max_workers=args.workers, reprice=args.reprice)
+    table.to_csv(args.out, index=False)
+    print(table.head(10).to_string())
@@ -0,0 +1,49 @@
+from crypto.fill_sim import QueueFillSimulator
+from crypto.order_book import OrderBook
+
+# A crossing order takes the shown depth on placement and rests the rest. Recorded
+# snapshots don't include our own trade, so the next ones still show that depth:
+# it must not fill the resting remainder a second time.
+
+
+def make_book(bids=(), asks=()):
+    return OrderBook.from_dict({
+        'tick_size': '0.01',
+        'min_order_size': '5',
+        'bids': [{'price': p, 'size': s} for p, s in bids],
+        'asks': [{'price': p, 'size': s} for p, s in asks],
+    })
+
+
+if __name__ == "__main__":
+    sim = QueueFillSimulator()
+    book = make_book(bids=[('0.40', '100')], asks=[('0.45', '10')])
+    order = {'type': 'YES', 'side': 'BUY', 'price': 0.45, 'size': 30.}
+    filled, price = sim.place(order, book)
+    assert (filled, price) == (10., 0.45), (filled, price)
+
+    # The same book again: the 10 shown are the 10 we took
+    for _ in range(2):
+        fills = sim.update(book)
+        assert fills == {}, fills
+
+    # 5 more arrive at our limit: only those fill
+    fills = sim.update(make_book(bids=[('0.40', '100')], asks=[('0.45', '15')]))
+    assert fills == {order['sim_id']: 5.}, fills
+
+    # The level clears, then 50 new arrive through our limit: the other 15 fill
+    assert sim.update(make_book(bids=[('0.40', '100')], asks=[('0.50', '10')])) == {}
+    fills = sim.update(make_book(bids=[('0.40', '100')], asks=[('0.44', '50')]))
+    assert fills == {order['sim_id']: 15.}, fills
+    assert len(sim) == 0
+
+    # A NO buy at 0.45 is a YES sell at 0.55, it crosses the YES bid in the mirrored book the same way
+    sim = QueueFillSimulator()
+    book = make_book(bids=[('0.55', '8')], asks=[('0.60', '100')])
+    order = {'type': 'NO', 'side': 'BUY', 'price': 0.45, 'size': 20.}
+    filled, price = sim.place(order, book)
+    assert (filled, price) == (8., 0.45), (filled, price)
+    assert sim.update(book) == {}
+    fills = sim.update(make_book(bids=[('0.56', '3'), ('0.55', '8')], asks=[('0.60', '100')]))
+    assert fills == {order['sim_id']: 3.}, fills
+    print("Crossing orders fill only depth they haven't taken yet")
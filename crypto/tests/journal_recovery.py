@@ -0,0 +1,48 @@
+import tempfile
+
+from crypto.journal import KIND_PLANNED, TickJournal, load_journal
+
+# Writes a session, leaves a partial record at the end of both files like a crash
+# mid-write would, writes a second session into the same day files and loads them.
+
+
+class MockBook:
+    best_bid_price = 0.44
+    best_ask_price = 0.46
+    best_bid_size = 100.
+    best_ask_size = 50.
+
+
+def write_session(directory, btc_prices):
+    journal = TickJournal(directory)
+    journal.start()
+    for btc_price in btc_prices:
+        journal.begin_tick()
+        journal.record_order(KIND_PLANNED, {'type': 'YES', 'side': 'BUY', 'price': 0.44, 'size': 10.}, 0.44, 0.46, 0.5)
+        journal.record_tick(btc_price=btc_price, open_price=100_000., p_fair=0.5, p_fair_age=0.1,
+                            order_book=MockBook(), yes_shares=0., no_shares=0., cash=10., num_orders=1,
+                            num_fills=0, latencies={})
+    journal.close()
+    return journal
+
+
+def corrupt_tail(directory, num_bytes=7):
+    for path in [*directory.glob("*.ticks"), *directory.glob("*.orders")]:
+        with open(path, 'ab') as f:
+            f.write(b'\xff' * num_bytes)
+
+
+if __name__ == "__main__":
+    from pathlib import Path
+
+    directory = Path(tempfile.mkdtemp())
+    write_session(directory, [100_000., 100_001.])
+    corrupt_tail(directory)
+    write_session(directory, [100_002., 100_003.])
+
+    ticks, orders = load_journal(directory)
+    assert list(ticks['btc_price']) == [100_000., 100_001., 100_002., 100_003.], ticks['btc_price']
+    assert list(orders['price'].round(2)) == [0.44] * 4, orders['price']
+    # The second session continues the day's seq, so orders still join to one tick
+    assert list(ticks['seq']) == [1, 2, 3, 4] and list(orders['seq']) == [1, 2, 3, 4], (ticks['seq'], orders['seq'])
+    print(f"Loaded {len(ticks)} ticks and {len(orders)} orders intact after a torn write")
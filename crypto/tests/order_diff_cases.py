@@ -0,0 +1,133 @@
+import copy
+
+from crypto.order_diff import diff_orders
+
+# Each case: (name, desired, live, tick_size, min_order_size, expected). Live orders carry an
+# 'id' so the expected keeps/cancels/resizes can name them, places are (type, side, price, size).
+# Output follows the sorted (type, side, tick) keys, so NO comes before YES.
+
+
+def plan(type_, side, price, size):
+    return {'type': type_, 'side': side, 'price': price, 'size': size}
+
+
+def pending(id_, type_, side, price, size):
+    return {'id': id_, **plan(type_, side, price, size)}
+
+
+def clob(id_, outcome, side, price, original_size, size_matched='0'):
+    """Open order as the CLOB returns it: strings, outcome instead of type."""
+    return {'id': id_, 'outcome': outcome, 'side': side, 'price': price,
+            'original_size': original_size, 'size_matched': size_matched}
+
+
+def expect(keeps=(), cancels=(), places=(), resizes=()):
+    return {'keeps': list(keeps), 'cancels': list(cancels), 'places': list(places), 'resizes': list(resizes)}
+
+
+CASES = [
+    # Keep / cancel / place
+    ("unchanged plan keeps everything",
+     [plan('YES', 'BUY', 0.45, 10.), plan('NO', 'BUY', 0.50, 10.)],
+     [pending(1, 'YES', 'BUY', 0.45, 10.), pending(2, 'NO', 'BUY', 0.50, 10.)], 0.01, 5.,
+     expect(keeps=[2, 1])),
+    ("moved price cancels the old level and places the new one",
+     [plan('YES', 'BUY', 0.46, 10.)],
+     [pending(1, 'YES', 'BUY', 0.45, 10.)], 0.01, 5.,
+     expect(cancels=[1], places=[('YES', 'BUY', 0.46, 10.)])),
+    ("same price on the other outcome or side is a different key",
+     [plan('NO', 'BUY', 0.45, 10.), plan('YES', 'SELL', 0.45, 10.)],
+     [pending(1, 'YES', 'BUY', 0.45, 10.)], 0.01, 5.,
+     expect(cancels=[1], places=[('NO', 'BUY', 0.45, 10.), ('YES', 'SELL', 0.45, 10.)])),
+    ("empty plan cancels all",
+     [], [pending(1, 'YES', 'BUY', 0.45, 10.), pending(2, 'NO', 'BUY', 0.50, 10.)], 0.01, 5.,
+     expect(cancels=[2, 1])),
+    ("nothing live places the plan",
+     [plan('YES', 'BUY', 0.45, 10.)], [], 0.01, 5.,
+     expect(places=[('YES', 'BUY', 0.45, 10.)])),
+    ("larger size keeps the live order and tops up",
+     [plan('YES', 'BUY', 0.45, 20.)], [pending(1, 'YES', 'BUY', 0.45, 10.)], 0.01, 5.,
+     expect(keeps=[1], places=[('YES', 'BUY', 0.45, 10.)])),
+    ("smaller size is a resize",
+     [plan('YES', 'BUY', 0.45, 6.)], [pending(1, 'YES', 'BUY', 0.45, 10.)], 0.01, 5.,
+     expect(resizes=[(1, 6.)])),
+
+    # Tick rounding
+    ("float noise in the plan price rounds to the live tick",
+     [plan('YES', 'BUY', 0.1 + 0.2, 10.)], [clob(1, 'Up', 'BUY', '0.3', '10')], 0.01, 5.,
+     expect(keeps=[1])),
+    ("sub-tick difference rounds to the same tick",
+     [plan('YES', 'BUY', 0.4549, 10.)], [pending(1, 'YES', 'BUY', 0.45, 10.)], 0.01, 5.,
+     expect(keeps=[1])),
+    ("a finer tick size tells the same prices apart",
+     [plan('YES', 'BUY', 0.451, 10.)], [pending(1, 'YES', 'BUY', 0.45, 10.)], 0.001, 5.,
+     expect(cancels=[1], places=[('YES', 'BUY', 0.451, 10.)])),
+    ("CLOB orders: outcome Down is NO, the remaining size is what counts",
+     [plan('NO', 'BUY', 0.52, 6.)], [clob(1, 'Down', 'buy', '0.52', '10', '4')], 0.01, 5.,
+     expect(keeps=[1])),
+
+    # Sizes below min_order_size
+    ("missing size below the minimum isn't placed",
+     [plan('YES', 'BUY', 0.45, 12.)], [pending(1, 'YES', 'BUY', 0.45, 10.)], 0.01, 5.,
+     expect(keeps=[1])),
+    ("a plan order below the minimum isn't placed",
+     [plan('YES', 'BUY', 0.45, 3.)], [], 0.01, 5.,
+     expect()),
+    ("shrinking below the minimum cancels instead of resizing",
+     [plan('YES', 'BUY', 0.45, 3.)], [pending(1, 'YES', 'BUY', 0.45, 10.)], 0.01, 5.,
+     expect(cancels=[1])),
+    ("exactly the minimum is placed",
+     [plan('YES', 'BUY', 0.45, 15.)], [pending(1, 'YES', 'BUY', 0.45, 10.)], 0.01, 5.,
+     expect(keeps=[1], places=[('YES', 'BUY', 0.45, 5.)])),
+    ("without a minimum, a top-up below a cent is still dropped",
+     [plan('YES', 'BUY', 0.45, 10.004)], [pending(1, 'YES', 'BUY', 0.45, 10.)], 0.01, 0.,
+     expect(keeps=[1])),
+
+    # Duplicate keys
+    ("duplicate plan orders merge into one size",
+     [plan('YES', 'BUY', 0.45, 5.), plan('YES', 'BUY', 0.4500001, 5.)],
+     [pending(1, 'YES', 'BUY', 0.45, 10.)], 0.01, 5.,
+     expect(keeps=[1])),
+    ("duplicate plan orders merge before placing",
+     [plan('YES', 'BUY', 0.45, 3.), plan('YES', 'BUY', 0.45, 3.)], [], 0.01, 5.,
+     expect(places=[('YES', 'BUY', 0.45, 6.)])),
+    ("duplicate live orders: the oldest that fit are kept",
+     [plan('YES', 'BUY', 0.45, 10.)],
+     [pending(1, 'YES', 'BUY', 0.45, 6.), pending(2, 'YES', 'BUY', 0.45, 4.), pending(3, 'YES', 'BUY', 0.45, 4.)],
+     0.01, 5.,
+     expect(keeps=[1, 2], cancels=[3])),
+    ("duplicate live orders: an oversized one is skipped, later ones still fit",
+     [plan('YES', 'BUY', 0.45, 10.)],
+     [pending(1, 'YES', 'BUY', 0.45, 6.), pending(2, 'YES', 'BUY', 0.45, 6.), pending(3, 'YES', 'BUY', 0.45, 4.)],
+     0.01, 5.,
+     expect(keeps=[1, 3], cancels=[2])),
+    ("duplicate live orders: the first surplus one becomes the resize",
+     [plan('YES', 'BUY', 0.45, 10.)],
+     [pending(1, 'YES', 'BUY', 0.45, 4.), pending(2, 'YES', 'BUY', 0.45, 8.), pending(3, 'YES', 'BUY', 0.45, 8.)],
+     0.01, 5.,
+     expect(keeps=[1], cancels=[3], resizes=[(2, 6.)])),
+]
+
+
+def summarize(diff):
+    return {
+        'keeps': [o['id'] for o in diff.keeps],
+        'cancels': [o['id'] for o in diff.cancels],
+        'places': [(o['type'], o['side'], o['price'], o['size']) for o in diff.places],
+        'resizes': [(r['cancel']['id'], r['place']['size']) for r in diff.resizes],
+    }
+
+
+if __name__ == "__main__":
+    failed = 0
+    for name, desired, live, tick_size, min_order_size, expected in CASES:
+        inputs = copy.deepcopy((desired, live))
+        diff = diff_orders(desired, live, tick_size, min_order_size)
+        got = summarize(diff)
+        assert (desired, live) == inputs, f"{name}: inputs were modified"
+        assert diff.num_api_calls() == len(diff.orders_to_cancel()) + len(diff.orders_to_place())
+        if got != expected:
+            failed += 1
+            print(f"FAIL {name}\n  expected {expected}\n  got      {got}")
+    assert failed == 0, f"{failed} of {len(CASES)} cases failed"
+    print(f"{len(CASES)} diff_orders cases passed")
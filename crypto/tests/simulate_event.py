@@ -60,4 +60,42 @@ def get_mock_data():
                         '50689309898390903360128126567155699523191723774254966996491572158209728523976'), [], []]
 
 def get_mock_p_fair():
-    return 0.567918
\ No newline at end of file
+    return 0.567918
+
+def get_mock_recording(num_ticks=3600, open_price=110000., volatility=0.0004, seed=0):
+    """A synthetic hour of one-second ticks: BTC random walk, p_fair from a normal approximation
+    and a book of 150 share levels around a noisy p_fair, one tick wide."""
+    import math
+
+    import numpy as np
+
+    from crypto.recording import Recording
+
+    rng = np.random.default_rng(seed)
+    close_timestamp = 1761332400.
+    timestamps = close_timestamp - 3600 + np.arange(num_ticks, dtype=float)
+    # volatility is per minute
+    btc_prices = open_price * np.exp(np.cumsum(rng.normal(0., volatility / math.sqrt(60), num_ticks)))
+
+    minutes_left = np.maximum((close_timestamp - timestamps) / 60, 1 / 60)
+    z = np.log(btc_prices / open_price) / (volatility * np.sqrt(minutes_left))
+    p_fair = 0.5 * (1 + np.vectorize(math.erf)(z / math.sqrt(2)))
+
+    tick_size = 0.01
+    n_ticks = int(round(1 / tick_size))
+    mid_ticks = np.clip(np.round((p_fair + rng.normal(0., 0.01, num_ticks)) / tick_size), 2, n_ticks - 2).astype(int)
+    levels = np.arange(n_ticks + 1)
+    bid_sizes = np.where((levels < mid_ticks[:, None]) & (levels > 0), 150., 0.)
+    ask_sizes = np.where((levels > mid_ticks[:, None]) & (levels < n_ticks), 150., 0.)
+
+    return Recording(
+        timestamps=timestamps,
+        btc_prices=btc_prices,
+        bid_sizes=bid_sizes,
+        ask_sizes=ask_sizes,
+        open_price=open_price,
+        close_timestamp=close_timestamp,
+        tick_size=tick_size,
+        min_order_size=5.,
+        p_fair=p_fair,
+    )
@@ -11,6 +11,17 @@ class Asset(Enum):
     Solana = "solana"
     XRP = "xrp"
 
+# Spot pair on Binance that each hourly Up or Down market resolves against
+ASSET_SYMBOLS = {
+    Asset.Bitcoin: "BTCUSDT",
+    Asset.Ethereum: "ETHUSDT",
+    Asset.Solana: "SOLUSDT",
+    Asset.XRP: "XRPUSDT",
+}
+
+def get_binance_symbol(asset: Asset):
+    return ASSET_SYMBOLS[asset]
+
 def get_next_hour_timestamp():
     now = datetime.now()
     next_hour = (now.replace(minute=0, second=0, microsecond=0)